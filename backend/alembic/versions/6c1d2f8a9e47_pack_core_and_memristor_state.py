@@ -0,0 +1,119 @@
+"""Pack core and memristor state into core_states
+
+Revision ID: 6c1d2f8a9e47
+Revises: bd3ff2ee5e49
+Create Date: 2026-10-17 12:00:00.000000
+
+"""
+import json
+import zlib
+from itertools import groupby
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '6c1d2f8a9e47'
+down_revision: Union[str, Sequence[str], None] = 'bd3ff2ee5e49'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Копия MEMRISTOR_STATUSES на момент миграции
+STATUSES = ("active", "stuck_at_0", "stuck_at_1", "random_flip", "disabled")
+
+core_states = sa.table(
+    'core_states',
+    sa.column('device_id', sa.String),
+    sa.column('core_id', sa.Integer),
+    sa.column('status', sa.String),
+    sa.column('memristor_count', sa.Integer),
+    sa.column('status_runs', sa.JSON),
+    sa.column('status_codes', sa.LargeBinary),
+    sa.column('conductance', sa.LargeBinary),
+)
+
+
+def _load(value):
+    if isinstance(value, str):
+        return json.loads(value)
+    return value or []
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('devices', sa.Column('core_count', sa.Integer(), nullable=True))
+    op.add_column('devices', sa.Column('memristors_per_core', sa.Integer(), nullable=True))
+    op.create_table(
+        'core_states',
+        sa.Column('device_id', sa.String(), nullable=False),
+        sa.Column('core_id', sa.Integer(), nullable=False),
+        sa.Column('status', sa.String(), nullable=True),
+        sa.Column('memristor_count', sa.Integer(), nullable=False),
+        sa.Column('status_runs', sa.JSON(), nullable=False),
+        sa.Column('status_codes', sa.LargeBinary(), nullable=True),
+        sa.Column('conductance', sa.LargeBinary(), nullable=True),
+        sa.ForeignKeyConstraint(['device_id'], ['devices.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('device_id', 'core_id')
+    )
+
+    # Перенос списков словарей в упакованные массивы по ядрам
+    bind = op.get_bind()
+    devices = bind.execute(sa.text("SELECT id, cores, memristors FROM devices")).fetchall()
+    for device_id, cores, memristors in devices:
+        cores, memristors = _load(cores), _load(memristors)
+        per_core = len(memristors) // len(cores) if cores else 0
+        rows = []
+        for i, core in enumerate(cores):
+            codes = bytes(
+                STATUSES.index(item.get("status")) if item.get("status") in STATUSES else 0
+                for item in memristors[i * per_core:(i + 1) * per_core]
+            )
+            runs = [[code, len(list(group))] for code, group in groupby(codes)]
+            rows.append({
+                "device_id": device_id,
+                "core_id": core.get("id", i),
+                "status": core.get("status", "healthy"),
+                "memristor_count": per_core,
+                "status_runs": runs,
+                "status_codes": None if len(runs) <= 1 and (not runs or runs[0][0] == 0) else zlib.compress(codes),
+                "conductance": None
+            })
+        if rows:
+            op.bulk_insert(core_states, rows)
+        bind.execute(
+            sa.text("UPDATE devices SET core_count = :cores, memristors_per_core = :per_core WHERE id = :id"),
+            {"cores": len(cores), "per_core": per_core, "id": device_id}
+        )
+
+    with op.batch_alter_table('devices') as batch_op:
+        batch_op.drop_column('memristors')
+        batch_op.drop_column('cores')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table('devices') as batch_op:
+        batch_op.add_column(sa.Column('cores', sa.JSON(), nullable=True))
+        batch_op.add_column(sa.Column('memristors', sa.JSON(), nullable=True))
+
+    bind = op.get_bind()
+    states = bind.execute(sa.text(
+        "SELECT device_id, core_id, status, status_runs FROM core_states ORDER BY device_id, core_id"
+    )).fetchall()
+    for device_id, rows in groupby(states, key=lambda row: row[0]):
+        cores, memristors = [], []
+        for _, core_id, status, runs in rows:
+            cores.append({"id": core_id, "status": status})
+            for code, length in _load(runs):
+                memristors.extend({"id": len(memristors) + i, "status": STATUSES[code]} for i in range(length))
+        bind.execute(
+            sa.text("UPDATE devices SET cores = :cores, memristors = :memristors WHERE id = :id"),
+            {"cores": json.dumps(cores), "memristors": json.dumps(memristors), "id": device_id}
+        )
+
+    op.drop_table('core_states')
+    with op.batch_alter_table('devices') as batch_op:
+        batch_op.drop_column('memristors_per_core')
+        batch_op.drop_column('core_count')
@@ -0,0 +1,32 @@
+"""Index device list filter and sort columns
+
+Revision ID: a41e7c3b5d02
+Revises: 6c1d2f8a9e47
+Create Date: 2026-10-17 13:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a41e7c3b5d02'
+down_revision: Union[str, Sequence[str], None] = '6c1d2f8a9e47'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index(op.f('ix_devices_status'), 'devices', ['status'], unique=False)
+    op.create_index(op.f('ix_devices_is_mock'), 'devices', ['is_mock'], unique=False)
+    op.create_index(op.f('ix_devices_created_at'), 'devices', ['created_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_devices_created_at'), table_name='devices')
+    op.drop_index(op.f('ix_devices_is_mock'), table_name='devices')
+    op.drop_index(op.f('ix_devices_status'), table_name='devices')
@@ -0,0 +1,52 @@
+"""Add diagnostics jobs table
+
+Revision ID: d93b0e5f7a16
+Revises: a41e7c3b5d02
+Create Date: 2026-10-17 14:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd93b0e5f7a16'
+down_revision: Union[str, Sequence[str], None] = 'a41e7c3b5d02'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+ACTIVE = sa.text("status IN ('queued', 'running')")
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'diagnostics_jobs',
+        sa.Column('id', sa.String(), nullable=False),
+        sa.Column('device_id', sa.String(), nullable=False),
+        sa.Column('status', sa.String(), nullable=True),
+        sa.Column('params', sa.JSON(), nullable=True),
+        sa.Column('cores_total', sa.Integer(), nullable=True),
+        sa.Column('cores_done', sa.Integer(), nullable=True),
+        sa.Column('progress', sa.Float(), nullable=True),
+        sa.Column('error', sa.String(), nullable=True),
+        sa.Column('result', sa.JSON(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), server_default=sa.text('(CURRENT_TIMESTAMP)'), nullable=True),
+        sa.Column('started_at', sa.DateTime(), nullable=True),
+        sa.Column('finished_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_diagnostics_jobs_device_id'), 'diagnostics_jobs', ['device_id'], unique=False)
+    op.create_index(op.f('ix_diagnostics_jobs_status'), 'diagnostics_jobs', ['status'], unique=False)
+    op.create_index('uq_diagnostics_jobs_active_device', 'diagnostics_jobs', ['device_id'], unique=True,
+                    sqlite_where=ACTIVE, postgresql_where=ACTIVE)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('uq_diagnostics_jobs_active_device', table_name='diagnostics_jobs')
+    op.drop_index(op.f('ix_diagnostics_jobs_status'), table_name='diagnostics_jobs')
+    op.drop_index(op.f('ix_diagnostics_jobs_device_id'), table_name='diagnostics_jobs')
+    op.drop_table('diagnostics_jobs')
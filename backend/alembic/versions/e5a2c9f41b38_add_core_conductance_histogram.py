@@ -0,0 +1,58 @@
+"""Add conductance histogram to core_states
+
+Revision ID: e5a2c9f41b38
+Revises: d93b0e5f7a16
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+import zlib
+from typing import Sequence, Union
+
+from alembic import op
+import numpy as np
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e5a2c9f41b38'
+down_revision: Union[str, Sequence[str], None] = 'd93b0e5f7a16'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Копия CONDUCTANCE_HISTOGRAM_BINS на момент миграции
+HISTOGRAM_BINS = 16
+
+core_states = sa.table(
+    'core_states',
+    sa.column('device_id', sa.String),
+    sa.column('core_id', sa.Integer),
+    sa.column('conductance', sa.LargeBinary),
+    sa.column('conductance_histogram', sa.JSON),
+)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('core_states', sa.Column('conductance_histogram', sa.JSON(), nullable=True))
+
+    # Гистограммы уже записанных проводимостей
+    bind = op.get_bind()
+    rows = bind.execute(sa.select(core_states.c.device_id, core_states.c.core_id, core_states.c.conductance)
+                        .where(core_states.c.conductance.isnot(None)))
+    for device_id, core_id, packed in rows.fetchall():
+        values = np.frombuffer(zlib.decompress(packed), dtype=np.float16).astype(np.float32)
+        values = values[np.isfinite(values)]
+        if not values.size:
+            continue
+        counts, bin_edges = np.histogram(values, bins=HISTOGRAM_BINS)
+        bind.execute(
+            core_states.update()
+            .where(core_states.c.device_id == device_id, core_states.c.core_id == core_id)
+            .values(conductance_histogram={"counts": counts.tolist(), "bin_edges": bin_edges.tolist()})
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table('core_states') as batch_op:
+        batch_op.drop_column('conductance_histogram')
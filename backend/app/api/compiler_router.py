@@ -1,74 +1,205 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
-from sqlalchemy.orm import Session
-import onnx
-from onnxruntime.quantization import quantize_dynamic, QuantType
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Query
+from fastapi.responses import FileResponse
+from sqlalchemy.orm import Session, undefer_group
+import asyncio
 import uuid
 import os
+import shutil
+from typing import List, Optional
+from app.models.device_models import CoreState, Device
 from app.models.workflow_models import DeviceWorkflowStatus, WorkflowStep
 from app.database import get_db
 from app.auth.dependencies import get_current_user  # ИЗМЕНЕНО
+from app.services.uploads import spool_upload, spool_external_data
+from app.services.quantization_jobs import quantization_jobs, QueueFull
+from app.services.calibration import CALIBRATION_METHODS, dataset_id
+from app.services.model_store import bundle_id, get_model_path
+from app.services.compiler_pipeline import CompileError, CompileTarget, compile_model
+from app.services.layer_cache import layer_cache
+from app.services.artifact_store import PROJECT_TMP_DIR, artifact_store
 
 router = APIRouter(tags=["compiler"])
 
-# Создаем путь к tmp внутри проекта (на уровне app/)
-PROJECT_TMP_DIR = os.path.join(os.path.dirname(__file__), '..', '..', 'tmp')
-os.makedirs(PROJECT_TMP_DIR, exist_ok=True)  # Создаем если не существует
-
-@router.post("/quantize")
+@router.post("/quantize", status_code=202)
 async def quantize_model(
     file: UploadFile = File(...),
     quant_type: str = Form("int8"),  # Form с дефолтным значением
+    external_data: List[UploadFile] = File([]),
+    mode: str = Form("dynamic"),  # dynamic | static (QDQ с калибровкой)
+    calibration_method: str = Form("minmax"),
+    calibration_data: List[UploadFile] = File([]),
+    calibration_batch_size: int = Form(16),
     current_user = Depends(get_current_user)
 ):
-    content = await file.read()
-    model = onnx.load_from_string(content)
+    """Submit a quantization job; poll /quantize/jobs/{job_id} for its status.
 
-    # Валидация
-    try:
-        onnx.checker.check_model(model)
-    except Exception as e:
-        raise HTTPException(400, f"Invalid ONNX model: {str(e)}")
+    mode=static needs calibration_data: .npz files with one [N, ...] array per
+    model input (or .npy files for single-input models).
+    """
+    if mode not in ("dynamic", "static"):
+        raise HTTPException(400, "mode must be 'dynamic' or 'static'")
+    if mode == "static":
+        if not calibration_data:
+            raise HTTPException(400, "Static quantization needs calibration_data")
+        if calibration_method not in CALIBRATION_METHODS:
+            raise HTTPException(400, f"calibration_method must be one of {', '.join(CALIBRATION_METHODS)}")
+        if calibration_batch_size < 1:
+            raise HTTPException(400, "calibration_batch_size must be positive")
+        for item in calibration_data:
+            if not (item.filename or "").endswith((".npz", ".npy")):
+                raise HTTPException(400, f"Unsupported calibration file: {item.filename}")
 
-    # Сохранение оригинала в tmp проекта
-    original_path = os.path.join(PROJECT_TMP_DIR, f"original_{uuid.uuid4().hex}.onnx")
-    with open(original_path, "wb") as f:
-        f.write(content)
+    # Модель и её external data кладём в отдельный каталог: onnx ищет веса рядом с моделью
+    work_dir = os.path.join(PROJECT_TMP_DIR, f"quantize_{uuid.uuid4().hex}")
+    os.makedirs(work_dir)
+    try:
+        # Оригинал пишется в tmp проекта кусками, без чтения целиком в память
+        upload = await spool_upload(file, suffix=".onnx", directory=work_dir)
+        external = await spool_external_data(external_data or [], directory=work_dir, spent=upload.size)
+        for filename, item in external:
+            os.replace(item.path, os.path.join(work_dir, filename))
+        spent = upload.size + sum(item.size for _, item in external)
+        dataset = []
+        if mode == "static":
+            for item in calibration_data:
+                suffix = os.path.splitext(item.filename)[1]
+                dataset.append(await spool_upload(item, suffix=suffix, directory=work_dir, spent=spent))
+                spent += dataset[-1].size
+    except BaseException:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        raise
 
-    # Квантизация
-    quantized_path = os.path.join(PROJECT_TMP_DIR, f"quantized_{uuid.uuid4().hex}.onnx")
+    # Проверка и квантизация выполняются в пуле процессов, event loop не блокируется
+    model_id = bundle_id(upload.sha256, [(name, item.sha256) for name, item in external])
+    calibration = None
+    if dataset:
+        # Путь кэша калибровки зависит от onnxruntime и вычисляется в процессе воркера
+        calibration = {
+            "dataset_paths": [item.path for item in dataset],
+            "dataset_id": dataset_id([item.sha256 for item in dataset]),
+            "model_id": model_id,
+            "method": calibration_method,
+            "batch_size": calibration_batch_size
+        }
     try:
-        quantize_dynamic(
-            original_path,
-            quantized_path,
-            weight_type=QuantType.QInt8 if quant_type == "int8" else QuantType.QUInt8
+        # Одинаковый запрос не квантизуется повторно: берётся готовый результат или уже идущий job
+        job, source = quantization_jobs.submit(
+            work_dir=work_dir,
+            original_path=upload.path,
+            original_size=upload.size + sum(item.size for _, item in external),
+            model_id=model_id,
+            quant_type=quant_type,
+            use_external_data_format=bool(external),
+            calibration=calibration
         )
+    except QueueFull as e:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        raise HTTPException(429, str(e))
 
-        return {
-            "original_path": original_path,
-            "quantized_path": quantized_path,
-            "size_reduction": f"{os.path.getsize(quantized_path) / os.path.getsize(original_path) * 100:.1f}%"
-        }
-    finally:
-        # Очистка: удаляем оригинальный файл после квантизации
-        if os.path.exists(original_path):
-            os.remove(original_path)
-        # Очистка: удаляем квантизованный файлы после квантизации
-        #if os.path.exists(quantized_path):
-        #    os.remove(quantized_path)
+    return {"job_id": job.id, "status": job.status, "source": source}
+
+
+@router.get("/quantize/cache/stats")
+async def quantize_cache_stats(current_user=Depends(get_current_user)):
+    return quantization_jobs.stats()
+
+
+def _get_job(job_id: str):
+    job = quantization_jobs.get(job_id)
+    if not job:
+        raise HTTPException(404, "Quantization job not found")
+    return job
+
+
+@router.get("/quantize/jobs/{job_id}")
+async def get_quantize_job(job_id: str, current_user=Depends(get_current_user)):
+    return quantization_jobs.describe(_get_job(job_id))
+
+
+@router.delete("/quantize/jobs/{job_id}")
+async def cancel_quantize_job(job_id: str, current_user=Depends(get_current_user)):
+    """Cancel a queued job, or ask a running one to stop at its next stage"""
+    job = _get_job(job_id)
+    quantization_jobs.cancel(job)
+    return quantization_jobs.describe(job)
+
+
+@router.get("/quantize/jobs/{job_id}/download")
+async def download_quantized_model(
+    job_id: str,
+    part: str = Query("model", pattern="^(model|data)$"),
+    current_user=Depends(get_current_user)
+):
+    """Download the quantized model (part=data for its external data file, if any)"""
+    job = _get_job(job_id)
+    if job.status != "completed":
+        raise HTTPException(409, f"Quantization job is {job.status}")
+
+    path = job.quantized_path if part == "model" else f"{job.quantized_path}.data"
+    if not os.path.exists(path):
+        raise HTTPException(404, "Quantized file not found")
+    return FileResponse(path, media_type="application/octet-stream", filename=os.path.basename(path))
 
 @router.post("/compile")
-async def compile_firmware(device_id: str, db: Session = Depends(get_db), user=Depends(get_current_user)):
+async def compile_firmware(
+    device_id: str,
+    model_id: Optional[str] = None,
+    strict: bool = False,
+    incremental: bool = True,
+    db: Session = Depends(get_db),
+    user=Depends(get_current_user)
+):
+    """Compile a parsed model into firmware for the device's crossbars.
+
+    Runs the pass pipeline (see compiler_pipeline.DEFAULT_PASSES) and returns
+    per-pass timings and the tile placement. Operators the device does not
+    support fall back to the host, or fail with 422 when strict=true.
+    Layers unchanged since an earlier compilation for the same crossbar size
+    are reused (report.layers[].reused) unless incremental=false.
+    """
     workflow = db.query(DeviceWorkflowStatus).filter(DeviceWorkflowStatus.device_id == device_id).first()
     if not workflow or workflow.current_step != WorkflowStep.COMPILER:
         raise HTTPException(403, "Complete diagnostics first")
+    if not model_id:
+        raise HTTPException(400, "model_id is required, upload the model via /parse-onnx first")
+    model_path = get_model_path(model_id)
+    if not model_path:
+        raise HTTPException(404, "Model not found, upload it via /parse-onnx first")
+    device = db.query(Device).options(undefer_group("details")).filter(Device.id == device_id).first()
+    if not device:
+        raise HTTPException(404, "Device not found")
+    faulty = [core_id for core_id, in db.query(CoreState.core_id).filter(
+        CoreState.device_id == device_id, CoreState.status == "faulty")]
+    target = CompileTarget.from_device(device, faulty)
+    # Сессия не держится на время компиляции
+    db.close()
 
-    # Мок компиляции
-    firmware_path = os.path.join(PROJECT_TMP_DIR, f"firmware_{device_id}_{uuid.uuid4().hex}.bin")
-    with open(firmware_path, "w") as f:
-        f.write("mock_firmware_data")
+    # Прошивка публикуется в хранилище артефактов только целиком
+    firmware_path = artifact_store.new_path("firmware", prefix=f"{device_id}_", suffix=".bin")
 
+    def run():
+        with artifact_store.writer(firmware_path) as f:
+            return compile_model(model_path, target, f, strict=strict, incremental=incremental)
+
+    try:
+        report = await asyncio.to_thread(run)
+    except CompileError as e:
+        raise HTTPException(422, {"message": str(e), "report": e.report})
+
+    workflow = db.query(DeviceWorkflowStatus).filter(DeviceWorkflowStatus.device_id == device_id).first()
     workflow.compiled_firmware = firmware_path
     workflow.current_step = WorkflowStep.INFERENCE
     db.commit()
 
-    return {"status": "compiled", "firmware_path": firmware_path}
\ No newline at end of file
+    return {
+        "status": "compiled",
+        "firmware_path": firmware_path,
+        "firmware_sha256": report["firmware"].get("sha256"),
+        "size": report["firmware"].get("size"),
+        "report": report
+    }
+
+
+@router.get("/compile/cache/stats")
+async def compile_cache_stats(current_user=Depends(get_current_user)):
+    return layer_cache.stats()
@@ -1,10 +1,18 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from app.models.device_models import Device
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import String, asc, desc, literal, or_, tuple_, type_coerce
+from sqlalchemy.orm import Session, undefer, undefer_group
+from app.models.device_models import Device, CoreState
 from app.models.workflow_models import DeviceWorkflowStatus
 from app.database import get_db
 from app.auth.dependencies import get_current_user  # ИЗМЕНЕНО
+from app.services.device_state import (
+    MEMRISTOR_STATUSES, reset_core_states, load_core_states, expand_memristors, core_summary, crossbar_shape,
+    status_codes, conductance
+)
+import base64
+import json
 import uuid
+import numpy as np
 from pydantic import BaseModel
 from typing import List, Optional
 
@@ -27,23 +35,89 @@ class MockDeviceConfig(BaseModel):
     leakage_types: List[str] = ["stuck_at_0", "stuck_at_1", "random_flip"]
 
 
+# Сортировки списка устройств: имя параметра -> колонка
+DEVICE_SORT_COLUMNS = {
+    "id": Device.id,
+    "status": Device.status,
+    "created_at": Device.created_at,
+}
+DEVICE_PAGE_MAX = 1000
+MEMRISTOR_PAGE_MAX = 65536
+
+
+def _encode_cursor(sort_value, device_id: str) -> str:
+    return base64.urlsafe_b64encode(json.dumps([sort_value, device_id]).encode()).decode()
+
+
+def _decode_cursor(cursor: str):
+    try:
+        sort_value, device_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return sort_value, str(device_id)
+    except (ValueError, TypeError):
+        raise HTTPException(400, "Invalid cursor")
+
+
 @router.get("/devices")
-async def get_devices(db: Session = Depends(get_db), user=Depends(get_current_user)):
-    devices = db.query(Device).all()
-    if not devices:
+async def get_devices(
+        limit: int = Query(100, ge=1, le=DEVICE_PAGE_MAX),
+        cursor: Optional[str] = None,
+        status: Optional[str] = None,
+        is_mock: Optional[bool] = None,
+        sort: str = Query("id", pattern="^(id|status|created_at)$"),
+        order: str = Query("asc", pattern="^(asc|desc)$"),
+        db: Session = Depends(get_db),
+        user=Depends(get_current_user)
+):
+    """List devices page by page (keyset pagination: pass next_cursor back as cursor).
+
+    Only summary columns are read; full device data is in /devices/{id}/details.
+    """
+    # Значение сортировки берём в том виде, в каком оно хранится (строкой), чтобы курсор сравнивался точно
+    sort_column = type_coerce(DEVICE_SORT_COLUMNS[sort], String)
+    # Только колонки сводки, без загрузки ORM-объектов
+    query = db.query(Device.id, Device.status, Device.version, Device.is_mock, sort_column.label("sort_key"))
+    if status is not None:
+        query = query.filter(Device.status == status)
+    if is_mock is not None:
+        query = query.filter(Device.is_mock == is_mock)
+    if cursor:
+        # Курсор — (значение сортировки, id) последней строки; id разрешает равные значения.
+        # Строки с NULL в колонке сортировки идут последними при любом порядке
+        sort_value, last_id = _decode_cursor(cursor)
+        if sort_value is None:
+            same_id = Device.id > last_id if order == "asc" else Device.id < last_id
+            query = query.filter(sort_column.is_(None), same_id)
+        else:
+            key = tuple_(sort_column, Device.id)
+            cursor_key = tuple_(literal(sort_value), literal(last_id))
+            query = query.filter(or_(key > cursor_key if order == "asc" else key < cursor_key,
+                                     sort_column.is_(None)))
+    direction = asc if order == "asc" else desc
+    rows = query.order_by(sort_column.is_(None), direction(sort_column), direction(Device.id)).limit(limit + 1).all()
+
+    if not rows and cursor is None and status is None and is_mock is None and db.query(Device.id).first() is None:
         mock_device = Device(
             id=f"MockDevice-{uuid.uuid4().hex[:8]}",
             status="idle",
             version="1.0",
-            cores=[{"id": i, "status": "healthy"} for i in range(4)],
-            memristors=[{"id": i, "status": "active"} for i in range(16)],
             is_mock=True
         )
         db.add(mock_device)
+        reset_core_states(db, mock_device, core_count=4, memristors_per_core=4)
         db.commit()
-        devices = [mock_device]
+        rows = [(mock_device.id, mock_device.status, mock_device.version, mock_device.is_mock, None)]
 
-    return {"devices": [{"id": d.id, "status": d.status, "version": d.version, "is_mock": d.is_mock} for d in devices]}
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = _encode_cursor(rows[-1][4], rows[-1][0])
+    return {
+        "devices": [
+            {"id": device_id, "status": device_status, "version": version, "is_mock": mock}
+            for device_id, device_status, version, mock, _ in rows
+        ],
+        "next_cursor": next_cursor
+    }
 
 
 @router.post("/devices/mock")
@@ -60,8 +134,6 @@ async def create_mock_device(
         id=f"MockDevice-{uuid.uuid4().hex[:8]}",
         status="idle",
         version="1.0",
-        cores=[{"id": i, "status": "healthy"} for i in range(cfg.core_count)],
-        memristors=[{"id": i, "status": "active"} for i in range(total_memristors)],
         is_mock=True,
         # Hardware specs
         clock_frequency=cfg.clock_frequency,
@@ -77,6 +149,8 @@ async def create_mock_device(
         leakage_types=cfg.leakage_types,
     )
     db.add(mock_device)
+    # Мемристоры хранятся упакованно по ядрам: запись не зависит от их количества
+    reset_core_states(db, mock_device, cfg.core_count, cfg.memristors_per_core)
     db.commit()
     return {
         "device": {
@@ -93,7 +167,7 @@ async def create_mock_device(
 
 @router.get("/devices/{device_id}")
 async def get_device(device_id: str, db: Session = Depends(get_db), user=Depends(get_current_user)):
-    device = db.query(Device).filter(Device.id == device_id).first()
+    device = db.query(Device).options(undefer(Device.diagnostics)).filter(Device.id == device_id).first()
     if not device:
         raise HTTPException(404, "Device not found")
     return {
@@ -124,6 +198,7 @@ async def delete_device(
 
     for workflow in workflows:
         db.delete(workflow)
+    db.query(CoreState).filter(CoreState.device_id == device_id).delete(synchronize_session=False)
 
     # Удаляем само устройство
     db.delete(device)
@@ -135,18 +210,28 @@ async def delete_device(
 @router.get("/devices/{device_id}/details")
 async def get_device_details(
         device_id: str,
+        memristors: str = Query("summary", pattern="^(summary|full)$"),
         db: Session = Depends(get_db),
         user=Depends(get_current_user)
 ):
-    """Get detailed information about a specific device"""
-    device = db.query(Device).filter(Device.id == device_id).first()
+    """Get detailed information about a specific device.
+
+    By default cores come with per-core aggregates and the memristor list is
+    omitted (page through it with /devices/{id}/cores/{core}/memristors);
+    memristors=full returns the complete per-memristor list as before.
+    """
+    device = db.query(Device).options(undefer_group("details")).filter(Device.id == device_id).first()
     if not device:
         raise HTTPException(404, "Device not found")
 
-    # Вычисляем мемристоры на ядро для отображения
-    memristors_per_core = 0
-    if device.cores and device.memristors:
-        memristors_per_core = len(device.memristors) // len(device.cores)
+    # Сводке хватает RLE и гистограммы: упакованные массивы читаются только для полного списка
+    states = load_core_states(db, device_id, with_arrays=memristors == "full")
+    if memristors == "full":
+        memristor_list = expand_memristors(states)
+        cores = [{"id": state.core_id, "status": state.status} for state in states]
+    else:
+        memristor_list = None
+        cores = [core_summary(state) for state in states]
 
     return {
         "id": device.id,
@@ -154,8 +239,9 @@ async def get_device_details(
         "version": device.version,
         "is_mock": device.is_mock,
         "diagnostics": device.diagnostics,
-        "memristors": device.memristors,
-        "cores": device.cores,
+        "memristors": memristor_list,
+        "cores": cores,
+        "memristor_statuses": MEMRISTOR_STATUSES,
         "clock_frequency": device.clock_frequency,
         "memory_bandwidth": device.memory_bandwidth,
         "supported_dtypes": device.supported_dtypes,
@@ -166,12 +252,71 @@ async def get_device_details(
         "supported_activations": device.supported_activations,
         "supported_layers": device.supported_layers,
         "leakage_types": device.leakage_types,
-        "memristors_per_core": memristors_per_core,
+        "memristors_per_core": device.memristors_per_core or 0,
         "created_at": device.created_at if hasattr(device, 'created_at') else None,
         "updated_at": device.updated_at if hasattr(device, 'updated_at') else None
     }
 
 
+@router.get("/devices/{device_id}/cores/{core_id}/memristors")
+async def get_core_memristors(
+        device_id: str,
+        core_id: int,
+        offset: int = Query(0, ge=0),
+        limit: int = Query(1024, ge=1, le=MEMRISTOR_PAGE_MAX),
+        row: Optional[int] = Query(None, ge=0),
+        col: Optional[int] = Query(None, ge=0),
+        rows: Optional[int] = Query(None, ge=1),
+        cols: Optional[int] = Query(None, ge=1),
+        db: Session = Depends(get_db),
+        user=Depends(get_current_user)
+):
+    """Memristors of one core: a linear page (offset/limit) or a crossbar window (row/col/rows/cols).
+
+    Statuses are codes into memristor_statuses; conductance is null when not measured.
+    """
+    state = db.query(CoreState).options(undefer_group("arrays")).filter(
+        CoreState.device_id == device_id, CoreState.core_id == core_id
+    ).first()
+    if not state:
+        raise HTTPException(404, "Core not found")
+
+    codes = status_codes(state)
+    values = conductance(state)
+    crossbar_rows, crossbar_cols = crossbar_shape(state.memristor_count)
+    result = {
+        "device_id": device_id,
+        "core_id": core_id,
+        "memristor_count": state.memristor_count,
+        "crossbar": {"rows": crossbar_rows, "cols": crossbar_cols},
+        "memristor_statuses": MEMRISTOR_STATUSES,
+    }
+
+    if any(param is not None for param in (row, col, rows, cols)):
+        # Окно кроссбара для тепловой карты; обрезается по границам
+        if rows is None or cols is None:
+            raise HTTPException(400, "A crossbar window needs rows and cols")
+        if rows * cols > MEMRISTOR_PAGE_MAX:
+            raise HTTPException(400, f"Window exceeds {MEMRISTOR_PAGE_MAX} memristors")
+        row, col = row or 0, col or 0
+        window = (slice(row, min(row + rows, crossbar_rows)), slice(col, min(col + cols, crossbar_cols)))
+        status_window = codes.reshape(crossbar_rows, crossbar_cols)[window]
+        result["window"] = {"row": row, "col": col, "rows": status_window.shape[0], "cols": status_window.shape[1]}
+        result["status"] = status_window.tolist()
+        result["conductance"] = (
+            values.reshape(crossbar_rows, crossbar_cols)[window].astype(np.float32).tolist()
+            if values is not None else None
+        )
+        return result
+
+    page = slice(offset, min(offset + limit, state.memristor_count))
+    result["offset"] = offset
+    result["limit"] = limit
+    result["status"] = codes[page].tolist()
+    result["conductance"] = values[page].astype(np.float32).tolist() if values is not None else None
+    return result
+
+
 @router.put("/devices/{device_id}/config")
 async def update_device_config(
         device_id: str,
@@ -202,9 +347,7 @@ async def update_device_config(
     device.leakage_types = config.leakage_types
 
     # Recreate cores and memristors with new dimensions
-    device.cores = [{"id": i, "status": "healthy"} for i in range(config.core_count)]
-    total_memristors = config.memristors_per_core * config.core_count
-    device.memristors = [{"id": i, "status": "active"} for i in range(total_memristors)]
+    reset_core_states(db, device, config.core_count, config.memristors_per_core)
 
     db.commit()
     return {"status": "updated", "device_id": device_id}
\ No newline at end of file
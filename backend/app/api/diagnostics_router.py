@@ -1,48 +1,137 @@
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
 import asyncio
-from app.models.device_models import Device
-from app.models.workflow_models import DeviceWorkflowStatus, WorkflowStep
-from app.database import get_db
+import json
+from typing import List, Optional
 from app.auth.dependencies import get_current_user
-from pydantic import BaseModel
+from app.services.diagnostics_engine import FAULT_MODELS
+from app.services.diagnostics_jobs import (
+    diagnostics_jobs, DeviceBusy, ACTIVE_STATUSES, DIAGNOSTICS_BATCH_PARALLELISM, DIAGNOSTICS_BATCH_MAX_DEVICES
+)
+from pydantic import BaseModel, Field
 
 router = APIRouter()
 
+# Пустой комментарий раз в N секунд, чтобы прокси не закрывали SSE-соединение
+SSE_KEEPALIVE_SECONDS = 15
+
 
 class DiagnosticsRequest(BaseModel):
     device_id: str
+    # Параметры симуляции неисправностей (по умолчанию — из окружения)
+    fault_rate: Optional[float] = Field(None, ge=0, le=1 / len(FAULT_MODELS))
+    seed: int = 0
+    passes: int = Field(2, ge=1, le=16)
 
 
-async def run_diagnostics_task(device_id: str, db: Session):
-    await asyncio.sleep(3)  # Имитация работы
-    device = db.query(Device).filter(Device.id == device_id).first()
-    if device:
-        # Используем реальные данные устройства для диагностики
-        cores_count = len(device.cores) if device.cores else 4
-        memristors_count = len(device.memristors) if device.memristors else 16
-
-        device.diagnostics = {
-            "cores": [{"id": i, "status": "healthy"} for i in range(cores_count)],
-            "memristors": {"available": memristors_count, "total": memristors_count},
-            "overall_status": "passed"
-        }
-        workflow = db.query(DeviceWorkflowStatus).filter(DeviceWorkflowStatus.device_id == device_id).first()
-        if workflow:
-            workflow.current_step = WorkflowStep.COMPILER
-        db.commit()
-
-
-@router.post("/diagnostics")
+@router.post("/diagnostics", status_code=202)
 async def run_diagnostics(
         request: DiagnosticsRequest,  # Используем Pydantic модель
-        background_tasks: BackgroundTasks,
-        db: Session = Depends(get_db),
         user=Depends(get_current_user)
 ):
-    device = db.query(Device).filter(Device.id == request.device_id).first()
-    if not device:
+    """Queue diagnostics for a device; follow /diagnostics/jobs/{job_id}/events for progress"""
+    try:
+        job = await diagnostics_jobs.submit(
+            request.device_id,
+            {"fault_rate": request.fault_rate, "seed": request.seed, "passes": request.passes}
+        )
+    except LookupError:
         raise HTTPException(404, "Device not found")
+    except DeviceBusy as e:
+        raise HTTPException(409, {"message": str(e), "job_id": e.job_id})
+    return {"status": "started", "job_id": job["job_id"], "message": "Diagnostics queued"}
+
+
+class BatchDiagnosticsRequest(BaseModel):
+    # Список устройств и/или фильтр; без обоих — все устройства
+    device_ids: Optional[List[str]] = Field(None, max_length=DIAGNOSTICS_BATCH_MAX_DEVICES)
+    status: Optional[str] = None
+    is_mock: Optional[bool] = None
+    fault_rate: Optional[float] = Field(None, ge=0, le=1 / len(FAULT_MODELS))
+    seed: int = 0
+    passes: int = Field(2, ge=1, le=16)
+    parallelism: int = Field(DIAGNOSTICS_BATCH_PARALLELISM, ge=1, le=1024)
+
+
+@router.post("/diagnostics/batch")
+async def run_batch_diagnostics(request: BatchDiagnosticsRequest, user=Depends(get_current_user)):
+    """Diagnose many devices concurrently and return an aggregate report.
+
+    Devices already under diagnostics are skipped and listed in ``busy``;
+    requested ids that do not exist (or do not match the filter) are listed
+    in ``missing``.
+    """
+    try:
+        return await diagnostics_jobs.run_batch(
+            list(dict.fromkeys(request.device_ids)) if request.device_ids is not None else None,
+            request.status,
+            request.is_mock,
+            {"fault_rate": request.fault_rate, "seed": request.seed, "passes": request.passes, "batch": True},
+            request.parallelism
+        )
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+
+
+@router.get("/diagnostics/jobs")
+async def list_diagnostics_jobs(
+        device_id: Optional[str] = None,
+        limit: int = Query(50, ge=1, le=500),
+        user=Depends(get_current_user)
+):
+    return {"jobs": await asyncio.to_thread(diagnostics_jobs.list, device_id, limit)}
+
+
+@router.get("/diagnostics/jobs/{job_id}")
+async def get_diagnostics_job(job_id: str, user=Depends(get_current_user)):
+    job = await asyncio.to_thread(diagnostics_jobs.get, job_id, True)
+    if not job:
+        raise HTTPException(404, "Diagnostics job not found")
+    return job
+
+
+@router.delete("/diagnostics/jobs/{job_id}")
+async def cancel_diagnostics_job(job_id: str, user=Depends(get_current_user)):
+    job = await diagnostics_jobs.cancel(job_id)
+    if not job:
+        raise HTTPException(404, "Diagnostics job not found")
+    return job
+
+
+def _sse(event: dict) -> str:
+    return f"event: {event['event']}\ndata: {json.dumps(event)}\n\n"
+
+
+@router.get("/diagnostics/jobs/{job_id}/events")
+async def stream_diagnostics_job(job_id: str, user=Depends(get_current_user)):
+    """Server-Sent Events: a snapshot, then per-core progress until the job finishes.
+
+    Events: ``snapshot`` (job state), ``core`` (a finished core with its
+    faults), ``status`` (running/completed/failed/cancelled; the stream ends
+    after a final status).
+    """
+    # Подписка до чтения снимка: события между ними не теряются
+    queue = diagnostics_jobs.subscribe(job_id)
+    job = await asyncio.to_thread(diagnostics_jobs.get, job_id, True)
+    if not job:
+        diagnostics_jobs.unsubscribe(job_id, queue)
+        raise HTTPException(404, "Diagnostics job not found")
+
+    async def events():
+        try:
+            yield _sse({"event": "snapshot", **job})
+            if job["status"] not in ACTIVE_STATUSES:
+                return
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), SSE_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield _sse(event)
+                if event["event"] == "status" and event["status"] not in ACTIVE_STATUSES:
+                    return
+        finally:
+            diagnostics_jobs.unsubscribe(job_id, queue)
 
-    background_tasks.add_task(run_diagnostics_task, request.device_id, db)
-    return {"status": "started", "message": "Diagnostics running in background"}
\ No newline at end of file
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
@@ -1,17 +1,29 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
+from fastapi.responses import FileResponse, StreamingResponse
 from sqlalchemy.orm import Session
 import asyncio
+import json
+import time
+from contextlib import ExitStack
+from typing import List
+import numpy as np
 from app.models.workflow_models import DeviceWorkflowStatus, WorkflowStep
 from app.database import get_db
 from app.auth.dependencies import get_current_user  # ИЗМЕНЕНО
+from app.services.uploads import spool_upload
+from app.services.artifact_store import artifact_store, flashed_firmware_path
+from app.services import inference_engine
+from app.services.inference_engine import FirmwareNotRunnable, session_cache
+from app.services.inference_batcher import inference_batcher
 import os
 import uuid
 
 router = APIRouter()
 
-# Создаем путь к tmp внутри проекта (на уровне app/)
-PROJECT_TMP_DIR = os.path.join(os.path.dirname(__file__), '..', '..', 'tmp')
-os.makedirs(PROJECT_TMP_DIR, exist_ok=True)  # Создаем если не существует
+DATASET_SUFFIXES = (".npz", ".zip", ".npy")
+DATASET_BATCH_MAX = 4096
+# Строка progress в потоке результатов не чаще раза в столько секунд
+DATASET_PROGRESS_SECONDS = 1.0
 
 @router.post("/flash")
 async def flash_firmware(device_id: str, firmware: UploadFile = File(...), db: Session = Depends(get_db),
@@ -20,31 +32,210 @@ async def flash_firmware(device_id: str, firmware: UploadFile = File(...), db: S
     if not workflow or workflow.current_step != WorkflowStep.INFERENCE:
         raise HTTPException(403, "Compile firmware first")
 
-    # Сохранить прошивку в tmp проекта
-    content = await firmware.read()
-    flash_path = os.path.join(PROJECT_TMP_DIR, f"flashed_{device_id}.bin")
-    with open(flash_path, "wb") as f:
-        f.write(content)
+    # Прошивка пишется потоково во временный файл и заменяет прежнюю только после полной записи
+    try:
+        flash_path = flashed_firmware_path(device_id)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    upload = await spool_upload(firmware, suffix=".bin")
+    artifact_store.adopt(upload.path, flash_path)
+    session_cache.invalidate(device_id)
+
+    return {"status": "flashed", "path": flash_path, "sha256": upload.sha256, "size": upload.size}
+
+def _firmware_for_inference(device_id: str, workflow: DeviceWorkflowStatus) -> str:
+    # Прошитая копия, иначе — результат компиляции; onnxruntime исполняет её вместо устройства
+    try:
+        path = flashed_firmware_path(device_id)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    if not os.path.exists(path):
+        path = workflow.compiled_firmware
+    if not path or not os.path.exists(path):
+        raise HTTPException(409, "Firmware not found, flash it again")
+    return path
 
-    return {"status": "flashed", "path": flash_path}
 
 @router.post("/infer")
-async def run_inference(device_id: str, data: UploadFile = File(...), db: Session = Depends(get_db),
+async def run_inference(device_id: str, data: List[UploadFile] = File(...), db: Session = Depends(get_db),
                         user=Depends(get_current_user)):
+    """Run the device's firmware on uploaded samples (.npy or .npz, one array per model input).
+
+    The firmware is executed by onnxruntime as a local stand-in for the
+    hardware; sessions are cached per (device, firmware hash).
+    """
+    workflow = db.query(DeviceWorkflowStatus).filter(DeviceWorkflowStatus.device_id == device_id).first()
+    if not workflow or workflow.current_step != WorkflowStep.INFERENCE:
+        raise HTTPException(403, "Flash firmware first")
+    firmware_path = _firmware_for_inference(device_id, workflow)
+    # Соединение с БД не держим, пока запрос ждёт в очереди батчинга: иначе пул соединений
+    # исчерпывается одновременными запросами
+    db.close()
+
+    try:
+        model = await asyncio.to_thread(session_cache.get, device_id, firmware_path)
+    except FirmwareNotRunnable as e:
+        raise HTTPException(422, str(e))
+
+    # Файлы пишутся на диск кусками, .npy читаются через memmap — без копии загрузки в памяти
+    spooled = []
+    try:
+        feeds = []
+        for item in data:
+            suffix = os.path.splitext(item.filename or "")[1].lower()
+            spooled.append(await spool_upload(item, suffix=suffix, spent=sum(upload.size for upload in spooled)))
+            try:
+                feeds.append(await asyncio.to_thread(
+                    inference_engine.decode_input, model, item.filename, spooled[-1].path
+                ))
+            except ValueError as e:
+                raise HTTPException(400, str(e))
+        # Файлы запроса (и одновременные запросы к той же прошивке) собираются в общие батчи
+        batches = await asyncio.gather(
+            *(inference_batcher.submit(device_id, model, feed) for feed in feeds), return_exceptions=True
+        )
+    finally:
+        for upload in spooled:
+            os.remove(upload.path)
+
+    results = []
+    for item, batch in zip(data, batches):
+        if isinstance(batch, Exception):
+            raise HTTPException(400, f"Inference failed on {item.filename}: {batch}")
+        samples = inference_engine.predictions(batch.outputs[0])
+        for i, (index, confidence) in enumerate(samples):
+            results.append({
+                "input": item.filename if len(samples) == 1 else f"{item.filename}[{i}]",
+                "prediction": f"class_{index}",
+                "confidence": confidence,
+                # Время вызова сессии на весь батч, в который попал файл
+                "latency_ms": round(batch.latency_ms, 3),
+                "queue_ms": round(batch.queue_ms, 3),
+                "batch_size": batch.batch_size
+            })
+
+    return {"firmware_sha256": model.firmware_hash, "results": results}
+
+
+def _ndjson(item: dict) -> str:
+    return json.dumps(item) + "\n"
+
+
+async def _dataset_lines(model, dataset_path: str, batches, first, results_path):
+    """NDJSON lines of a dataset evaluation: results (unless written to an artifact), progress, summary."""
+    stats = inference_engine.RunningStats()
+    last_progress = time.perf_counter()
+    try:
+        with ExitStack() as stack:
+            out = stack.enter_context(artifact_store.writer(results_path)) if results_path else None
+            batch, index = first, 0
+            while batch is not None:
+                feed, labels, count = batch
+                outputs, latency_ms = await asyncio.to_thread(inference_engine.run, model, feed)
+                samples = inference_engine.predictions(outputs[0][:count])
+                classes = np.array([class_index for class_index, _ in samples])
+                stats.add(classes, labels, latency_ms)
+                lines = "".join(_ndjson({
+                    "type": "result",
+                    "index": index + i,
+                    "prediction": f"class_{class_index}",
+                    "confidence": confidence,
+                    **({"label": int(labels[i]), "correct": bool(class_index == labels[i])} if labels is not None else {})
+                }) for i, (class_index, confidence) in enumerate(samples))
+                if out is not None:
+                    await asyncio.to_thread(out.write, lines.encode())
+                else:
+                    yield lines
+                index += count
+                if time.perf_counter() - last_progress >= DATASET_PROGRESS_SECONDS:
+                    last_progress = time.perf_counter()
+                    yield _ndjson({"type": "progress", **stats.to_dict()})
+                batch = await asyncio.to_thread(next, batches, None)
+        summary = {"type": "summary", "firmware_sha256": model.firmware_hash, **stats.to_dict()}
+        if results_path:
+            summary["results"] = os.path.basename(results_path)
+        yield _ndjson(summary)
+    except Exception as e:
+        # Заголовки уже отправлены: ошибка сообщается последней строкой потока
+        yield _ndjson({"type": "error", "detail": str(e), **stats.to_dict()})
+    finally:
+        batches.close()
+        os.remove(dataset_path)
+
+
+@router.post("/infer/dataset")
+async def run_dataset_inference(
+        device_id: str,
+        dataset: UploadFile = File(...),
+        batch_size: int = Form(64),
+        label_key: str = Form("labels"),
+        results: str = Form("stream"),  # stream | artifact
+        db: Session = Depends(get_db),
+        user=Depends(get_current_user)
+):
+    """Evaluate the device's firmware on a whole dataset, streaming NDJSON back.
+
+    The dataset is an .npz/.zip with one [N, ...] array per model input (plus
+    optional ``label_key`` labels) or an .npy for single-input models. It is
+    read batch by batch from disk. The stream has a ``result`` line per sample
+    (with results=artifact they go to a file downloadable from
+    /infer/results/{name} instead), ``progress`` lines with running accuracy
+    and latency percentiles, and a final ``summary`` (or ``error``) line.
+    """
+    if results not in ("stream", "artifact"):
+        raise HTTPException(400, "results must be 'stream' or 'artifact'")
+    if not 1 <= batch_size <= DATASET_BATCH_MAX:
+        raise HTTPException(400, f"batch_size must be between 1 and {DATASET_BATCH_MAX}")
+    suffix = os.path.splitext(dataset.filename or "")[1].lower()
+    if suffix not in DATASET_SUFFIXES:
+        raise HTTPException(400, f"Unsupported dataset file: {dataset.filename} (expected .npz, .zip or .npy)")
+
     workflow = db.query(DeviceWorkflowStatus).filter(DeviceWorkflowStatus.device_id == device_id).first()
     if not workflow or workflow.current_step != WorkflowStep.INFERENCE:
         raise HTTPException(403, "Flash firmware first")
+    firmware_path = _firmware_for_inference(device_id, workflow)
+    db.close()
+
+    try:
+        model = await asyncio.to_thread(session_cache.get, device_id, firmware_path)
+    except FirmwareNotRunnable as e:
+        raise HTTPException(422, str(e))
+
+    upload = await spool_upload(dataset, suffix=suffix)
+    # Первый батч читается до ответа: ошибки формата датасета возвращаются кодом 400
+    batches = inference_engine.iter_dataset(upload.path, model, batch_size, label_key)
+    try:
+        first = await asyncio.to_thread(next, batches, None)
+    except Exception as e:
+        batches.close()
+        os.remove(upload.path)
+        raise HTTPException(400, f"Invalid dataset: {e}")
+
+    results_path = artifact_store.new_path("inference", prefix=f"{device_id}_", suffix=".ndjson") \
+        if results == "artifact" else None
+    return StreamingResponse(
+        _dataset_lines(model, upload.path, batches, first, results_path),
+        media_type="application/x-ndjson"
+    )
+
+
+@router.get("/infer/results/{name}")
+async def download_inference_results(name: str, user=Depends(get_current_user)):
+    try:
+        path = artifact_store.path("inference", name)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    if not os.path.exists(path):
+        raise HTTPException(404, "Inference results not found")
+    return FileResponse(path, media_type="application/x-ndjson", filename=name)
+
+
+@router.get("/infer/sessions")
+async def inference_session_stats(user=Depends(get_current_user)):
+    return session_cache.stats()
+
 
-    # Мок инференса
-    await asyncio.sleep(2)
-
-    return {
-        "results": [
-            {
-                "input": data.filename,
-                "prediction": "class_3",
-                "confidence": 0.95,
-                "latency_ms": 45
-            }
-        ]
-    }
\ No newline at end of file
+@router.get("/infer/batching")
+async def inference_batching_stats(user=Depends(get_current_user)):
+    """Micro-batching counters with batch size, queue wait and run time histograms"""
+    return inference_batcher.stats()
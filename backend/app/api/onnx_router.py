@@ -1,20 +1,268 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, Depends
-from app.services.onnx_parser import parse_onnx_model
-from app.models.onnx_models import ParsedOnnxResponse
+from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, Query, Header
+from fastapi.responses import Response, StreamingResponse
+from app.services.onnx_parser import (
+    parse_onnx_model, get_tensor_slice, get_tensor_buffer, npy_header, MAX_SLICE_LIMIT
+)
+from app.services.model_store import store_model_file, get_model_path, bundle_id
+from app.services.uploads import spool_upload, spool_external_data
+from app.services.parse_cache import parse_cache
+from app.models.onnx_models import ParsedOnnxResponse, WeightSlice
+from app.models.device_models import Device, CoreState
+from app.database import get_db
 from app.auth.dependencies import get_current_user
-import io
+from app.services.crossbar_simulator import DeviceConfig, simulate, inferred_shapes, occupied_tiles
+from app.services.graph_analytics import analyze, analytics_cache, device_fit
+from sqlalchemy.orm import Session, undefer_group
+from functools import lru_cache
+from typing import List, Optional, Tuple
+import asyncio
+import json
+import os
 
 router = APIRouter()
 
+STREAM_CHUNK_SIZE = 1024 * 1024
+
+
+def _parse_range(range_header: Optional[str], total: int) -> Optional[Tuple[int, int]]:
+    """Parse a single 'bytes=start-end' range into an inclusive (start, end) pair."""
+    if not range_header:
+        return None
+    unit, _, spec = range_header.partition("=")
+    if unit.strip() != "bytes" or "," in spec:
+        raise HTTPException(416, "Only a single bytes range is supported")
+    start_str, _, end_str = spec.strip().partition("-")
+    try:
+        if start_str:
+            start = int(start_str)
+            end = int(end_str) if end_str else total - 1
+        else:
+            # bytes=-N — последние N байт
+            start = max(total - int(end_str), 0)
+            end = total - 1
+    except ValueError:
+        raise HTTPException(416, "Malformed Range header")
+    end = min(end, total - 1)
+    if start > end:
+        raise HTTPException(416, "Range not satisfiable", headers={"Content-Range": f"bytes */{total}"})
+    return start, end
+
+
+def _iter_chunks(parts: List[memoryview], start: int, stop: int):
+    """Bytes [start, stop) of the concatenated ``parts``, without joining them into one buffer."""
+    for part in parts:
+        size = len(part)
+        if start < size and stop > 0:
+            view = part[max(start, 0):min(stop, size)]
+            for pos in range(0, len(view), STREAM_CHUNK_SIZE):
+                yield bytes(view[pos:pos + STREAM_CHUNK_SIZE])
+        start -= size
+        stop -= size
+
+
+def _parse_to_cache(path: str, model_id: str) -> bytes:
+    # Веса из external data не читаются — парсится только структура графа
+    parsed_data = parse_onnx_model(path)
+    parsed_data["model_id"] = model_id
+    body = ParsedOnnxResponse(**parsed_data).model_dump_json(by_alias=True).encode()
+    parse_cache.put(model_id, body)
+    return body
+
+
 @router.post("/parse-onnx", response_model=ParsedOnnxResponse)
 async def parse_onnx(
     file: UploadFile = File(...),
+    external_data: List[UploadFile] = File([]),
     current_user=Depends(get_current_user)
 ):
+    """Parse an ONNX graph; weight files of models saved with external data go in external_data"""
+    upload = await spool_upload(file, suffix=".onnx")
     try:
-        content = await file.read()
-        model_stream = io.BytesIO(content)
-        parsed_data = parse_onnx_model(model_stream)
-        return parsed_data
+        external = await spool_external_data(external_data or [], spent=upload.size)
+    except BaseException:
+        os.remove(upload.path)
+        raise
+    model_id = bundle_id(upload.sha256, [(name, item.sha256) for name, item in external])
+    try:
+        # Повторная загрузка той же модели — отдаём готовый JSON из кэша
+        body = await asyncio.to_thread(parse_cache.get, model_id)
+        if body is None:
+            body = await asyncio.to_thread(_parse_to_cache, upload.path, model_id)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error parsing ONNX: {str(e)}")
\ No newline at end of file
+        for path in [upload.path] + [item.path for _, item in external]:
+            os.remove(path)
+        raise HTTPException(status_code=500, detail=f"Error parsing ONNX: {str(e)}")
+
+    # Сохраняем модель, чтобы значения весов можно было дочитать по запросу
+    await asyncio.to_thread(store_model_file, upload.path, model_id, [(name, item.path) for name, item in external])
+    return Response(content=body, media_type="application/json")
+
+
+@router.get("/onnx/cache/stats")
+async def get_parse_cache_stats(current_user=Depends(get_current_user)):
+    """Hit/miss/eviction counters of the parsed-model cache"""
+    return parse_cache.stats()
+
+
+@router.get("/onnx/{model_id}/weights/{weight_name:path}", response_model=WeightSlice)
+async def get_weight_values(
+    model_id: str,
+    weight_name: str,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(1000, ge=1, le=MAX_SLICE_LIMIT),
+    current_user=Depends(get_current_user)
+):
+    """Return a flattened range of one initializer's values"""
+    model_path = get_model_path(model_id)
+    if not model_path:
+        raise HTTPException(404, "Model not found, upload it via /parse-onnx first")
+
+    try:
+        weight_slice = await asyncio.to_thread(get_tensor_slice, model_path, weight_name, offset, limit)
+    except ValueError as e:
+        raise HTTPException(422, str(e))
+    if weight_slice is None:
+        raise HTTPException(404, f"Weight '{weight_name}' not found")
+    return weight_slice
+
+
+
+@router.get("/onnx/{model_id}/tensors/{weight_name:path}")
+async def download_weight(
+    model_id: str,
+    weight_name: str,
+    format: str = Query("raw", pattern="^(raw|npy)$"),
+    range_header: Optional[str] = Header(None, alias="Range"),
+    current_user=Depends(get_current_user)
+):
+    """Stream one initializer as raw little-endian bytes or as an .npy file"""
+    model_path = get_model_path(model_id)
+    if not model_path:
+        raise HTTPException(404, "Model not found, upload it via /parse-onnx first")
+
+    try:
+        tensor = await asyncio.to_thread(get_tensor_buffer, model_path, weight_name)
+    except ValueError as e:
+        raise HTTPException(422, str(e))
+    if tensor is None:
+        raise HTTPException(404, f"Weight '{weight_name}' not found")
+
+    dtype, shape, buffer = tensor
+    # Заголовок NPY отдаётся отдельным куском: тензор (в т.ч. memmap external data) не копируется
+    parts = [memoryview(npy_header(dtype, shape)), buffer] if format == "npy" else [buffer]
+
+    total = sum(len(part) for part in parts)
+    byte_range = _parse_range(range_header, total) if total else None
+    headers = {
+        "Accept-Ranges": "bytes",
+        "X-Tensor-Dtype": dtype.name,
+        "X-Tensor-Shape": ",".join(str(dim) for dim in shape),
+        "Content-Disposition": f'attachment; filename="{weight_name.replace("/", "_")}.{format}"',
+    }
+    status_code = 200
+    start, end = 0, total - 1
+    if byte_range:
+        start, end = byte_range
+        headers["Content-Range"] = f"bytes {start}-{end}/{total}"
+        status_code = 206
+    headers["Content-Length"] = str(end + 1 - start)
+
+    return StreamingResponse(
+        _iter_chunks(parts, start, end + 1),
+        status_code=status_code,
+        media_type="application/octet-stream",
+        headers=headers
+    )
+
+
+@lru_cache(maxsize=32)
+def _model_shapes(model_id: str, model_path: str, batch: int) -> dict:
+    # Модели адресуются по содержимому: формы для (model_id, batch) не меняются
+    return inferred_shapes(model_path, batch)
+
+
+@lru_cache(maxsize=32)
+def _occupied_tiles(model_id: str, model_path: str, rows: int, cols: int) -> dict:
+    return occupied_tiles(model_path, _parsed_model(model_id, model_path), rows, cols)
+
+
+def _parsed_model(model_id: str, model_path: str) -> dict:
+    body = parse_cache.get(model_id)
+    return json.loads(body) if body is not None else parse_onnx_model(model_path)
+
+
+@router.get("/onnx/{model_id}/simulate")
+async def simulate_model(
+    model_id: str,
+    device_id: str,
+    batch: int = Query(1, ge=1, le=65536),
+    include_nodes: bool = True,
+    db: Session = Depends(get_db),
+    current_user=Depends(get_current_user)
+):
+    """Estimate latency, throughput, energy and utilization of a model on a device's crossbars.
+
+    Roofline-style per-node breakdown (see crossbar_simulator.simulate);
+    cores diagnosed as faulty are not used.
+    """
+    model_path = get_model_path(model_id)
+    if not model_path:
+        raise HTTPException(404, "Model not found, upload it via /parse-onnx first")
+    device = db.query(Device).options(undefer_group("details")).filter(Device.id == device_id).first()
+    if not device:
+        raise HTTPException(404, "Device not found")
+    faulty = db.query(CoreState).filter(CoreState.device_id == device_id, CoreState.status == "faulty").count()
+    config = DeviceConfig.from_device(device, usable_cores=(device.core_count or 0) - faulty)
+    db.close()
+
+    def run():
+        occupied = (_occupied_tiles(model_id, model_path, config.crossbar_rows, config.crossbar_cols)
+                    if config.sparsity_support else None)
+        return simulate(_parsed_model(model_id, model_path), config, _model_shapes(model_id, model_path, batch), batch,
+                        occupied)
+
+    result = await asyncio.to_thread(run)
+    if not include_nodes:
+        result.pop("nodes")
+    return result
+
+
+@router.get("/onnx/{model_id}/analytics")
+async def graph_analytics(
+    model_id: str,
+    batch: int = Query(1, ge=1, le=65536),
+    device_id: Optional[str] = None,
+    db: Session = Depends(get_db),
+    current_user=Depends(get_current_user)
+):
+    """Per-node MACs/FLOPs and memory, peak live-tensor memory and the critical path of a model.
+
+    Computed once per (model, batch) from ONNX shape inference, see graph_analytics.analyze.
+    With ``device_id`` the response also tells whether the weights fit in the
+    device's crossbars and the headroom left (see graph_analytics.device_fit).
+    """
+    model_path = get_model_path(model_id)
+    if not model_path:
+        raise HTTPException(404, "Model not found, upload it via /parse-onnx first")
+    fit_args = None
+    if device_id is not None:
+        device = db.query(Device).filter(Device.id == device_id).first()
+        if not device:
+            raise HTTPException(404, "Device not found")
+        faulty = db.query(CoreState).filter(CoreState.device_id == device_id, CoreState.status == "faulty").count()
+        fit_args = (device_id, device.core_count or 0, (device.core_count or 0) - faulty,
+                    device.memristors_per_core or 0)
+    db.close()
+    key = f"{model_id}-b{batch}"
+    body = analytics_cache.get(key)
+    if body is None:
+        result = await asyncio.to_thread(analyze, model_path, batch)
+        result["model_id"] = model_id
+        body = json.dumps(result).encode()
+        analytics_cache.put(key, body)
+    if fit_args is not None:
+        # Кэшируется анализ модели; оценка для устройства дешёвая и считается на каждый запрос
+        result = json.loads(body)
+        result["device"] = {"device_id": fit_args[0], **device_fit(result["summary"], *fit_args[1:])}
+        body = json.dumps(result).encode()
+    return Response(content=body, media_type="application/json")
@@ -25,6 +25,8 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Метаданные тензора и диапазон в /onnx/{id}/tensors/{name} читаются фронтендом
+    expose_headers=["X-Tensor-Dtype", "X-Tensor-Shape", "Content-Range", "Accept-Ranges", "Content-Disposition"],
 )
 
 # Импорт и подключение роутеров...
@@ -44,6 +46,34 @@ app.include_router(compiler_router, prefix="/api/compiler", tags=["compiler"])
 app.include_router(inference_router, prefix="/api", tags=["inference"])
 app.include_router(onnx_router, prefix="/api", tags=["onnx"])
 
+import asyncio
+from app.services.quantization_jobs import quantization_jobs
+from app.services import diagnostics_engine, weight_packing
+from app.services.diagnostics_jobs import diagnostics_jobs
+from app.services.artifact_store import run_sweeper
+from app.services.inference_batcher import inference_batcher
+
+_background_tasks = []
+
+
+@app.on_event("startup")
+async def start_background_tasks():
+    # Периодическая очистка tmp: TTL и квота для артефактов, брошенные временные файлы
+    _background_tasks.append(asyncio.create_task(run_sweeper()))
+    await diagnostics_jobs.start()
+
+
+@app.on_event("shutdown")
+async def shutdown_workers():
+    for task in _background_tasks:
+        task.cancel()
+    await diagnostics_jobs.stop()
+    await inference_batcher.stop()
+    quantization_jobs.shutdown()
+    diagnostics_engine.shutdown()
+    weight_packing.shutdown()
+
+
 @app.get("/health")
 def health_check():
     return {"status": "healthy"}
\ No newline at end of file
@@ -1,5 +1,6 @@
 from .base import Base
-from .device_models import Device
+from .device_models import Device, CoreState
 from .workflow_models import DeviceWorkflowStatus, WorkflowStep
+from .job_models import DiagnosticsJob
 
-__all__ = ["Base", "Device", "DeviceWorkflowStatus", "WorkflowStep"]
\ No newline at end of file
+__all__ = ["Base", "Device", "CoreState", "DeviceWorkflowStatus", "WorkflowStep", "DiagnosticsJob"]
\ No newline at end of file
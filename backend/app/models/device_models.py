@@ -1,4 +1,5 @@
-from sqlalchemy import Column, String, Boolean, JSON, DateTime, Integer
+from sqlalchemy import Column, String, Boolean, JSON, DateTime, Integer, LargeBinary, ForeignKey
+from sqlalchemy.orm import deferred
 from sqlalchemy.sql import func
 from .base import Base
 
@@ -7,28 +8,50 @@ class Device(Base):
     __tablename__ = "devices"
 
     id = Column(String, primary_key=True)
-    status = Column(String, default="idle")  # idle, busy, error
+    status = Column(String, default="idle", index=True)  # idle, busy, error
     version = Column(String, default="1.0")
-    cores = Column(JSON, nullable=True)
-    memristors = Column(JSON, nullable=True)
-    diagnostics = Column(JSON, nullable=True)
-    is_mock = Column(Boolean, default=False)
+    is_mock = Column(Boolean, default=False, index=True)
+    # Состояние ядер и мемристоров — в core_states, здесь только размерность
+    core_count = Column(Integer, default=0)
+    memristors_per_core = Column(Integer, default=0)
+
+    # Тяжёлые колонки грузятся только по запросу (undefer_group("details"))
+    diagnostics = deferred(Column(JSON, nullable=True), group="details")
 
     # Hardware configuration
     clock_frequency = Column(Integer, default=1000)  # MHz
     memory_bandwidth = Column(Integer, default=128)  # GB/s
-    supported_dtypes = Column(JSON, default=["int8", "float16"])
+    supported_dtypes = deferred(Column(JSON, default=["int8", "float16"]), group="details")
     architecture_type = Column(String, default="simd")
     sparsity_support = Column(Boolean, default=True)
     crossbar_topology = Column(String, default="full_mesh")
     firmware_version = Column(String, default="1.0.0")
-    power_profile = Column(JSON, default={"idle": 5, "peak": 45})
-    thermal_throttling = Column(JSON, default={"enabled": True, "threshold": 85})
+    power_profile = deferred(Column(JSON, default={"idle": 5, "peak": 45}), group="details")
+    thermal_throttling = deferred(Column(JSON, default={"enabled": True, "threshold": 85}), group="details")
 
     # Neural network capabilities
-    supported_activations = Column(JSON, default=["relu", "tanh", "sigmoid"])
-    supported_layers = Column(JSON, default=["conv2d", "maxpool", "avgpool", "fc", "batchnorm"])
-    leakage_types = Column(JSON, default=["stuck_at_0", "stuck_at_1"])
+    supported_activations = deferred(Column(JSON, default=["relu", "tanh", "sigmoid"]), group="details")
+    supported_layers = deferred(Column(JSON, default=["conv2d", "maxpool", "avgpool", "fc", "batchnorm"]),
+                                group="details")
+    leakage_types = deferred(Column(JSON, default=["stuck_at_0", "stuck_at_1"]), group="details")
+
+    created_at = Column(DateTime, server_default=func.now(), index=True)
+    updated_at = Column(DateTime, onupdate=func.now())
+
+
+class CoreState(Base):
+    """State of one core and its memristor array, packed (see app.services.device_state)."""
+    __tablename__ = "core_states"
 
-    created_at = Column(DateTime, server_default=func.now())
-    updated_at = Column(DateTime, onupdate=func.now())
\ No newline at end of file
+    device_id = Column(String, ForeignKey("devices.id", ondelete="CASCADE"), primary_key=True)
+    core_id = Column(Integer, primary_key=True)
+    status = Column(String, default="healthy")
+    memristor_count = Column(Integer, nullable=False)
+    # Сводка статусов мемристоров в RLE: [[код, длина], ...]; для исправного ядра [[0, N]]
+    status_runs = Column(JSON, nullable=False)
+    # uint8-коды статусов (zlib); NULL, если все мемристоры активны
+    status_codes = deferred(Column(LargeBinary, nullable=True), group="arrays")
+    # Проводимости float16 (zlib); NULL — номинальные
+    conductance = deferred(Column(LargeBinary, nullable=True), group="arrays")
+    # Гистограмма проводимостей {"counts", "bin_edges"} для сводки без распаковки массива
+    conductance_histogram = Column(JSON, nullable=True)
@@ -0,0 +1,29 @@
+from sqlalchemy import Column, String, JSON, DateTime, Integer, Float, Index, text
+from sqlalchemy.orm import deferred
+from sqlalchemy.sql import func
+from .base import Base
+
+
+class DiagnosticsJob(Base):
+    __tablename__ = "diagnostics_jobs"
+
+    id = Column(String, primary_key=True)
+    device_id = Column(String, index=True, nullable=False)
+    status = Column(String, default="queued", index=True)  # queued, running, completed, failed, cancelled
+    params = Column(JSON, nullable=True)  # fault_rate, seed, passes
+    cores_total = Column(Integer, default=0)
+    cores_done = Column(Integer, default=0)
+    progress = Column(Float, default=0.0)
+    error = Column(String, nullable=True)
+    # Итоговая сводка (как Device.diagnostics)
+    result = deferred(Column(JSON, nullable=True))
+    created_at = Column(DateTime, server_default=func.now())
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        # Не больше одной незавершённой диагностики на устройство
+        Index("uq_diagnostics_jobs_active_device", "device_id", unique=True,
+              sqlite_where=text("status IN ('queued', 'running')"),
+              postgresql_where=text("status IN ('queued', 'running')")),
+    )
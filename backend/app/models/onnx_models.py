@@ -13,10 +13,32 @@ class Edge(BaseModel):
     to: str = Field(..., description="Target node name")
     label: str = Field(..., description="Tensor name connecting them")
 
+class Histogram(BaseModel):
+    counts: List[int] = Field(..., description="Number of values per bin")
+    bin_edges: List[float] = Field(..., description="Bin edges (len(counts) + 1)")
+
+class WeightStats(BaseModel):
+    min: float
+    max: float
+    mean: float
+    std: float
+    sparsity: float = Field(..., description="Fraction of exact zeros")
+    histogram: Histogram
+
 class Weight(BaseModel):
     shape: List[int] = Field(..., description="Tensor shape")
     dtype: str = Field(..., description="Data type (e.g., float32)")
-    values: List[float] = Field(..., description="Flattened values preview (limited)")
+    byte_size: int = Field(..., description="Tensor size in bytes")
+    stats: Optional[WeightStats] = Field(None, description="Value statistics (None for non-numeric tensors)")
+
+class WeightSlice(BaseModel):
+    name: str
+    shape: List[int]
+    dtype: str
+    total: int = Field(..., description="Total number of elements in the tensor")
+    offset: int = Field(..., description="Offset of the first returned element (flattened)")
+    limit: int
+    values: List[float] = Field(..., description="Flattened values in [offset, offset + limit)")
 
 class ModelMetadata(BaseModel):
     producer_name: Optional[str] = None
@@ -25,6 +47,7 @@ class ModelMetadata(BaseModel):
     description: Optional[str] = None
 
 class ParsedOnnxResponse(BaseModel):
+    model_id: Optional[str] = Field(None, description="Content hash used to fetch tensor values on demand")
     nodes: List[Node] = Field(..., description="List of graph nodes")
     edges: List[Edge] = Field(..., description="List of graph edges")
     weights: Dict[str, Weight] = Field(..., description="Model weights (initializers)")
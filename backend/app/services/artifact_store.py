@@ -0,0 +1,306 @@
+import asyncio
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Callable, Iterable, Iterator, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Общий tmp проекта: все модули кладут свои данные в подкаталоги
+PROJECT_TMP_DIR = os.path.join(os.path.dirname(__file__), '..', '..', 'tmp')
+os.makedirs(PROJECT_TMP_DIR, exist_ok=True)
+
+# Артефакты (прошивки и т.п.) храним в tmp/artifacts/<вид>/<имя>
+ARTIFACTS_DIR = os.path.join(PROJECT_TMP_DIR, 'artifacts')
+os.makedirs(ARTIFACTS_DIR, exist_ok=True)
+
+ARTIFACT_TTL_SECONDS = int(os.getenv("ARTIFACT_TTL_SECONDS", 7 * 24 * 3600))
+ARTIFACTS_MAX_BYTES = int(os.getenv("ARTIFACTS_MAX_BYTES", 10 * 1024 * 1024 * 1024))
+ARTIFACT_SWEEP_INTERVAL = int(os.getenv("ARTIFACT_SWEEP_INTERVAL", 600))
+# Незавершённые записи и брошенные временные файлы старше этого удаляются
+SCRATCH_GRACE_SECONDS = int(os.getenv("SCRATCH_GRACE_SECONDS", 24 * 3600))
+
+PART_SUFFIX = ".part"
+FRESH_SECONDS = 60
+
+
+def _real(path: str) -> str:
+    return os.path.realpath(path)
+
+
+def _remove(path: str) -> bool:
+    # Файл мог исчезнуть после сканирования (переименован писателем, удалён параллельной очисткой)
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        return False
+    return True
+
+
+def tree_size(path: str) -> int:
+    """Total size of the files directly inside ``path``."""
+    return sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+
+
+def scan_entries(directory: str, match: Callable[[os.DirEntry], bool],
+                 size: Callable[[os.DirEntry], int] = lambda entry: entry.stat().st_size
+                 ) -> List[Tuple[float, str, int]]:
+    """``(mtime, path, size)`` of the entries of ``directory`` accepted by ``match``."""
+    entries = []
+    for entry in os.scandir(directory):
+        try:
+            if match(entry):
+                entries.append((entry.stat().st_mtime, entry.path, size(entry)))
+        except FileNotFoundError:
+            # Удалён или переименован между scandir и stat
+            continue
+    return entries
+
+
+def expire_entries(entries: Iterable[Tuple[float, str, int]], ttl: float, now: float,
+                   remove: Callable[[str], object] = os.remove,
+                   keep: Callable[[float, str], bool] = lambda mtime, path: False
+                   ) -> Tuple[List[Tuple[float, str, int]], List[Tuple[float, str, int]]]:
+    """Remove entries idle longer than ``ttl``; returns ``(removed, alive)``."""
+    removed, alive = [], []
+    for entry in entries:
+        mtime, path, _ = entry
+        if keep(mtime, path) or now - mtime <= ttl:
+            alive.append(entry)
+            continue
+        try:
+            remove(path)
+        except FileNotFoundError:
+            continue
+        removed.append(entry)
+    return removed, alive
+
+
+def evict_lru(entries: Iterable[Tuple[float, str, int]], max_bytes: int,
+              remove: Callable[[str], object] = os.remove,
+              keep: Callable[[float, str], bool] = lambda mtime, path: False) -> List[Tuple[float, str, int]]:
+    """Remove the least recently used entries until the rest fit in ``max_bytes``.
+
+    ``entries`` are ``(mtime, path, size)`` as returned by scan_entries;
+    entries accepted by ``keep`` are never removed. Returns the removed ones.
+    """
+    entries = sorted(entries)
+    total = sum(size for _, _, size in entries)
+    removed = []
+    for entry in entries:
+        if total <= max_bytes:
+            break
+        mtime, path, size = entry
+        if keep(mtime, path):
+            continue
+        # Исчезнувший файл место уже не занимает
+        total -= size
+        try:
+            remove(path)
+        except FileNotFoundError:
+            continue
+        removed.append(entry)
+    return removed
+
+
+class ArtifactStore:
+    """Files produced by the pipeline (firmware images, flashed copies), with retention.
+
+    Writes go to ``<path>.part`` and are published with a rename, so readers
+    never see a partial file. ``sweep`` removes artifacts idle longer than
+    ``ttl`` and then the least recently used ones until the store fits in
+    ``max_bytes``; artifacts in the referenced set are never removed.
+    """
+
+    def __init__(self, directory: str, ttl: int, max_bytes: int):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.evictions = 0
+        self.expired = 0
+
+    def path(self, kind: str, name: str) -> str:
+        if not kind.isidentifier() or os.path.basename(name) != name or name.endswith(PART_SUFFIX):
+            raise ValueError(f"Invalid artifact name: {kind}/{name}")
+        return os.path.join(self.directory, kind, name)
+
+    def new_path(self, kind: str, prefix: str = "", suffix: str = "") -> str:
+        return self.path(kind, f"{prefix}{uuid.uuid4().hex}{suffix}")
+
+    @contextmanager
+    def writer(self, path: str) -> Iterator:
+        """Open ``path`` for binary writing; it becomes visible only after the block succeeds."""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        part = f"{path}.{uuid.uuid4().hex}{PART_SUFFIX}"
+        try:
+            with open(part, "wb") as f:
+                yield f
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(part, path)
+        except BaseException:
+            if os.path.exists(part):
+                os.remove(part)
+            raise
+
+    def adopt(self, source: str, path: str) -> str:
+        """Publish an already written file (e.g. a spooled upload) at ``path``.
+
+        ``source`` must be on the same filesystem, so the move is an atomic rename.
+        """
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(source, path)
+        return path
+
+    def touch(self, path: str) -> None:
+        """Mark an artifact as recently used (sweep order is by mtime)."""
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+
+    def contains(self, path: Optional[str]) -> bool:
+        return bool(path) and _real(path).startswith(_real(self.directory) + os.sep)
+
+    def _scan(self) -> Tuple[List[Tuple[float, str, int]], List[Tuple[float, str]]]:
+        artifacts, partial = [], []
+        for kind in os.scandir(self.directory):
+            if not kind.is_dir():
+                continue
+            for entry in os.scandir(kind.path):
+                try:
+                    if not entry.is_file():
+                        continue
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                if entry.name.endswith(PART_SUFFIX):
+                    partial.append((stat.st_mtime, entry.path))
+                else:
+                    artifacts.append((stat.st_mtime, entry.path, stat.st_size))
+        return artifacts, partial
+
+    def sweep(self, referenced: Iterable[str] = (), now: Optional[float] = None) -> dict:
+        """Apply TTL and the size quota; returns what was removed."""
+        now = now or time.time()
+        keep: Set[str] = {_real(path) for path in referenced if path}
+        removed = {"expired": 0, "evicted": 0, "partial": 0, "bytes": 0}
+        with self._lock:
+            artifacts, partial = self._scan()
+            for mtime, path in partial:
+                # Запись, не завершённая за grace-период, уже не завершится
+                if now - mtime > SCRATCH_GRACE_SECONDS and _remove(path):
+                    removed["partial"] += 1
+
+            is_referenced = lambda mtime, path: _real(path) in keep
+            expired, alive = expire_entries(artifacts, self.ttl, now, keep=is_referenced)
+            # Только что записанный файл мог ещё не попасть в БД как ссылка
+            evicted = evict_lru(alive, self.max_bytes,
+                                keep=lambda mtime, path: is_referenced(mtime, path) or now - mtime < FRESH_SECONDS)
+            removed["expired"] = len(expired)
+            removed["evicted"] = len(evicted)
+            removed["bytes"] = sum(size for _, _, size in expired + evicted)
+            self.expired += removed["expired"]
+            self.evictions += removed["evicted"]
+        return removed
+
+    def stats(self) -> dict:
+        artifacts, partial = self._scan()
+        return {
+            "artifacts": len(artifacts),
+            "bytes": sum(size for _, _, size in artifacts),
+            "partial": len(partial),
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl,
+            "expired": self.expired,
+            "evictions": self.evictions
+        }
+
+
+def sweep_scratch(tmp_dir: str = PROJECT_TMP_DIR, now: Optional[float] = None) -> int:
+    """Remove abandoned temporary files: stale spooled uploads, work and staging dirs, legacy outputs."""
+    now = now or time.time()
+    removed = 0
+    candidates = []
+    for entry in os.scandir(tmp_dir):
+        # Рабочие каталоги квантизации и файлы старой раскладки tmp (до хранилища артефактов)
+        if entry.name.startswith(("quantize_", "quantized_", "firmware_", "flashed_")):
+            candidates.append(entry)
+    for sub in ("uploads", "models", "quantized", "compiled_layers", "parsed", "analytics"):
+        path = os.path.join(tmp_dir, sub)
+        if os.path.isdir(path):
+            candidates.extend(
+                entry for entry in os.scandir(path)
+                if sub == "uploads" or entry.name.endswith(PART_SUFFIX)
+            )
+    for entry in candidates:
+        try:
+            if now - entry.stat().st_mtime <= SCRATCH_GRACE_SECONDS:
+                continue
+            if entry.is_dir():
+                shutil.rmtree(entry.path, ignore_errors=True)
+            else:
+                os.remove(entry.path)
+            removed += 1
+        except FileNotFoundError:
+            pass
+    return removed
+
+
+def flashed_firmware_path(device_id: str) -> str:
+    return artifact_store.path("flashed", f"{device_id}.bin")
+
+
+def referenced_artifacts(db) -> Set[str]:
+    """Artifacts the workflow still points at: compiled and flashed firmware of known devices."""
+    from app.models.workflow_models import DeviceWorkflowStatus
+
+    referenced = set()
+    for device_id, compiled_firmware in db.query(DeviceWorkflowStatus.device_id,
+                                                 DeviceWorkflowStatus.compiled_firmware):
+        if compiled_firmware:
+            referenced.add(compiled_firmware)
+        try:
+            referenced.add(flashed_firmware_path(device_id))
+        except ValueError:
+            pass
+    return referenced
+
+
+def sweep_once() -> dict:
+    """One pass of the background sweeper over everything the backend keeps in tmp."""
+    from app.database import SessionLocal
+    from app.services.model_store import sweep_models
+    from app.services.quantization_jobs import quantization_jobs
+
+    db = SessionLocal()
+    try:
+        referenced = referenced_artifacts(db)
+    finally:
+        db.close()
+    removed = artifact_store.sweep(referenced)
+    removed["scratch"] = sweep_scratch()
+    removed["models"] = sweep_models()
+    quantization_jobs.evict()
+    quantization_jobs.expire_jobs()
+    if removed["expired"] or removed["evicted"] or removed["scratch"] or removed["models"]["bytes"]:
+        logger.info("Artifact sweep: %s", removed)
+    return removed
+
+
+async def run_sweeper(sweep: Callable[[], dict] = sweep_once, interval: int = ARTIFACT_SWEEP_INTERVAL) -> None:
+    """Call ``sweep`` in a worker thread every ``interval`` seconds until cancelled."""
+    while True:
+        try:
+            await asyncio.to_thread(sweep)
+        except Exception:
+            logger.exception("Artifact sweep failed")
+        await asyncio.sleep(interval)
+
+
+artifact_store = ArtifactStore(ARTIFACTS_DIR, ARTIFACT_TTL_SECONDS, ARTIFACTS_MAX_BYTES)
@@ -0,0 +1,270 @@
+import hashlib
+import json
+import os
+import tempfile
+import zipfile
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+
+from app.services.artifact_store import PROJECT_TMP_DIR
+
+# Диапазоны калибровки кэшируются по (хэш модели, хэш датасета, метод)
+CALIBRATION_CACHE_DIR = os.path.join(PROJECT_TMP_DIR, 'calibration')
+os.makedirs(CALIBRATION_CACHE_DIR, exist_ok=True)
+
+CALIBRATION_METHODS = ("minmax", "entropy", "percentile")
+# Сколько батчей прогоняется через калибратор за один collect_data: промежуточные
+# выходы модели копятся в памяти только в пределах этого окна
+CALIBRATION_WINDOW_BATCHES = int(os.getenv("CALIBRATION_WINDOW_BATCHES", 8))
+
+
+def dataset_id(file_hashes: List[str]) -> str:
+    """Content id of a calibration dataset made of one or more uploaded files (order matters)."""
+    if len(file_hashes) == 1:
+        return file_hashes[0]
+    return hashlib.sha256("\n".join(file_hashes).encode()).hexdigest()
+
+
+def calibration_cache_path(model_id: str, dataset_hash: str, method: str, op_types: List[str]) -> str:
+    key = hashlib.sha256(json.dumps({
+        "model": model_id,
+        "dataset": dataset_hash,
+        "method": method,
+        "op_types": sorted(op_types)
+    }).encode()).hexdigest()
+    return os.path.join(CALIBRATION_CACHE_DIR, f"{key}.json")
+
+
+def _read_npy_header(stream):
+    version = np.lib.format.read_magic(stream)
+    if version == (1, 0):
+        shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(stream)
+    else:
+        shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(stream)
+    if fortran_order:
+        raise ValueError("Fortran-ordered arrays are not supported in datasets")
+    if not shape:
+        raise ValueError("Dataset arrays need a leading sample dimension")
+    return shape, dtype
+
+
+def iter_npz_batches(path: str, batch_size: int) -> Iterator[Dict[str, np.ndarray]]:
+    """Read an .npz member by member, batch_size rows at a time, without loading whole arrays."""
+    with zipfile.ZipFile(path) as archive:
+        streams = {}
+        try:
+            for member in archive.namelist():
+                if member.endswith(".npy"):
+                    streams[member[:-4]] = archive.open(member)
+            headers = {key: _read_npy_header(stream) for key, stream in streams.items()}
+            sample_counts = {shape[0] for shape, _ in headers.values()}
+            if len(sample_counts) != 1:
+                raise ValueError(f"Arrays in {os.path.basename(path)} have different sample counts")
+            total = sample_counts.pop()
+
+            for start in range(0, total, batch_size):
+                count = min(batch_size, total - start)
+                batch = {}
+                for key, stream in streams.items():
+                    shape, dtype = headers[key]
+                    row_size = int(np.prod(shape[1:]))
+                    data = stream.read(count * row_size * dtype.itemsize)
+                    batch[key] = np.frombuffer(data, dtype=dtype).reshape((count,) + tuple(shape[1:]))
+                yield batch
+        finally:
+            for stream in streams.values():
+                stream.close()
+
+
+def iter_npy_batches(path: str, input_name: str, batch_size: int) -> Iterator[Dict[str, np.ndarray]]:
+    data = np.load(path, mmap_mode="r")
+    for start in range(0, data.shape[0], batch_size):
+        yield {input_name: np.asarray(data[start:start + batch_size])}
+
+
+def iter_calibration_batches(dataset_paths: List[str], inputs: Dict[str, tuple],
+                             batch_size: int) -> Iterator[Dict[str, np.ndarray]]:
+    """Stream model feeds from .npz (one array per input) or .npy (single-input models) files.
+
+    ``inputs`` maps model input names to (numpy dtype, fixed batch dim or None).
+    Arrays are cast to the input dtype; a model with a fixed batch dimension
+    gets batches of exactly that size.
+    """
+    fixed_batch = next((batch for _, batch in inputs.values() if batch), None)
+    if fixed_batch:
+        batch_size = fixed_batch
+
+    for path in dataset_paths:
+        if path.endswith(".npy"):
+            if len(inputs) != 1:
+                raise ValueError(".npy calibration data is only supported for single-input models")
+            batches = iter_npy_batches(path, next(iter(inputs)), batch_size)
+        else:
+            batches = iter_npz_batches(path, batch_size)
+
+        for batch in batches:
+            missing = set(inputs) - set(batch)
+            if missing:
+                raise ValueError(f"Calibration data has no arrays for inputs: {sorted(missing)}")
+            feed = {name: batch[name].astype(dtype, copy=False) for name, (dtype, _) in inputs.items()}
+            # Неполный последний батч для модели с фиксированным batch пропускаем
+            if fixed_batch and next(iter(feed.values())).shape[0] != fixed_batch:
+                continue
+            yield feed
+
+
+def _model_inputs(model) -> Dict[str, tuple]:
+    import onnx
+
+    initializers = {init.name for init in model.graph.initializer}
+    inputs = {}
+    for graph_input in model.graph.input:
+        if graph_input.name in initializers:
+            continue
+        tensor_type = graph_input.type.tensor_type
+        dtype = np.dtype(onnx.helper.tensor_dtype_to_np_dtype(tensor_type.elem_type))
+        dims = tensor_type.shape.dim
+        fixed_batch = dims[0].dim_value if dims and dims[0].HasField("dim_value") else None
+        inputs[graph_input.name] = (dtype, fixed_batch)
+    return inputs
+
+
+def _save_ranges(path: str, tensors_range) -> None:
+    ranges = {
+        name: [np.asarray(data.lowest).tolist(), np.asarray(data.highest).tolist()]
+        for name, data in tensors_range.data.items()
+    }
+    with open(f"{path}.part", "w") as f:
+        json.dump(ranges, f)
+    os.replace(f"{path}.part", path)
+
+
+def _load_ranges(path: str, calibrate_method):
+    from onnxruntime.quantization.calibrate import TensorData, TensorsData
+
+    with open(path) as f:
+        ranges = json.load(f)
+    return TensorsData(calibrate_method, {
+        name: TensorData(lowest=np.array(lowest, dtype=np.float32), highest=np.array(highest, dtype=np.float32))
+        for name, (lowest, highest) in ranges.items()
+    })
+
+
+def compute_tensor_ranges(model_path: str, dataset_paths: List[str], method: str, op_types: List[str],
+                          batch_size: int, use_external_data_format: bool, cache_path: Optional[str] = None,
+                          on_batch=None):
+    """Run calibration over a streamed dataset and return the TensorsData ranges.
+
+    Batches are fed to the calibrator in windows of CALIBRATION_WINDOW_BATCHES,
+    so memory stays bounded regardless of dataset size. Histogram calibrators
+    (entropy, percentile) accumulate across collect_data calls themselves;
+    for MinMax the ranges of each window are merged here and the calibrator
+    is reset, since ORT 1.16 fails to merge them. Results are read from and
+    written to ``cache_path`` when given.
+    """
+    from onnxruntime.quantization import CalibrationDataReader, CalibrationMethod, create_calibrator
+    from onnxruntime.quantization.calibrate import TensorData, TensorsData
+    from app.services.onnx_parser import load_model_structure
+
+    calibrate_method = {
+        "minmax": CalibrationMethod.MinMax,
+        "entropy": CalibrationMethod.Entropy,
+        "percentile": CalibrationMethod.Percentile
+    }[method]
+    if cache_path and os.path.exists(cache_path):
+        return _load_ranges(cache_path, calibrate_method), True
+
+    batches = iter_calibration_batches(dataset_paths, _model_inputs(load_model_structure(model_path)), batch_size)
+    pending = next(batches, None)
+    if pending is None:
+        raise ValueError("Calibration dataset is empty")
+
+    def batch_shape(feed):
+        return tuple(array.shape for array in feed.values())
+
+    class WindowReader(CalibrationDataReader):
+        """Up to CALIBRATION_WINDOW_BATCHES batches of one shape (ORT stacks a window's outputs)."""
+
+        def __init__(self):
+            self.remaining = CALIBRATION_WINDOW_BATCHES
+            self.shape = batch_shape(pending)
+
+        def get_next(self):
+            nonlocal pending
+            if self.remaining == 0 or pending is None or batch_shape(pending) != self.shape:
+                return None
+            feed, pending = pending, next(batches, None)
+            self.remaining -= 1
+            if on_batch:
+                on_batch()
+            return feed
+
+    with tempfile.TemporaryDirectory(prefix="calibration_") as augment_dir:
+        calibrator = create_calibrator(
+            model_path,
+            op_types,
+            augmented_model_path=os.path.join(augment_dir, "augmented_model.onnx"),
+            calibrate_method=calibrate_method,
+            use_external_data_format=use_external_data_format
+        )
+        minmax_ranges = {}
+        while pending is not None:
+            calibrator.collect_data(WindowReader())
+            if calibrate_method == CalibrationMethod.MinMax:
+                # MinMaxCalibrater в onnxruntime 1.16 падает при слиянии диапазонов между
+                # вызовами collect_data, поэтому сливаем min/max сами и сбрасываем его состояние
+                for name, data in calibrator.calibrate_tensors_range.data.items():
+                    lowest, highest = minmax_ranges.get(name, (data.lowest, data.highest))
+                    minmax_ranges[name] = (min(lowest, data.lowest), max(highest, data.highest))
+                calibrator.calibrate_tensors_range = None
+
+        if calibrate_method == CalibrationMethod.MinMax:
+            tensors_range = TensorsData(calibrate_method, {
+                name: TensorData(lowest=np.float32(lowest), highest=np.float32(highest))
+                for name, (lowest, highest) in minmax_ranges.items()
+            })
+        else:
+            tensors_range = calibrator.compute_data()
+        del calibrator
+
+    if cache_path:
+        _save_ranges(cache_path, tensors_range)
+    return tensors_range, False
+
+
+def quantize_static_with_ranges(model_path: str, quantized_path: str, weight_type, tensors_range,
+                                op_types: List[str], use_external_data_format: bool) -> None:
+    """QDQ static quantization from precomputed calibration ranges.
+
+    Same steps as onnxruntime's quantize_static after its calibration stage,
+    which lets cached ranges be reused instead of re-running the dataset.
+    """
+    from onnxruntime.quantization import QDQQuantizer, QuantizationMode, QuantType
+    from onnxruntime.quantization.quant_utils import load_model_with_shape_infer
+    from pathlib import Path
+
+    model = load_model_with_shape_infer(Path(model_path))
+    # Только именованные аргументы: порядок параметров QDQQuantizer менялся между версиями onnxruntime
+    quantizer = QDQQuantizer(
+        model=model,
+        per_channel=False,
+        reduce_range=False,
+        mode=QuantizationMode.QLinearOps,
+        static=True,
+        weight_qType=weight_type,
+        activation_qType=QuantType.QUInt8,
+        tensors_range=tensors_range,
+        nodes_to_quantize=[],
+        nodes_to_exclude=[],
+        op_types_to_quantize=op_types,
+        extra_options={}
+    )
+    quantizer.quantize_model()
+    quantizer.model.save_model_to_file(quantized_path, use_external_data_format)
+
+
+def default_op_types() -> List[str]:
+    from onnxruntime.quantization.registry import QDQRegistry, QLinearOpsRegistry
+
+    return sorted(set(QLinearOpsRegistry) | set(QDQRegistry))
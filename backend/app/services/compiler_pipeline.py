@@ -0,0 +1,607 @@
+import hashlib
+import json
+import os
+import time
+from typing import BinaryIO, Dict, List, NamedTuple, Optional, Sequence, Set, Type
+
+import numpy as np
+import onnx
+from google.protobuf.message import DecodeError
+from onnx import helper, numpy_helper
+
+from app.services import firmware, weight_packing
+from app.services.layer_cache import layer_cache, layer_key, weight_digest
+from app.services.device_state import crossbar_shape
+from app.services.onnx_parser import is_external, load_model_structure, tensor_array
+
+# Операторы, веса которых отображаются на кроссбары
+CROSSBAR_OPS = {"Conv", "Gemm", "MatMul"}
+# Активации, сливаемые с предшествующим кроссбарным слоем: ONNX-оператор -> имя в supported_activations
+ACTIVATIONS = {"Relu": "relu", "LeakyRelu": "leaky_relu", "Sigmoid": "sigmoid", "Tanh": "tanh", "Clip": "clip",
+               "HardSigmoid": "hard_sigmoid", "Elu": "elu", "Selu": "selu", "Softplus": "softplus"}
+# Остальные вычислительные операторы -> имя в supported_layers
+LAYER_NAMES = {"MaxPool": "maxpool", "GlobalMaxPool": "maxpool", "AveragePool": "avgpool",
+               "GlobalAveragePool": "avgpool", "BatchNormalization": "batchnorm", "ConvTranspose": "conv_transpose",
+               "Add": "add", "Sub": "sub", "Mul": "mul", "Div": "div", "Concat": "concat", "Softmax": "softmax",
+               "LRN": "lrn", "Pad": "pad", "Resize": "resize", "Upsample": "resize"}
+# Перестановка и переименование данных: исполняются без вычислений, поддержка не проверяется
+LAYOUT_OPS = {"Reshape", "Flatten", "Squeeze", "Unsqueeze", "Identity", "Transpose", "Dropout", "Cast", "Shape",
+              "Slice", "Split", "Gather", "Expand", "Constant"}
+# Не сворачиваются даже при константных входах
+NEVER_FOLD = {"RandomNormal", "RandomUniform", "RandomNormalLike", "RandomUniformLike", "Multinomial", "If", "Loop",
+              "Scan", "Bernoulli"}
+# Результат свёртки констант больше этого числа элементов не материализуется
+CONSTANT_FOLDING_MAX_ELEMENTS = 16 * 1024 * 1024
+# Граф для исполнения на хосте встраивается в прошивку, только если веса меньше лимита protobuf (2 ГБ)
+EMBED_GRAPH_MAX_BYTES = 1536 * 1024 * 1024
+
+PLACEMENT_FIELDS = ("layer", "group", "row_block", "col_block", "core", "wave")
+
+# Ожидаемые отказы проходов (битый protobuf, нечитаемые external data, несогласованные формы весов,
+# нехватка памяти при упаковке) превращаются в CompileError с частичным отчётом
+PASS_ERRORS = (DecodeError, OSError, ValueError, KeyError, IndexError, MemoryError)
+
+DEFAULT_PASSES = ("load_graph", "constant_folding", "fuse_conv_bn_relu", "check_support", "tile_weights",
+                  "emit_firmware")
+
+
+class CompileError(Exception):
+    def __init__(self, message: str, report: Optional[dict] = None):
+        super().__init__(message)
+        self.report = report or {}
+
+
+class CompileTarget(NamedTuple):
+    device_id: str
+    core_count: int
+    usable_cores: List[int]  # ядра без статуса faulty, по порядку
+    crossbar_rows: int
+    crossbar_cols: int
+    supported_layers: Set[str]
+    supported_activations: Set[str]
+    sparsity_support: bool
+
+    @classmethod
+    def from_device(cls, device, faulty_cores: Sequence[int] = ()) -> "CompileTarget":
+        rows, cols = crossbar_shape(device.memristors_per_core or 0)
+        faulty = set(faulty_cores)
+        return cls(
+            device_id=device.id,
+            core_count=device.core_count or 0,
+            usable_cores=[core for core in range(device.core_count or 0) if core not in faulty],
+            crossbar_rows=rows,
+            crossbar_cols=cols,
+            supported_layers={name.lower() for name in device.supported_layers or []},
+            supported_activations={name.lower() for name in device.supported_activations or []},
+            sparsity_support=bool(device.sparsity_support)
+        )
+
+    def describe(self) -> dict:
+        info = self._asdict()
+        info["usable_cores"] = len(self.usable_cores)
+        info["supported_layers"] = sorted(self.supported_layers)
+        info["supported_activations"] = sorted(self.supported_activations)
+        return info
+
+
+class _HashingWriter:
+    def __init__(self, f: BinaryIO):
+        self.f = f
+        self.hasher = hashlib.sha256()
+
+    def write(self, chunk) -> None:
+        self.hasher.update(chunk)
+        self.f.write(chunk)
+
+
+class CompileContext:
+    """State threaded through the passes: the graph being rewritten, placement and the output image."""
+
+    def __init__(self, model_path: str, target: CompileTarget, output: Optional[BinaryIO], strict: bool,
+                 incremental: bool = True):
+        self.model_path = model_path
+        self.model_dir = os.path.dirname(model_path)
+        self.target = target
+        self.output = output
+        self.strict = strict
+        self.incremental = incremental
+        self.model: Optional[onnx.ModelProto] = None
+        self.nodes: List[onnx.NodeProto] = []
+        self.initializers: Dict[str, onnx.TensorProto] = {}
+        # Значения констант: загруженные initializers и результаты свёртки/слияния
+        self.arrays: Dict[str, np.ndarray] = {}
+        self.graph_outputs: Set[str] = set()
+        self.fused_activation: Dict[str, str] = {}  # узел слоя -> имя слившейся активации
+        self.fused_nodes: Set[str] = set()
+        self.placement: Dict[str, str] = {}  # узел -> crossbar | digital | layout | fused | host
+        self.layers: List[dict] = []
+        self.tile_chunks: List[np.ndarray] = []
+        self.bias_chunks: List[np.ndarray] = []
+        self.placement_rows: List[np.ndarray] = []
+        self.warnings: List[str] = []
+        self.errors: List[str] = []
+        self.passes: List[dict] = []
+        self.firmware: dict = {}
+        self.sparsity: dict = {}
+
+    def is_constant(self, name: str) -> bool:
+        return name in self.arrays or name in self.initializers
+
+    def array(self, name: str) -> np.ndarray:
+        if name not in self.arrays:
+            self.arrays[name] = tensor_array(self.initializers[name], self.model_dir)
+        return self.arrays[name]
+
+    def weight_digest(self, name: str) -> str:
+        memo_key = None
+        if name in self.initializers:
+            # Исходные веса неизменны, пока не изменился файл модели: хэш запоминается
+            stat = os.stat(self.model_path)
+            memo_key = (os.path.realpath(self.model_path), stat.st_mtime_ns, stat.st_size, name)
+        return weight_digest(self.array(name), memo_key)
+
+    def consumers(self) -> Dict[str, List[onnx.NodeProto]]:
+        index: Dict[str, List[onnx.NodeProto]] = {}
+        for node in self.nodes:
+            for name in node.input:
+                if name:
+                    index.setdefault(name, []).append(node)
+        return index
+
+    def weight_layer_name(self, node: onnx.NodeProto) -> Optional[str]:
+        """Device layer name of a crossbar op with a constant weight, or None."""
+        if node.op_type not in CROSSBAR_OPS or len(node.input) < 2 or not self.is_constant(node.input[1]):
+            return None
+        rank = self.arrays[node.input[1]].ndim if node.input[1] in self.arrays \
+            else len(self.initializers[node.input[1]].dims)
+        # Вес другой размерности на кроссбар не ложится: узел уходит на цифровой блок или хост
+        if node.op_type == "Conv":
+            return f"conv{rank - 2}d" if rank >= 3 else None
+        if rank < 2 or (node.op_type == "Gemm" and rank != 2):
+            return None
+        return "fc"
+
+    def report(self) -> dict:
+        tiles = sum(layer["tiles"] for layer in self.layers)
+        dense_tiles = sum(layer["dense_tiles"] for layer in self.layers)
+        cores = len(self.target.usable_cores)
+        cells = self.target.crossbar_rows * self.target.crossbar_cols
+        counts: Dict[str, int] = {}
+        for placement in self.placement.values():
+            counts[placement] = counts.get(placement, 0) + 1
+        return {
+            "target": self.target.describe(),
+            "passes": self.passes,
+            "summary": {
+                "nodes": len(self.nodes),
+                "placement": counts,
+                "layers": len(self.layers),
+                "layers_reused": sum(layer["reused"] for layer in self.layers),
+                "tiles": tiles,
+                "waves": -(-tiles // cores) if cores else 0,
+                "weights": sum(layer["k"] * layer["n"] * layer["groups"] for layer in self.layers),
+                # Доля мемристоров под весами в плотной раскладке (пустые тайлы учитываются в sparsity)
+                "memristor_utilization": (
+                    sum(layer["k"] * layer["n"] * layer["groups"] for layer in self.layers) / (dense_tiles * cells)
+                    if dense_tiles and cells else 0.0
+                )
+            },
+            "sparsity": self.sparsity,
+            "layers": self.layers,
+            "firmware": self.firmware,
+            "warnings": self.warnings,
+            "errors": self.errors
+        }
+
+
+class CompilerPass:
+    """One step of the pipeline; ``run`` mutates the context and may return stats for the report."""
+    name = ""
+
+    def run(self, ctx: CompileContext) -> Optional[dict]:
+        raise NotImplementedError
+
+
+PASSES: Dict[str, Type[CompilerPass]] = {}
+
+
+def register_pass(cls: Type[CompilerPass]) -> Type[CompilerPass]:
+    PASSES[cls.name] = cls
+    return cls
+
+
+@register_pass
+class LoadGraph(CompilerPass):
+    name = "load_graph"
+
+    def run(self, ctx):
+        # Веса external data не читаются: initializers загружаются по требованию (memmap)
+        ctx.model = load_model_structure(ctx.model_path)
+        graph = ctx.model.graph
+        ctx.initializers = {init.name: init for init in graph.initializer}
+        ctx.graph_outputs = {output.name for output in graph.output}
+        used: Set[str] = set()
+        for i, node in enumerate(graph.node):
+            # Имена узлов нужны для размещения и отчёта
+            if not node.name or node.name in used:
+                node.name = f"{node.op_type}_{i}"
+            used.add(node.name)
+        ctx.nodes = list(graph.node)
+        return {"nodes": len(ctx.nodes), "initializers": len(ctx.initializers)}
+
+
+@register_pass
+class ConstantFolding(CompilerPass):
+    name = "constant_folding"
+
+    def run(self, ctx):
+        from onnx.reference import ReferenceEvaluator
+
+        kept, folded = [], 0
+        for node in ctx.nodes:
+            inputs = [name for name in node.input if name]
+            foldable = (
+                node.op_type not in NEVER_FOLD
+                and node.domain in ("", "ai.onnx")
+                and all(ctx.is_constant(name) for name in inputs)
+                and not any(output in ctx.graph_outputs for output in node.output)
+                and (inputs or node.op_type == "Constant")
+            )
+            if foldable:
+                try:
+                    values = ReferenceEvaluator(node).run(None, {name: ctx.array(name) for name in inputs})
+                except Exception:
+                    values = None
+                if values is not None and all(np.asarray(value).size <= CONSTANT_FOLDING_MAX_ELEMENTS
+                                              for value in values):
+                    for output, value in zip(node.output, values):
+                        ctx.arrays[output] = np.asarray(value)
+                    folded += 1
+                    continue
+            kept.append(node)
+        ctx.nodes = kept
+        return {"folded": folded}
+
+
+@register_pass
+class FuseConvBnRelu(CompilerPass):
+    """Fold BatchNormalization into the preceding Conv's weights and bias, then fuse activations into layers."""
+    name = "fuse_conv_bn_relu"
+
+    def _fold_batchnorm(self, ctx: CompileContext, conv: onnx.NodeProto, bn: onnx.NodeProto) -> bool:
+        if len(bn.input) < 5 or not all(ctx.is_constant(name) for name in bn.input[1:5]):
+            return False
+        if len(conv.input) < 2 or not ctx.is_constant(conv.input[1]):
+            return False
+        epsilon = next((attr.f for attr in bn.attribute if attr.name == "epsilon"), 1e-5)
+        gamma, beta, mean, var = (ctx.array(name).astype(np.float64) for name in bn.input[1:5])
+        weight = ctx.array(conv.input[1])
+        scale = gamma / np.sqrt(var + epsilon)
+        bias = ctx.array(conv.input[2]).astype(np.float64) if len(conv.input) > 2 and conv.input[2] \
+            else np.zeros(weight.shape[0])
+
+        # Новые имена: исходные веса могут использоваться другими узлами
+        weight_name, bias_name = f"{conv.name}.fused_weight", f"{conv.name}.fused_bias"
+        ctx.arrays[weight_name] = (weight * scale.reshape((-1,) + (1,) * (weight.ndim - 1))).astype(weight.dtype)
+        ctx.arrays[bias_name] = ((bias - mean) * scale + beta).astype(weight.dtype)
+        data_input = conv.input[0]
+        del conv.input[:]
+        conv.input.extend([data_input, weight_name, bias_name])
+        # Выход свёртки получает имя выхода BN: потребители BN читают его напрямую
+        conv.output[0] = bn.output[0]
+        return True
+
+    def run(self, ctx):
+        consumers = ctx.consumers()
+        removed: Set[str] = set()
+        folded = fused = 0
+        for node in ctx.nodes:
+            if node.name in removed or node.op_type != "Conv" or node.output[0] in ctx.graph_outputs:
+                continue
+            users = consumers.get(node.output[0], [])
+            if len(users) == 1 and users[0].op_type == "BatchNormalization" and self._fold_batchnorm(ctx, node, users[0]):
+                removed.add(users[0].name)
+                folded += 1
+        ctx.nodes = [node for node in ctx.nodes if node.name not in removed]
+
+        consumers = ctx.consumers()
+        for node in ctx.nodes:
+            if ctx.weight_layer_name(node) is None or node.output[0] in ctx.graph_outputs:
+                continue
+            users = consumers.get(node.output[0], [])
+            if len(users) == 1 and users[0].op_type in ACTIVATIONS:
+                activation = users[0]
+                # В графе активация остаётся (ONNX без fused-операторов), на устройстве — в том же ядре
+                ctx.fused_activation[node.name] = _activation_name(ctx, activation)
+                ctx.fused_nodes.add(activation.name)
+                fused += 1
+        return {"batchnorm_folded": folded, "activations_fused": fused}
+
+
+def _activation_name(ctx: CompileContext, node: onnx.NodeProto) -> str:
+    if node.op_type == "Clip":
+        bounds = [float(ctx.array(name)) if name and ctx.is_constant(name) else None for name in node.input[1:3]]
+        bounds += [None] * (2 - len(bounds))
+        for attr in node.attribute:
+            if attr.name == "min":
+                bounds[0] = attr.f
+            elif attr.name == "max":
+                bounds[1] = attr.f
+        if bounds == [0.0, 6.0]:
+            return "relu6"
+    return ACTIVATIONS[node.op_type]
+
+
+@register_pass
+class CheckSupport(CompilerPass):
+    """Check every op against Device.supported_layers / supported_activations and assign it a unit."""
+    name = "check_support"
+
+    def run(self, ctx):
+        target = ctx.target
+        unsupported: Dict[str, int] = {}
+        for node in ctx.nodes:
+            layer_name = ctx.weight_layer_name(node)
+            if node.name in ctx.fused_nodes:
+                placement, required = "fused", None
+            elif node.op_type in LAYOUT_OPS:
+                placement, required = "layout", None
+            elif layer_name is not None:
+                placement, required = "crossbar", layer_name
+                activation = ctx.fused_activation.get(node.name)
+                if activation and activation not in target.supported_activations:
+                    unsupported[activation] = unsupported.get(activation, 0) + 1
+            elif node.op_type in ACTIVATIONS:
+                placement, required = "digital", _activation_name(ctx, node)
+            else:
+                placement, required = "digital", LAYER_NAMES.get(node.op_type, node.op_type.lower())
+
+            if required is not None:
+                supported = target.supported_activations if node.op_type in ACTIVATIONS else target.supported_layers
+                if required not in supported:
+                    unsupported[required] = unsupported.get(required, 0) + 1
+                    placement = "host"
+            ctx.placement[node.name] = placement
+
+        for name, count in sorted(unsupported.items()):
+            message = f"'{name}' is not supported by the device ({count} node(s))"
+            # Без strict неподдерживаемые узлы остаются хосту, с strict — ошибка компиляции
+            (ctx.errors if ctx.strict else ctx.warnings).append(message)
+        if ctx.errors:
+            raise CompileError("Model uses operators the device does not support", ctx.report())
+        return {"unsupported": sum(unsupported.values())}
+
+
+def layer_matrices(op_type: str, weight: np.ndarray, attributes: dict) -> np.ndarray:
+    """Weights of a crossbar layer as [groups, K inputs, N outputs] matrices."""
+    if op_type == "Conv":
+        groups = int(attributes.get("group", 1))
+        out_channels = weight.shape[0]
+        if groups < 1 or out_channels % groups:
+            raise ValueError(f"Conv with {out_channels} output channels cannot be split into {groups} groups")
+        # [M, C/g, kh, kw] -> g x [C/g * kh * kw, M/g]
+        return weight.reshape(groups, out_channels // groups, -1).transpose(0, 2, 1)
+    if op_type == "Gemm" and attributes.get("transB", 0):
+        weight = weight.T
+    if weight.ndim == 2:
+        return weight[np.newaxis]
+    return weight.reshape(-1, weight.shape[-2], weight.shape[-1])
+
+
+def _attributes(node: onnx.NodeProto) -> dict:
+    return {attr.name: helper.get_attribute_value(attr) for attr in node.attribute
+            if attr.type in (onnx.AttributeProto.INT, onnx.AttributeProto.FLOAT)}
+
+
+@register_pass
+class TileWeights(CompilerPass):
+    """Quantize crossbar layers' weights into crossbar-sized tiles and place them on the usable cores."""
+    name = "tile_weights"
+
+    def run(self, ctx):
+        target = ctx.target
+        rows, cols = target.crossbar_rows, target.crossbar_cols
+        layers = [node for node in ctx.nodes if ctx.placement.get(node.name) == "crossbar"]
+        if layers and not (rows and target.usable_cores):
+            raise CompileError("Device has no usable crossbars", ctx.report())
+
+        cores = np.asarray(target.usable_cores, dtype=np.int64)
+        tile_offset = bias_offset = next_tile = 0
+        tile_bytes = weight_packing.tile_bytes(rows, cols)
+        keys: List[str] = []
+        dense_tiles = empty_tiles = zero_blocks = total_blocks = dense_bytes = 0
+        # Поля цели, от которых зависят байты тайлов; ядра и размещение пересчитываются всегда
+        tile_format = (rows, cols, np.dtype(weight_packing.WEIGHT_DTYPE).name)
+        for index, node in enumerate(layers):
+            attributes = _attributes(node)
+            weight = ctx.array(node.input[1])
+            matrices = layer_matrices(node.op_type, weight, attributes)
+            key = layer_key(node.op_type, attributes, ctx.weight_digest(node.input[1]), tile_format)
+            # Неизменившийся слой (те же веса, атрибуты и размер кроссбара) берётся из кэша
+            packed = layer_cache.get(key) if ctx.incremental else None
+            reused = packed is not None
+            if packed is None:
+                packed = weight_packing.pack_layer(matrices, rows, cols)
+                if ctx.incremental:
+                    layer_cache.put(key, packed)
+            keys.append(key)
+            groups, k, n = matrices.shape
+            row_blocks, col_blocks = weight_packing.tile_grid(matrices.shape, rows, cols)
+            sparse = weight_packing.block_sparse(packed, rows, cols, weight_packing.COMPILER_SPARSITY_THRESHOLD)
+            # Разреженный формат — только если устройство его поддерживает и он короче плотного
+            encoded = target.sparsity_support and sparse.nbytes < packed.nbytes
+            stored = np.flatnonzero(sparse.stored) if encoded else np.arange(len(packed))
+            count = len(stored)
+
+            # Тайлы раздаются ядрам по кругу через всю модель; не поместившиеся — следующей волной.
+            # Пустые тайлы разреженного слоя на кроссбары не отображаются
+            sequence = np.arange(next_tile, next_tile + count)
+            placement = np.empty((count, len(PLACEMENT_FIELDS)), dtype="<i4")
+            placement[:, 0] = index
+            placement[:, 1] = stored // (row_blocks * col_blocks)
+            placement[:, 2] = stored // col_blocks % row_blocks
+            placement[:, 3] = stored % col_blocks
+            placement[:, 4] = cores[sequence % len(cores)]
+            placement[:, 5] = sequence // len(cores)
+            next_tile += count
+            dense_tiles += len(packed)
+            empty_tiles += int(len(packed) - sparse.stored.sum())
+            zero_blocks += sparse.zero_blocks
+            total_blocks += sparse.blocks
+            dense_bytes += packed.nbytes
+
+            bias = None
+            bias_input = node.input[2] if len(node.input) > 2 and node.op_type != "MatMul" else ""
+            if bias_input and ctx.is_constant(bias_input):
+                bias = np.ascontiguousarray(ctx.array(bias_input), dtype="<f4").reshape(-1)
+            chunks = sparse.chunks if encoded else [packed]
+            encoded_bytes = sparse.nbytes if encoded else packed.nbytes
+            ctx.tile_chunks.extend(chunks)
+            ctx.placement_rows.append(placement)
+            if bias is not None:
+                ctx.bias_chunks.append(bias)
+            ctx.layers.append({
+                "name": node.name,
+                "op_type": node.op_type,
+                "k": int(k),
+                "n": int(n),
+                "groups": int(groups),
+                "activation": ctx.fused_activation.get(node.name),
+                "reused": reused,
+                "cache_key": key,
+                "encoding": "block_sparse" if encoded else "dense",
+                "tiles": count,
+                "dense_tiles": len(packed),
+                "tile_offset": tile_offset,
+                "tile_bytes": tile_bytes,
+                "encoded_bytes": encoded_bytes,
+                "block_shape": list(sparse.block_shape) if encoded else None,
+                "zero_blocks": sparse.zero_blocks,
+                "bias_offset": bias_offset if bias is not None else None,
+                "bias_length": int(bias.size) if bias is not None else 0,
+                "cores": int(len(np.unique(placement[:, 4]))),
+                "first_wave": int(placement[0, 5]) if count else 0,
+                "last_wave": int(placement[-1, 5]) if count else 0
+            })
+            tile_offset += encoded_bytes
+            if bias is not None:
+                bias_offset += bias.nbytes
+        if ctx.incremental and keys:
+            layer_cache.evict(keep=keys)
+        reused = sum(layer["reused"] for layer in ctx.layers)
+
+        # Оценка ускорения: время кроссбаров определяется числом волн перепрограммирования ядер
+        dense_waves = -(-dense_tiles // len(cores)) if len(cores) else 0
+        sparse_waves = -(-next_tile // len(cores)) if len(cores) else 0
+        ctx.sparsity = {
+            "supported": target.sparsity_support,
+            "threshold": weight_packing.COMPILER_SPARSITY_THRESHOLD,
+            "encoded_layers": sum(layer["encoding"] == "block_sparse" for layer in ctx.layers),
+            "zero_blocks": zero_blocks,
+            "block_sparsity": zero_blocks / total_blocks if total_blocks else 0.0,
+            "dense_tiles": dense_tiles,
+            "empty_tiles": empty_tiles,
+            "tiles_skipped": dense_tiles - next_tile,
+            "memristors_saved": (dense_tiles - next_tile) * rows * cols,
+            "dense_bytes": dense_bytes,
+            "encoded_bytes": tile_offset,
+            "compression": dense_bytes / tile_offset if tile_offset else 1.0,
+            "estimated_speedup": dense_waves / sparse_waves if sparse_waves else 1.0
+        }
+        return {"layers": len(layers), "tiles": next_tile, "reused": reused, "compiled": len(layers) - reused,
+                "tiles_skipped": dense_tiles - next_tile}
+
+
+@register_pass
+class EmitFirmware(CompilerPass):
+    """Write the firmware image: layout metadata, packed tiles, biases, placement and the runnable graph."""
+    name = "emit_firmware"
+
+    def _graph_model(self, ctx: CompileContext) -> Optional[bytes]:
+        graph = ctx.model.graph
+        used = {name for node in ctx.nodes for name in node.input if name} | ctx.graph_outputs
+        constants = [name for name in used if ctx.is_constant(name)]
+        size = 0
+        for name in constants:
+            if name in ctx.arrays:
+                size += ctx.arrays[name].nbytes
+            else:
+                init = ctx.initializers[name]
+                size += int(np.prod(init.dims)) * np.dtype(helper.tensor_dtype_to_np_dtype(init.data_type)).itemsize
+        if size > EMBED_GRAPH_MAX_BYTES:
+            ctx.warnings.append("Weights are too large to embed a host-runnable graph in the firmware")
+            return None
+
+        # Граф собирается на месте: initializers исходной модели не копируются и не перекодируются
+        for i in reversed(range(len(graph.initializer))):
+            if graph.initializer[i].name not in used:
+                del graph.initializer[i]
+        for init in graph.initializer:
+            if is_external(init):
+                init.CopyFrom(numpy_helper.from_array(np.array(ctx.array(init.name)), init.name))
+        graph.initializer.extend(
+            numpy_helper.from_array(np.asarray(ctx.arrays[name]), name)
+            for name in sorted(constants) if name not in ctx.initializers
+        )
+        nodes = []
+        for node in ctx.nodes:
+            nodes.append(onnx.NodeProto())
+            nodes[-1].CopyFrom(node)
+        del graph.node[:]
+        graph.node.extend(nodes)
+        # Входы-initializers и value_info удалённых тензоров больше не нужны
+        for i in reversed(range(len(graph.input))):
+            if graph.input[i].name in ctx.initializers:
+                del graph.input[i]
+        del graph.value_info[:]
+        ctx.model.producer_name = "nsoft-compiler"
+        return ctx.model.SerializeToString()
+
+    def run(self, ctx):
+        if ctx.output is None:
+            return {"bytes": 0}
+        meta = {
+            "format_version": firmware.FIRMWARE_VERSION,
+            "target": ctx.target.describe(),
+            "weight_dtype": np.dtype(weight_packing.WEIGHT_DTYPE).name,
+            "placement_fields": PLACEMENT_FIELDS,
+            # Признак переиспользования — свойство сборки, а не образа
+            "layers": [{key: value for key, value in layer.items() if key != "reused"} for layer in ctx.layers]
+        }
+        sections = [
+            (firmware.SECTION_META, [json.dumps(meta).encode()]),
+            (firmware.SECTION_TILES, ctx.tile_chunks),
+            (firmware.SECTION_BIAS, ctx.bias_chunks),
+            (firmware.SECTION_PLACEMENT, ctx.placement_rows),
+        ]
+        graph = self._graph_model(ctx)
+        if graph is not None:
+            sections.append((firmware.SECTION_GRAPH, [graph]))
+        writer = _HashingWriter(ctx.output)
+        size = firmware.write_firmware(writer, sections)
+        ctx.firmware = {"size": size, "sha256": writer.hasher.hexdigest(), "host_graph": graph is not None}
+        return {"bytes": size}
+
+
+def compile_model(model_path: str, target: CompileTarget, output: Optional[BinaryIO],
+                  passes: Sequence[str] = DEFAULT_PASSES, strict: bool = False, incremental: bool = True) -> dict:
+    """Run the pass pipeline over an ONNX model and write the firmware image to ``output``.
+
+    Returns the compilation report: per-pass timings and stats, the per-layer
+    placement and warnings. Raises CompileError (with the partial report) when
+    the model cannot be compiled for the target. With ``incremental``, packed
+    layers are reused from (and stored to) the layer cache.
+    """
+    unknown = [name for name in passes if name not in PASSES]
+    if unknown:
+        raise ValueError(f"Unknown compiler passes: {', '.join(unknown)}")
+    ctx = CompileContext(model_path, target, output, strict, incremental)
+    for name in passes:
+        start = time.perf_counter()
+        try:
+            stats = PASSES[name]().run(ctx) or {}
+        except PASS_ERRORS as e:
+            ctx.errors.append(f"Pass '{name}' failed: {type(e).__name__}: {e}")
+            raise CompileError(ctx.errors[-1], ctx.report()) from e
+        ctx.passes.append({"name": name, "ms": round((time.perf_counter() - start) * 1000, 3), **stats})
+    return ctx.report()
@@ -0,0 +1,337 @@
+import math
+import os
+from typing import Dict, List, NamedTuple, Optional
+
+import numpy as np
+
+from app.services.device_state import crossbar_shape
+
+# Аналоговое умножение вектора на матрицу кроссбара: такты на один входной вектор (DAC, интегрирование, ADC)
+MVM_CYCLES = 64
+# Цифровой векторный блок ядра: операций за такт (активации, поэлементные операции, пулинг)
+DIGITAL_OPS_PER_CYCLE = 32
+# Запись проводимостей при перезагрузке весов: мемристоров за такт на ядро
+PROGRAM_CELLS_PER_CYCLE = 8
+# Среднее число переходов при пересылке частичных сумм между ядрами
+TOPOLOGY_HOPS = {
+    "full_mesh": lambda cores: 1.0,
+    "mesh": lambda cores: max(1.0, 2 * math.sqrt(cores) / 3),
+    "2d_mesh": lambda cores: max(1.0, 2 * math.sqrt(cores) / 3),
+    "torus": lambda cores: max(1.0, math.sqrt(cores) / 2),
+    "ring": lambda cores: max(1.0, cores / 4),
+    "bus": lambda cores: max(1.0, cores / 2),
+}
+PARTIAL_SUM_BYTES = 4
+
+# Операторы, веса которых отображаются на кроссбары
+CROSSBAR_OPS = {"Conv", "ConvTranspose", "Gemm", "MatMul"}
+# Операторы без вычислений: только перестановка/переименование данных
+LAYOUT_OPS = {"Reshape", "Flatten", "Squeeze", "Unsqueeze", "Identity", "Transpose", "Shape", "Constant",
+              "Concat", "Split", "Slice", "Gather", "Cast", "Dropout"}
+# Цифровых операций на элемент выхода
+DIGITAL_OPS_PER_ELEMENT = {"Sigmoid": 4, "Tanh": 4, "Softmax": 5, "LayerNormalization": 8, "Erf": 4, "Gelu": 8,
+                           "BatchNormalization": 2, "InstanceNormalization": 4, "Exp": 4, "Div": 2, "Sqrt": 2}
+
+
+class DeviceConfig(NamedTuple):
+    core_count: int
+    usable_cores: int  # ядра без статуса faulty
+    crossbar_rows: int
+    crossbar_cols: int
+    clock_mhz: float
+    memory_bandwidth_gbs: float
+    sparsity_support: bool
+    topology: str
+    idle_watts: float
+    peak_watts: float
+    activation_bytes: int
+
+    @classmethod
+    def from_device(cls, device, usable_cores: Optional[int] = None) -> "DeviceConfig":
+        rows, cols = crossbar_shape(device.memristors_per_core or 0)
+        power = device.power_profile or {}
+        dtypes = device.supported_dtypes or []
+        return cls(
+            core_count=device.core_count or 0,
+            usable_cores=(device.core_count or 0) if usable_cores is None else usable_cores,
+            crossbar_rows=rows,
+            crossbar_cols=cols,
+            clock_mhz=float(device.clock_frequency or 1000),
+            memory_bandwidth_gbs=float(device.memory_bandwidth or 1),
+            sparsity_support=bool(device.sparsity_support),
+            topology=device.crossbar_topology or "full_mesh",
+            idle_watts=float(power.get("idle", 0)),
+            peak_watts=float(power.get("peak", 0)),
+            # Активации хранятся в самом узком поддерживаемом типе
+            activation_bytes=1 if "int8" in dtypes else 2 if "float16" in dtypes else 4
+        )
+
+
+def _prod(shape) -> int:
+    return math.prod(shape) if shape else 1
+
+
+def _attribute(node: dict, name: str, default):
+    value = node["attributes"].get(name, default)
+    return value if isinstance(value, (int, float)) else default
+
+
+def _weight_matrix(node: dict, weights: Dict[str, dict]):
+    """(K rows, N cols, groups, weight elements) of a crossbar op, or None without a constant weight."""
+    op_type = node["op_type"]
+    inputs = node["inputs"]
+    if len(inputs) < 2 or inputs[1] not in weights:
+        return None
+    weight = weights[inputs[1]]
+    shape = weight["shape"]
+    if op_type in ("Conv", "ConvTranspose"):
+        if len(shape) < 3:
+            return None
+        groups = max(1, int(_attribute(node, "group", 1)))
+        kernel = _prod(shape[2:])
+        if op_type == "Conv":
+            k, n = shape[1] * kernel, shape[0] // groups
+        else:
+            k, n = shape[0] // groups, shape[1] * kernel
+        return k, n, groups, _prod(shape)
+    if len(shape) < 2:
+        return None
+    k, n = shape[-2], shape[-1]
+    if op_type == "Gemm" and _attribute(node, "transB", 0):
+        k, n = n, k
+    return k, n, _prod(shape[:-2]), _prod(shape)
+
+
+def _layer_matrices(node: dict, weight: np.ndarray) -> Optional[np.ndarray]:
+    """Weights of a crossbar op as [groups, K rows, N cols] matrices (same layout as _weight_matrix)."""
+    op_type = node["op_type"]
+    if op_type in ("Conv", "ConvTranspose"):
+        if weight.ndim < 3:
+            return None
+        groups = max(1, int(_attribute(node, "group", 1)))
+        if op_type == "Conv":
+            # [M, C/g, k...] -> g x [C/g * k, M/g]
+            return weight.reshape(groups, weight.shape[0] // groups, -1).transpose(0, 2, 1)
+        # [C, M/g, k...] -> g x [C/g, M/g * k]
+        return weight.reshape(groups, weight.shape[0] // groups, -1)
+    if weight.ndim < 2:
+        return None
+    if op_type == "Gemm" and _attribute(node, "transB", 0):
+        weight = weight.T
+    return weight.reshape(-1, weight.shape[-2], weight.shape[-1])
+
+
+def occupied_tiles(model_path: str, parsed: dict, rows: int, cols: int) -> Dict[str, int]:
+    """Node name -> number of rows x cols tiles of a crossbar op's weight holding at least one nonzero."""
+    from app.services.onnx_parser import load_model_structure, tensor_array
+
+    if not (rows and cols):
+        return {}
+    initializers = {init.name: init for init in load_model_structure(model_path).graph.initializer}
+    base_dir = os.path.dirname(model_path)
+    occupied = {}
+    for node in parsed["nodes"]:
+        inputs = node["inputs"]
+        if node["op_type"] not in CROSSBAR_OPS or len(inputs) < 2 or inputs[1] not in initializers:
+            continue
+        matrices = _layer_matrices(node, tensor_array(initializers[inputs[1]], base_dir))
+        if matrices is None or not matrices.size:
+            continue
+        k, n = matrices.shape[1:]
+        row_starts, col_starts = np.arange(0, k, rows), np.arange(0, n, cols)
+        count = 0
+        # По группе за раз: маска ненулевых не больше одной матрицы
+        for matrix in matrices:
+            nonzero = np.logical_or.reduceat(matrix != 0, row_starts, axis=0)
+            count += int(np.logical_or.reduceat(nonzero, col_starts, axis=1).sum())
+        occupied[node["name"]] = count
+    return occupied
+
+
+def simulate(parsed: dict, device: DeviceConfig, shapes: Optional[Dict[str, List[int]]] = None,
+             batch: int = 1, occupied: Optional[Dict[str, int]] = None) -> dict:
+    """Roofline estimate of running a parsed ONNX graph (parse_onnx_model output) on a crossbar device.
+
+    Crossbar ops are tiled onto rows x cols crossbars (one per core); their
+    compute time is MVM_CYCLES per input vector per wave of tiles, and tiles
+    that do not fit on the usable cores are reprogrammed between waves. Other
+    ops run on the digital vector units. Each node's latency is
+    max(compute, memory) plus reprogramming and partial-sum traffic; nodes
+    run one after another. ``shapes`` (tensor name -> shape, e.g. from ONNX
+    shape inference) gives activation sizes; without it every activation is
+    assumed to be ``batch`` vectors. With sparsity support, tiles without
+    nonzero weights are not mapped: ``occupied`` (see occupied_tiles) gives
+    the tiles actually needed per node, other nodes keep their dense count.
+    """
+    shapes = shapes or {}
+    weights = parsed.get("weights", {})
+    nodes = [node for node in parsed["nodes"] if node["op_type"] not in ("Input", "Initializer")]
+    count = len(nodes)
+
+    # Признаки узлов собираются одним проходом, временная модель считается векторно
+    kind = np.zeros(count, dtype=np.int8)  # 0 — без вычислений, 1 — цифровой блок, 2 — кроссбар
+    vectors = np.zeros(count, dtype=np.float64)
+    rows_k = np.zeros(count, dtype=np.float64)
+    cols_n = np.zeros(count, dtype=np.float64)
+    groups = np.ones(count, dtype=np.float64)
+    weight_elements = np.zeros(count, dtype=np.float64)
+    digital_ops = np.zeros(count, dtype=np.float64)
+    io_elements = np.zeros(count, dtype=np.float64)
+    shape_known = np.ones(count, dtype=bool)
+
+    for i, node in enumerate(nodes):
+        op_type = node["op_type"]
+        out_shape = shapes.get(node["outputs"][0]) if node["outputs"] else None
+        in_elements = 0
+        for name in node["inputs"]:
+            if name and name not in weights:
+                in_shape = shapes.get(name)
+                if in_shape is None:
+                    shape_known[i] = False
+                in_elements += _prod(in_shape) if in_shape is not None else batch
+        out_elements = _prod(out_shape) if out_shape is not None else batch
+        if out_shape is None:
+            shape_known[i] = False
+        io_elements[i] = in_elements + out_elements
+
+        matrix = _weight_matrix(node, weights) if op_type in CROSSBAR_OPS else None
+        if matrix is not None:
+            k, n, g, elements = matrix
+            kind[i] = 2
+            rows_k[i], cols_n[i], groups[i], weight_elements[i] = k, n, g, elements
+            # Входных векторов столько, сколько позиций выхода на один столбец матрицы
+            vectors[i] = max(1.0, out_elements / max(n * g, 1)) if out_shape is not None else batch
+        elif op_type in CROSSBAR_OPS:
+            # MatMul двух активаций (внимание и т.п.) считается на цифровом блоке
+            kind[i] = 1
+            a_shape = shapes.get(node["inputs"][0]) if node["inputs"] else None
+            k = a_shape[-1] if a_shape else 1
+            digital_ops[i] = out_elements * k
+        elif op_type not in LAYOUT_OPS:
+            kind[i] = 1
+            digital_ops[i] = out_elements * DIGITAL_OPS_PER_ELEMENT.get(op_type, 1)
+
+    clock_hz = device.clock_mhz * 1e6
+    cores = max(device.usable_cores, 0)
+    rows, cols = device.crossbar_rows, device.crossbar_cols
+    bandwidth = device.memory_bandwidth_gbs * 1e9
+    crossbar = kind == 2
+
+    tiles = np.zeros(count, dtype=np.float64)
+    if rows and cols:
+        row_tiles = np.ceil(rows_k / rows)
+        tiles = np.where(crossbar, row_tiles * np.ceil(cols_n / cols) * groups, 0)
+    else:
+        row_tiles = np.ones(count)
+    if device.sparsity_support and occupied:
+        # Пустые тайлы не отображаются; слой без ненулевых весов всё равно занимает один тайл
+        needed = np.array([occupied.get(node["name"], -1) for node in nodes], dtype=np.float64)
+        tiles = np.where(crossbar & (needed >= 0), np.maximum(1, needed), tiles)
+    mappable = crossbar & (cores > 0) & (rows > 0)
+    waves = np.where(mappable, np.ceil(tiles / max(cores, 1)), 0)
+    cores_used = np.where(mappable, np.minimum(tiles, cores), 0)
+
+    compute_s = np.where(mappable, vectors * waves * MVM_CYCLES / clock_hz, 0.0)
+    compute_s += np.where(kind == 1, digital_ops / (max(cores, 1) * DIGITAL_OPS_PER_CYCLE * clock_hz), 0.0)
+    memory_s = io_elements * device.activation_bytes / bandwidth
+    # Веса, не поместившиеся в кроссбары, перезаписываются на каждой волне
+    program_s = np.where(waves > 1, waves * rows * cols / (PROGRAM_CELLS_PER_CYCLE * clock_hz), 0.0)
+    hops = TOPOLOGY_HOPS.get(device.topology, TOPOLOGY_HOPS["full_mesh"])(max(cores, 1))
+    reduce_bytes = np.where(mappable, vectors * cols_n * groups * (row_tiles - 1) * PARTIAL_SUM_BYTES * hops, 0.0)
+    network_s = reduce_bytes / bandwidth
+
+    latency_s = np.maximum(compute_s, memory_s) + program_s + network_s
+    peak_macs_per_s = cores * rows * cols * clock_hz / MVM_CYCLES if cores and rows else 0.0
+    macs = np.where(crossbar, vectors * rows_k * cols_n * groups, digital_ops)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        utilization = np.where(
+            latency_s > 0,
+            np.where(crossbar, cores_used / max(cores, 1) * compute_s / latency_s,
+                     np.where(kind == 1, compute_s / latency_s, 0.0)),
+            0.0
+        )
+    power = device.idle_watts + (device.peak_watts - device.idle_watts) * utilization
+    energy_j = latency_s * power
+    bound = np.where(program_s + network_s > np.maximum(compute_s, memory_s), "reprogramming",
+                     np.where(compute_s >= memory_s, "compute", "memory"))
+
+    total_s = float(latency_s.sum())
+    resident_tiles = float(tiles.sum())
+    # Если все веса одновременно лежат в кроссбарах, слои работают конвейером
+    pipelined = bool(cores and resident_tiles <= cores)
+    stage_s = float(latency_s.max()) if count else 0.0
+    # Списки Python вместо поэлементного чтения numpy-скаляров: на 10k узлов это заметно
+    columns = zip(
+        kind.tolist(), macs.tolist(), weight_elements.tolist(), tiles.tolist(), cores_used.tolist(), waves.tolist(),
+        compute_s.tolist(), memory_s.tolist(), program_s.tolist(), network_s.tolist(), latency_s.tolist(),
+        bound.tolist(), utilization.tolist(), energy_j.tolist(), shape_known.tolist()
+    )
+    per_node = [{
+        "name": node["name"],
+        "op_type": node["op_type"],
+        "unit": ("none", "digital", "crossbar")[unit],
+        "macs": int(node_macs),
+        "weight_elements": int(elements),
+        "tiles": int(node_tiles),
+        "cores_used": int(used),
+        "waves": int(node_waves),
+        "compute_ms": compute * 1e3,
+        "memory_ms": memory * 1e3,
+        "reprogram_ms": program * 1e3,
+        "network_ms": network * 1e3,
+        "latency_ms": latency * 1e3,
+        "bound": node_bound,
+        "utilization": node_utilization,
+        "energy_mj": energy * 1e3,
+        "shape_known": known
+    } for node, (unit, node_macs, elements, node_tiles, used, node_waves, compute, memory, program, network,
+                 latency, node_bound, node_utilization, energy, known) in zip(nodes, columns)]
+
+    return {
+        "device": device._asdict(),
+        "batch": batch,
+        "summary": {
+            "nodes": count,
+            "crossbar_nodes": int(crossbar.sum()),
+            "unmapped_crossbar_nodes": int((crossbar & ~mappable).sum()),
+            "macs": int(macs.sum()),
+            "tiles": int(resident_tiles),
+            "weights_resident": pipelined,
+            "latency_ms": total_s * 1e3,
+            "throughput_per_s": batch / total_s if total_s else None,
+            "pipelined_throughput_per_s": batch / stage_s if pipelined and stage_s else None,
+            "energy_mj": float(energy_j.sum()) * 1e3,
+            "average_power_w": float(energy_j.sum()) / total_s if total_s else 0.0,
+            "utilization": float((utilization * latency_s).sum()) / total_s if total_s else 0.0,
+            "peak_tops": peak_macs_per_s * 2 / 1e12,
+            "achieved_tops": float(macs.sum()) * 2 / total_s / 1e12 if total_s else 0.0,
+            "bound": {name: int((bound == name).sum()) for name in ("compute", "memory", "reprogramming")},
+            "shapes_known": bool(shape_known.all())
+        },
+        "nodes": per_node
+    }
+
+
+def inferred_shapes(model_path: str, batch: int = 1) -> Dict[str, List[int]]:
+    """Static tensor shapes from ONNX shape inference; symbolic dims become ``batch`` (leading) or 1."""
+    import onnx
+    from app.services.onnx_parser import load_model_structure
+
+    model = load_model_structure(model_path)
+    try:
+        model = onnx.shape_inference.infer_shapes(model)
+    except Exception:
+        # Без вывода форм остаются только объявленные входы и выходы
+        pass
+    shapes = {}
+    graph = model.graph
+    for value in list(graph.input) + list(graph.value_info) + list(graph.output):
+        tensor_type = value.type.tensor_type
+        if not tensor_type.HasField("shape"):
+            continue
+        dims = [
+            dim.dim_value if dim.HasField("dim_value") else (batch if position == 0 else 1)
+            for position, dim in enumerate(tensor_type.shape.dim)
+        ]
+        shapes[value.name] = dims
+    return shapes
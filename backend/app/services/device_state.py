@@ -0,0 +1,137 @@
+import math
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy.orm import Session, undefer_group
+
+from app.models.device_models import CoreState, Device
+
+# Код статуса мемристора = индекс в этом кортеже (хранится как uint8)
+MEMRISTOR_STATUSES = ("active", "stuck_at_0", "stuck_at_1", "random_flip", "disabled")
+STATUS_CODES = {name: code for code, name in enumerate(MEMRISTOR_STATUSES)}
+ACTIVE = STATUS_CODES["active"]
+
+CONDUCTANCE_HISTOGRAM_BINS = 16
+
+
+def run_lengths(codes: np.ndarray) -> List[List[int]]:
+    """Run-length summary of a status-code array: [[code, length], ...]."""
+    if codes.size == 0:
+        return []
+    starts = np.flatnonzero(np.diff(codes)) + 1
+    bounds = np.concatenate(([0], starts, [codes.size]))
+    return [[int(codes[start]), int(end - start)] for start, end in zip(bounds[:-1], bounds[1:])]
+
+
+def set_status_codes(state: CoreState, codes: np.ndarray) -> None:
+    codes = np.ascontiguousarray(codes, dtype=np.uint8)
+    state.memristor_count = int(codes.size)
+    state.status_runs = run_lengths(codes)
+    # Полностью исправное ядро хранится одной RLE-записью, без массива
+    if len(state.status_runs) == 1 and state.status_runs[0][0] == ACTIVE:
+        state.status_codes = None
+    else:
+        state.status_codes = zlib.compress(codes.tobytes())
+
+
+def status_codes(state: CoreState) -> np.ndarray:
+    if state.status_codes is None:
+        codes = np.empty(state.memristor_count, dtype=np.uint8)
+        position = 0
+        for code, length in state.status_runs:
+            codes[position:position + length] = code
+            position += length
+        return codes
+    return np.frombuffer(zlib.decompress(state.status_codes), dtype=np.uint8)
+
+
+def conductance_histogram(values: np.ndarray, bins: int = CONDUCTANCE_HISTOGRAM_BINS) -> Optional[dict]:
+    values = values.astype(np.float32)
+    values = values[np.isfinite(values)]
+    if not values.size:
+        return None
+    counts, bin_edges = np.histogram(values, bins=bins)
+    return {"counts": counts.tolist(), "bin_edges": bin_edges.tolist()}
+
+
+def set_conductance(state: CoreState, values: Optional[np.ndarray]) -> None:
+    if values is None:
+        state.conductance = None
+        state.conductance_histogram = None
+        return
+    values = np.ascontiguousarray(values, dtype=np.float16)
+    if values.size != state.memristor_count:
+        raise ValueError(f"Expected {state.memristor_count} conductance values, got {values.size}")
+    state.conductance = zlib.compress(values.tobytes())
+    # Гистограмма считается при записи: сводке ядра не нужен сам массив
+    state.conductance_histogram = conductance_histogram(values)
+
+
+def conductance(state: CoreState) -> Optional[np.ndarray]:
+    if state.conductance is None:
+        return None
+    return np.frombuffer(zlib.decompress(state.conductance), dtype=np.float16)
+
+
+def status_counts(state: CoreState) -> Dict[str, int]:
+    """Memristor counts per status, from the RLE summary (no array decoding)."""
+    counts = dict.fromkeys(MEMRISTOR_STATUSES, 0)
+    for code, length in state.status_runs:
+        counts[MEMRISTOR_STATUSES[code]] += length
+    return counts
+
+
+def reset_core_states(db: Session, device: Device, core_count: int, memristors_per_core: int) -> None:
+    """(Re)create a device's cores with all memristors active: core_count small rows, no per-memristor data."""
+    db.query(CoreState).filter(CoreState.device_id == device.id).delete(synchronize_session=False)
+    device.core_count = core_count
+    device.memristors_per_core = memristors_per_core
+    runs = [[ACTIVE, memristors_per_core]] if memristors_per_core else []
+    db.add_all([
+        CoreState(device_id=device.id, core_id=i, status="healthy", memristor_count=memristors_per_core,
+                  status_runs=runs)
+        for i in range(core_count)
+    ])
+
+
+def load_core_states(db: Session, device_id: str, with_arrays: bool = False) -> List[CoreState]:
+    """A device's cores in order; packed arrays are loaded only with ``with_arrays``."""
+    query = db.query(CoreState).filter(CoreState.device_id == device_id).order_by(CoreState.core_id)
+    if with_arrays:
+        query = query.options(undefer_group("arrays"))
+    return query.all()
+
+
+def expand_memristors(states: List[CoreState]) -> List[dict]:
+    """Legacy per-memristor list ([{"id", "status"}], ids numbered across cores)."""
+    memristors = []
+    for state in states:
+        base = len(memristors)
+        names = np.array(MEMRISTOR_STATUSES)[status_codes(state)]
+        memristors.extend({"id": base + i, "status": name} for i, name in enumerate(names.tolist()))
+    return memristors
+
+
+def crossbar_shape(memristor_count: int) -> Tuple[int, int]:
+    """Rows x cols of a core's crossbar: the most square factorization of its memristor count."""
+    rows = max((d for d in range(1, math.isqrt(memristor_count) + 1) if memristor_count % d == 0), default=0)
+    return rows, (memristor_count // rows if rows else 0)
+
+
+def core_summary(state: CoreState) -> dict:
+    """Per-core aggregates: counts by status, healthy ratio and a conductance histogram.
+
+    Built from the RLE summary and the stored histogram; the packed arrays are not read.
+    """
+    counts = status_counts(state)
+    rows, cols = crossbar_shape(state.memristor_count)
+    return {
+        "id": state.core_id,
+        "status": state.status,
+        "memristor_count": state.memristor_count,
+        "crossbar": {"rows": rows, "cols": cols},
+        "counts": counts,
+        "healthy_ratio": counts["active"] / state.memristor_count if state.memristor_count else 1.0,
+        "conductance_histogram": state.conductance_histogram
+    }
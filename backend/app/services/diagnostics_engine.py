@@ -0,0 +1,246 @@
+import asyncio
+import hashlib
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Sequence
+
+import numpy as np
+
+from app.services.device_state import MEMRISTOR_STATUSES, STATUS_CODES
+
+# Симуляция кроссбара: нормированные проводимости состояний 0/1 и порог чтения
+G_LOW = 0.1
+G_HIGH = 1.0
+READ_THRESHOLD = (G_LOW + G_HIGH) / 2
+DEVICE_VARIATION = 0.05  # разброс проводимости ячеек (относительный)
+READ_NOISE = 0.02  # шум одного чтения
+
+FAULT_MODELS = ("stuck_at_0", "stuck_at_1", "random_flip")
+DIAGNOSTICS_FAULT_RATE = float(os.getenv("DIAGNOSTICS_FAULT_RATE", 0.001))
+DIAGNOSTICS_MAX_WORKERS = int(os.getenv("DIAGNOSTICS_MAX_WORKERS", os.cpu_count() or 1))
+# Меньше этого число мемристоров проверяется в текущем процессе: пул дороже самой проверки
+DIAGNOSTICS_PARALLEL_MIN = int(os.getenv("DIAGNOSTICS_PARALLEL_MIN", 1_000_000))
+# Объём группы ядер между отчётами о прогрессе при проверке в текущем процессе
+PROGRESS_GROUP_MEMRISTORS = 65536
+# Ядро считается исправным, если доля рабочих мемристоров не ниже порога
+CORE_HEALTHY_RATIO = 0.99
+CORE_DEGRADED_RATIO = 0.9
+
+# March C-: элементы из операций чтения/записи (r0, r1, w0, w1). Без coupling-faults
+# порядок адресов не влияет на результат, поэтому каждый элемент — векторная операция над всем ядром
+MARCH_C_MINUS = (("w0",), ("r0", "w1"), ("r1", "w0"), ("r0", "w1"), ("r1", "w0"), ("r0",))
+
+
+class CoreSpec(NamedTuple):
+    core_id: int
+    memristor_count: int
+
+
+class CoreResult(NamedTuple):
+    core_id: int
+    codes: np.ndarray  # uint8, коды MEMRISTOR_STATUSES
+    conductance: np.ndarray  # float16, средняя проводимость в состоянии 1
+    counts: Dict[str, int]
+
+
+def core_seed(device_id: str, core_id: int, seed: int = 0) -> int:
+    """Stable RNG seed of one core: the simulated device has the same faults on every run."""
+    digest = hashlib.sha256(f"{device_id}:{core_id}:{seed}".encode()).digest()
+    return int.from_bytes(digest[:8], "little")
+
+
+class SimulatedCrossbar:
+    """One core's memristor array with injected faults, operated on with whole-array reads/writes."""
+
+    def __init__(self, memristor_count: int, fault_models: Iterable[str], fault_rate: float,
+                 rng: np.random.Generator):
+        self.rng = rng
+        self.state = np.zeros(memristor_count, dtype=bool)
+        self.variation = 1 + rng.normal(0, DEVICE_VARIATION, memristor_count).astype(np.float32)
+        # Каждая ячейка получает не более одной неисправности
+        self.fault = np.zeros(memristor_count, dtype=np.uint8)
+        models = [model for model in FAULT_MODELS if model in set(fault_models)]
+        if models:
+            draw = rng.random(memristor_count)
+            for i, model in enumerate(models):
+                hit = (draw >= i * fault_rate) & (draw < (i + 1) * fault_rate)
+                self.fault[hit] = STATUS_CODES[model]
+
+    def write(self, value: bool) -> None:
+        self.state[:] = value
+        self.state[self.fault == STATUS_CODES["stuck_at_0"]] = False
+        self.state[self.fault == STATUS_CODES["stuck_at_1"]] = True
+
+    def read(self) -> np.ndarray:
+        """Analog read: conductance of every cell with variation and read noise."""
+        level = np.where(self.state, G_HIGH, G_LOW).astype(np.float32)
+        conductance = level * self.variation + self.rng.normal(0, READ_NOISE, self.state.size).astype(np.float32)
+        # Нестабильная ячейка при каждом чтении с вероятностью 1/2 выдаёт противоположное состояние
+        flip = (self.fault == STATUS_CODES["random_flip"]) & (self.rng.random(self.state.size) < 0.5)
+        conductance[flip] = np.where(self.state[flip], G_LOW, G_HIGH)
+        return conductance
+
+
+def march_test(crossbar: SimulatedCrossbar, passes: int = 2) -> CoreResult:
+    """Run March C- ``passes`` times and classify every cell from its read failures.
+
+    Fails only on r0 -> stuck_at_1, only on r1 -> stuck_at_0, on both or
+    intermittently -> random_flip.
+    """
+    size = crossbar.state.size
+    fail_r0 = np.zeros(size, dtype=np.uint16)
+    fail_r1 = np.zeros(size, dtype=np.uint16)
+    reads_r0 = reads_r1 = 0
+    high_sum = np.zeros(size, dtype=np.float32)
+    for _ in range(passes):
+        for element in MARCH_C_MINUS:
+            for operation in element:
+                if operation[0] == "w":
+                    crossbar.write(operation[1] == "1")
+                    continue
+                conductance = crossbar.read()
+                value = conductance > READ_THRESHOLD
+                if operation == "r0":
+                    fail_r0 += value
+                    reads_r0 += 1
+                else:
+                    fail_r1 += ~value
+                    high_sum += conductance
+                    reads_r1 += 1
+
+    codes = np.full(size, STATUS_CODES["active"], dtype=np.uint8)
+    faulty = (fail_r0 > 0) | (fail_r1 > 0)
+    codes[faulty] = STATUS_CODES["random_flip"]
+    codes[(fail_r0 == reads_r0) & (fail_r1 == 0)] = STATUS_CODES["stuck_at_1"]
+    codes[(fail_r1 == reads_r1) & (fail_r0 == 0)] = STATUS_CODES["stuck_at_0"]
+    counts = np.bincount(codes, minlength=len(MEMRISTOR_STATUSES))
+    return CoreResult(
+        core_id=-1,
+        codes=codes,
+        conductance=(high_sum / max(reads_r1, 1)).astype(np.float16),
+        counts={name: int(counts[code]) for code, name in enumerate(MEMRISTOR_STATUSES)}
+    )
+
+
+def diagnose_cores(device_id: str, cores: Sequence[CoreSpec], fault_models: Sequence[str],
+                   fault_rate: float, seed: int = 0, passes: int = 2) -> List[CoreResult]:
+    """Simulate and test a group of cores; runs in a worker process for parallel diagnostics."""
+    results = []
+    for core in cores:
+        rng = np.random.default_rng(core_seed(device_id, core.core_id, seed))
+        crossbar = SimulatedCrossbar(core.memristor_count, fault_models, fault_rate, rng)
+        results.append(march_test(crossbar, passes)._replace(core_id=core.core_id))
+    return results
+
+
+def core_status(counts: Dict[str, int]) -> str:
+    total = sum(counts.values())
+    ratio = counts["active"] / total if total else 1.0
+    if ratio >= CORE_HEALTHY_RATIO:
+        return "healthy"
+    return "degraded" if ratio >= CORE_DEGRADED_RATIO else "faulty"
+
+
+_executor: Optional[ProcessPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=DIAGNOSTICS_MAX_WORKERS,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return _executor
+
+
+def _use_pool(cores: Sequence[CoreSpec], parallel: Optional[bool]) -> bool:
+    if parallel is None:
+        parallel = sum(core.memristor_count for core in cores) >= DIAGNOSTICS_PARALLEL_MIN
+    return parallel and len(cores) >= 2 and DIAGNOSTICS_MAX_WORKERS >= 2
+
+
+def _core_groups(cores: Sequence[CoreSpec], group_count: int) -> List[List[CoreSpec]]:
+    # Ядра раздаются по кругу: группы получаются примерно одинакового объёма
+    group_count = max(1, min(len(cores), group_count))
+    return [list(cores[i::group_count]) for i in range(group_count)]
+
+
+def run_diagnostics(device_id: str, cores: Sequence[CoreSpec], fault_models: Sequence[str],
+                    fault_rate: float = DIAGNOSTICS_FAULT_RATE, seed: int = 0, passes: int = 2,
+                    parallel: Optional[bool] = None) -> List[CoreResult]:
+    """Diagnose all cores of a device, spreading cores over worker processes when worthwhile.
+
+    Results are deterministic for a given (device_id, seed), however the cores are split.
+    """
+    if not _use_pool(cores, parallel):
+        return diagnose_cores(device_id, cores, fault_models, fault_rate, seed, passes)
+
+    executor = _get_executor()
+    futures = [
+        executor.submit(diagnose_cores, device_id, group, list(fault_models), fault_rate, seed, passes)
+        for group in _core_groups(cores, DIAGNOSTICS_MAX_WORKERS * 4)
+    ]
+    results = [result for future in futures for result in future.result()]
+    return sorted(results, key=lambda result: result.core_id)
+
+
+async def run_diagnostics_async(device_id: str, cores: Sequence[CoreSpec], fault_models: Sequence[str],
+                                fault_rate: float = DIAGNOSTICS_FAULT_RATE, seed: int = 0, passes: int = 2,
+                                on_results: Optional[Callable[[List[CoreResult]], None]] = None,
+                                is_cancelled: Optional[Callable[[], bool]] = None) -> List[CoreResult]:
+    """Like run_diagnostics, but awaitable and reporting cores as they finish.
+
+    ``on_results`` is called in the event loop with each finished group of
+    cores; ``is_cancelled`` is checked between groups (raises CancelledError).
+    """
+    fault_models = list(fault_models)
+    results: List[CoreResult] = []
+
+    def finished(group_results: List[CoreResult]) -> None:
+        results.extend(group_results)
+        if on_results is not None:
+            on_results(group_results)
+
+    if _use_pool(cores, None):
+        executor = _get_executor()
+        futures = [
+            asyncio.wrap_future(executor.submit(
+                diagnose_cores, device_id, group, fault_models, fault_rate, seed, passes
+            ))
+            for group in _core_groups(cores, DIAGNOSTICS_MAX_WORKERS * 4)
+        ]
+        try:
+            for future in asyncio.as_completed(futures):
+                finished(await future)
+                if is_cancelled is not None and is_cancelled():
+                    raise asyncio.CancelledError()
+        finally:
+            for future in futures:
+                future.cancel()
+    else:
+        # Маленькие устройства — в потоке, группами по ~PROGRESS_GROUP_MEMRISTORS для прогресса
+        group, size = [], 0
+        for core in cores:
+            group.append(core)
+            size += core.memristor_count
+            if size >= PROGRESS_GROUP_MEMRISTORS or core is cores[-1]:
+                if is_cancelled is not None and is_cancelled():
+                    raise asyncio.CancelledError()
+                finished(await asyncio.to_thread(
+                    diagnose_cores, device_id, group, fault_models, fault_rate, seed, passes
+                ))
+                group, size = [], 0
+    return sorted(results, key=lambda result: result.core_id)
+
+
+def shutdown() -> None:
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
@@ -0,0 +1,567 @@
+import asyncio
+import logging
+import os
+import time
+import uuid
+from datetime import datetime
+from functools import partial
+from typing import Dict, List, NamedTuple, Optional, Set
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import undefer
+
+from app.database import SessionLocal
+from app.models.device_models import CoreState, Device
+from app.models.job_models import DiagnosticsJob
+from app.models.workflow_models import DeviceWorkflowStatus, WorkflowStep
+from app.services.device_state import MEMRISTOR_STATUSES, load_core_states, set_conductance, set_status_codes
+from app.services.diagnostics_engine import (
+    DIAGNOSTICS_FAULT_RATE, CoreResult, CoreSpec, core_status, run_diagnostics_async
+)
+
+logger = logging.getLogger(__name__)
+
+# Сколько диагностик выполняется одновременно (на процесс uvicorn); CPU-часть — в пуле процессов движка
+DIAGNOSTICS_JOB_CONCURRENCY = int(os.getenv("DIAGNOSTICS_JOB_CONCURRENCY", 256))
+# Прогресс пишется в БД не чаще этого интервала (события подписчикам — сразу)
+PROGRESS_FLUSH_SECONDS = 1.0
+# Пакетная диагностика: сколько устройств одновременно по умолчанию, максимум на запрос,
+# и сколько устройств записывается в одной транзакции
+DIAGNOSTICS_BATCH_PARALLELISM = int(os.getenv("DIAGNOSTICS_BATCH_PARALLELISM", 32))
+DIAGNOSTICS_BATCH_MAX_DEVICES = int(os.getenv("DIAGNOSTICS_BATCH_MAX_DEVICES", 1000))
+BATCH_COMMIT_SIZE = 200
+
+ACTIVE_STATUSES = ("queued", "running")
+
+
+class DeviceBusy(Exception):
+    def __init__(self, job_id: str):
+        super().__init__(f"Diagnostics already in progress for this device (job {job_id})")
+        self.job_id = job_id
+
+
+def job_info(job: DiagnosticsJob, with_result: bool = False) -> dict:
+    info = {
+        "job_id": job.id,
+        "device_id": job.device_id,
+        "status": job.status,
+        "progress": job.progress or 0.0,
+        "cores_done": job.cores_done or 0,
+        "cores_total": job.cores_total or 0,
+        "params": job.params,
+        "error": job.error,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "started_at": job.started_at.isoformat() if job.started_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+    }
+    if with_result:
+        info["result"] = job.result
+    return info
+
+
+def apply_diagnostics(db, device: Device, results: List[CoreResult], duration_ms: float,
+                      states: Optional[Dict[int, CoreState]] = None) -> dict:
+    """Store per-core fault maps and the device summary; returns the summary."""
+    if states is None:
+        states = {state.core_id: state for state in load_core_states(db, device.id)}
+    cores = []
+    totals = dict.fromkeys(MEMRISTOR_STATUSES, 0)
+    for result in results:
+        state = states[result.core_id]
+        set_status_codes(state, result.codes)
+        set_conductance(state, result.conductance)
+        state.status = core_status(result.counts)
+        faults = {name: count for name, count in result.counts.items() if name != "active" and count}
+        cores.append({"id": result.core_id, "status": state.status, "faults": faults})
+        for name, count in result.counts.items():
+            totals[name] += count
+
+    summary = {
+        "cores": cores,
+        "memristors": {"available": totals["active"], "total": sum(totals.values())},
+        "faults": {name: count for name, count in totals.items() if name != "active"},
+        "overall_status": "failed" if any(core["status"] == "faulty" for core in cores) else "passed",
+        "duration_ms": round(duration_ms, 1)
+    }
+    device.diagnostics = summary
+    return summary
+
+
+class BatchDevice(NamedTuple):
+    job_id: str
+    device_id: str
+    cores: List[CoreSpec]
+    fault_models: List[str]
+
+
+def _device_filter(query, device_ids: Optional[List[str]], status: Optional[str], is_mock: Optional[bool]):
+    if device_ids is not None:
+        query = query.filter(Device.id.in_(device_ids))
+    if status is not None:
+        query = query.filter(Device.status == status)
+    if is_mock is not None:
+        query = query.filter(Device.is_mock == is_mock)
+    return query
+
+
+class DiagnosticsJobManager:
+    """Persistent diagnostics jobs run by in-process async workers.
+
+    Jobs live in the diagnostics_jobs table, so their state and results
+    survive restarts (unfinished jobs are queued again on start). At most one
+    job per device is queued or running. Progress is pushed to subscribers
+    (see subscribe) core group by core group.
+    """
+
+    def __init__(self, concurrency: int):
+        self.concurrency = concurrency
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+        self._cancelled: Set[str] = set()
+
+    # --- Работа с БД (вызывается через asyncio.to_thread) ---
+
+    @staticmethod
+    def _create(device_id: str, params: dict) -> DiagnosticsJob:
+        db = SessionLocal()
+        try:
+            if not db.query(Device.id).filter(Device.id == device_id).first():
+                raise LookupError("Device not found")
+            active = db.query(DiagnosticsJob).filter(
+                DiagnosticsJob.device_id == device_id, DiagnosticsJob.status.in_(ACTIVE_STATUSES)
+            ).first()
+            if active:
+                raise DeviceBusy(active.id)
+            job = DiagnosticsJob(id=uuid.uuid4().hex, device_id=device_id, status="queued", params=params)
+            db.add(job)
+            try:
+                db.commit()
+            except IntegrityError:
+                # Параллельный запрос успел поставить задачу для этого устройства
+                db.rollback()
+                active = db.query(DiagnosticsJob).filter(
+                    DiagnosticsJob.device_id == device_id, DiagnosticsJob.status.in_(ACTIVE_STATUSES)
+                ).first()
+                raise DeviceBusy(active.id if active else "")
+            db.refresh(job)
+            return job
+        finally:
+            db.close()
+
+    @staticmethod
+    def _update_progress(job_id: str, cores_done: int, progress: float) -> None:
+        db = SessionLocal()
+        try:
+            # Запись прогресса не ждётся и может прийти после _finish/_abort: завершённую задачу не трогаем
+            db.query(DiagnosticsJob).filter(
+                DiagnosticsJob.id == job_id, DiagnosticsJob.status == "running"
+            ).update({"cores_done": cores_done, "progress": progress}, synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+    @staticmethod
+    def _start(job_id: str):
+        """Mark the job running; returns (device_id, params, cores, fault_models) or None if it is gone."""
+        db = SessionLocal()
+        try:
+            job = db.query(DiagnosticsJob).filter(DiagnosticsJob.id == job_id).first()
+            if not job or job.status not in ACTIVE_STATUSES:
+                return None
+            device = db.query(Device).options(undefer(Device.leakage_types)).filter(
+                Device.id == job.device_id
+            ).first()
+            if not device:
+                job.status, job.error, job.finished_at = "failed", "Device not found", datetime.utcnow()
+                db.commit()
+                return None
+            cores = [CoreSpec(state.core_id, state.memristor_count) for state in load_core_states(db, device.id)]
+            job.status, job.started_at = "running", datetime.utcnow()
+            job.cores_total, job.cores_done, job.progress = len(cores), 0, 0.0
+            device.status = "busy"
+            db.commit()
+            return job.device_id, dict(job.params or {}), cores, list(device.leakage_types or [])
+        finally:
+            db.close()
+
+    @staticmethod
+    def _finish(job_id: str, device_id: str, results: List[CoreResult], duration_ms: float) -> dict:
+        db = SessionLocal()
+        try:
+            device = db.query(Device).filter(Device.id == device_id).first()
+            summary = apply_diagnostics(db, device, results, duration_ms)
+            device.status = "idle"
+            if summary["overall_status"] == "passed":
+                workflow = db.query(DeviceWorkflowStatus).filter(DeviceWorkflowStatus.device_id == device_id).first()
+                if workflow:
+                    workflow.current_step = WorkflowStep.COMPILER
+            db.query(DiagnosticsJob).filter(DiagnosticsJob.id == job_id).update({
+                "status": "completed", "progress": 1.0, "cores_done": len(results), "result": summary,
+                "finished_at": datetime.utcnow()
+            }, synchronize_session=False)
+            db.commit()
+            return summary
+        finally:
+            db.close()
+
+    @staticmethod
+    def _abort(job_id: str, device_id: Optional[str], status: str, error: Optional[str]) -> None:
+        db = SessionLocal()
+        try:
+            db.query(DiagnosticsJob).filter(DiagnosticsJob.id == job_id).update(
+                {"status": status, "error": error, "finished_at": datetime.utcnow()}, synchronize_session=False
+            )
+            if device_id:
+                db.query(Device).filter(Device.id == device_id).update(
+                    {"status": "error" if status == "failed" else "idle"}, synchronize_session=False
+                )
+            db.commit()
+        finally:
+            db.close()
+
+    @staticmethod
+    def _pending_ids() -> List[str]:
+        db = SessionLocal()
+        try:
+            rows = db.query(DiagnosticsJob.id).filter(
+                DiagnosticsJob.status.in_(ACTIVE_STATUSES)
+            ).order_by(DiagnosticsJob.created_at).all()
+            return [job_id for job_id, in rows]
+        finally:
+            db.close()
+
+    @staticmethod
+    def get(job_id: str, with_result: bool = False) -> Optional[dict]:
+        db = SessionLocal()
+        try:
+            query = db.query(DiagnosticsJob)
+            if with_result:
+                query = query.options(undefer(DiagnosticsJob.result))
+            job = query.filter(DiagnosticsJob.id == job_id).first()
+            return job_info(job, with_result) if job else None
+        finally:
+            db.close()
+
+    @staticmethod
+    def list(device_id: Optional[str] = None, limit: int = 50) -> List[dict]:
+        db = SessionLocal()
+        try:
+            query = db.query(DiagnosticsJob)
+            if device_id is not None:
+                query = query.filter(DiagnosticsJob.device_id == device_id)
+            return [job_info(job) for job in query.order_by(DiagnosticsJob.created_at.desc()).limit(limit)]
+        finally:
+            db.close()
+
+    # --- Очередь и воркеры ---
+
+    async def start(self) -> None:
+        self._queue = asyncio.Queue()
+        # Незавершённые до перезапуска задачи выполняются заново
+        for job_id in await asyncio.to_thread(self._pending_ids):
+            self._queue.put_nowait(job_id)
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+
+    async def stop(self) -> None:
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def submit(self, device_id: str, params: dict) -> dict:
+        """Queue diagnostics for a device; raises DeviceBusy if one is already queued or running."""
+        job = await asyncio.to_thread(self._create, device_id, params)
+        self._queue.put_nowait(job.id)
+        return job_info(job)
+
+    async def cancel(self, job_id: str) -> Optional[dict]:
+        info = await asyncio.to_thread(self.get, job_id)
+        if info and info["status"] in ACTIVE_STATUSES:
+            # Поставленная в очередь отменяется сразу, выполняющаяся — между группами ядер
+            self._cancelled.add(job_id)
+            if info["status"] == "queued":
+                await asyncio.to_thread(self._abort, job_id, None, "cancelled", None)
+                self._publish(job_id, {"event": "status", "status": "cancelled"})
+        return await asyncio.to_thread(self.get, job_id)
+
+    async def _worker(self) -> None:
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await self._run(job_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Diagnostics job %s crashed", job_id)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job_id: str) -> None:
+        started = await asyncio.to_thread(self._start, job_id)
+        if started is None:
+            self._cancelled.discard(job_id)
+            return
+        device_id, params, cores, fault_models = started
+        self._publish(job_id, {"event": "status", "status": "running", "cores_total": len(cores)})
+
+        done = 0
+        last_flush = time.monotonic()
+
+        def on_results(group: List[CoreResult]) -> None:
+            nonlocal done, last_flush
+            done += len(group)
+            progress = done / len(cores)
+            for result in group:
+                self._publish(job_id, {
+                    "event": "core",
+                    "core_id": result.core_id,
+                    "status": core_status(result.counts),
+                    "faults": {name: count for name, count in result.counts.items() if name != "active" and count},
+                    "cores_done": done,
+                    "cores_total": len(cores),
+                    "progress": progress
+                })
+            if time.monotonic() - last_flush >= PROGRESS_FLUSH_SECONDS:
+                last_flush = time.monotonic()
+                asyncio.get_running_loop().run_in_executor(
+                    None, partial(self._update_progress, job_id, done, progress)
+                )
+
+        fault_rate = params.get("fault_rate")
+        start = time.perf_counter()
+        try:
+            results = await run_diagnostics_async(
+                device_id, cores, fault_models,
+                fault_rate=DIAGNOSTICS_FAULT_RATE if fault_rate is None else fault_rate,
+                seed=params.get("seed", 0),
+                passes=params.get("passes", 2),
+                on_results=on_results,
+                is_cancelled=lambda: job_id in self._cancelled
+            )
+            summary = await asyncio.to_thread(
+                self._finish, job_id, device_id, results, (time.perf_counter() - start) * 1000
+            )
+        except asyncio.CancelledError:
+            if job_id not in self._cancelled:
+                # Остановка сервера: задача останется running и будет перезапущена при старте
+                raise
+            await asyncio.to_thread(self._abort, job_id, device_id, "cancelled", None)
+            self._publish(job_id, {"event": "status", "status": "cancelled"})
+        except Exception as e:
+            await asyncio.to_thread(self._abort, job_id, device_id, "failed", str(e))
+            self._publish(job_id, {"event": "status", "status": "failed", "error": str(e)})
+        else:
+            self._publish(job_id, {"event": "status", "status": "completed", "result": summary})
+        finally:
+            self._cancelled.discard(job_id)
+
+    # --- Пакетная диагностика ---
+
+    @staticmethod
+    def _claim_batch(device_ids: Optional[List[str]], status: Optional[str], is_mock: Optional[bool],
+                     params: dict, max_devices: int):
+        """Select devices and mark them running in one transaction.
+
+        Returns (claimed BatchDevice list, busy device ids, missing device ids).
+        """
+        db = SessionLocal()
+        try:
+            query = _device_filter(
+                db.query(Device.id, Device.leakage_types), device_ids, status, is_mock
+            ).order_by(Device.id)
+            devices = query.limit(max_devices + 1).all()
+            if len(devices) > max_devices:
+                raise ValueError(f"Batch selects more than {max_devices} devices")
+            found = {device_id for device_id, _ in devices}
+            missing = [device_id for device_id in (device_ids or []) if device_id not in found]
+
+            busy = {device_id for device_id, in db.query(DiagnosticsJob.device_id).filter(
+                DiagnosticsJob.device_id.in_(found), DiagnosticsJob.status.in_(ACTIVE_STATUSES)
+            )}
+            devices = [(device_id, leakage) for device_id, leakage in devices if device_id not in busy]
+
+            # Размеры ядер всех устройств — одним запросом
+            cores: Dict[str, List[CoreSpec]] = {device_id: [] for device_id, _ in devices}
+            for device_id, core_id, count in db.query(
+                CoreState.device_id, CoreState.core_id, CoreState.memristor_count
+            ).filter(CoreState.device_id.in_(cores)).order_by(CoreState.device_id, CoreState.core_id):
+                cores[device_id].append(CoreSpec(core_id, count))
+
+            now = datetime.utcnow()
+            claimed = [
+                BatchDevice(uuid.uuid4().hex, device_id, cores[device_id], list(leakage or []))
+                for device_id, leakage in devices
+            ]
+            db.bulk_insert_mappings(DiagnosticsJob, [{
+                "id": item.job_id, "device_id": item.device_id, "status": "running", "params": params,
+                "cores_total": len(item.cores), "cores_done": 0, "progress": 0.0, "started_at": now
+            } for item in claimed])
+            db.query(Device).filter(Device.id.in_([item.device_id for item in claimed])).update(
+                {"status": "busy"}, synchronize_session=False
+            )
+            db.commit()
+            return claimed, sorted(busy), missing
+        finally:
+            db.close()
+
+    @staticmethod
+    def _finish_batch(items: List[BatchDevice], outcomes: Dict[str, object], durations: Dict[str, float],
+                      summaries: Dict[str, dict]) -> Dict[str, dict]:
+        """Write results of a batch in bulk, BATCH_COMMIT_SIZE devices per transaction.
+
+        ``summaries`` is filled per device once its transaction is committed.
+        """
+        for start in range(0, len(items), BATCH_COMMIT_SIZE):
+            chunk = items[start:start + BATCH_COMMIT_SIZE]
+            db = SessionLocal()
+            try:
+                ids = [item.device_id for item in chunk]
+                devices = {device.id: device for device in db.query(Device).filter(Device.id.in_(ids))}
+                states: Dict[str, Dict[int, CoreState]] = {device_id: {} for device_id in ids}
+                for state in db.query(CoreState).filter(CoreState.device_id.in_(ids)):
+                    states[state.device_id][state.core_id] = state
+
+                now = datetime.utcnow()
+                passed, job_updates, committed = [], [], {}
+                for item in chunk:
+                    outcome = outcomes[item.device_id]
+                    device = devices.get(item.device_id)
+                    if isinstance(outcome, BaseException) or device is None:
+                        error = str(outcome) if isinstance(outcome, BaseException) else "Device not found"
+                        if device is not None:
+                            device.status = "error"
+                        job_updates.append({"id": item.job_id, "status": "failed", "error": error,
+                                            "finished_at": now})
+                        committed[item.device_id] = {"error": error}
+                        continue
+                    summary = apply_diagnostics(db, device, outcome, durations[item.device_id],
+                                                states[item.device_id])
+                    device.status = "idle"
+                    if summary["overall_status"] == "passed":
+                        passed.append(item.device_id)
+                    job_updates.append({"id": item.job_id, "status": "completed", "progress": 1.0,
+                                        "cores_done": len(outcome), "result": summary, "finished_at": now})
+                    committed[item.device_id] = summary
+
+                db.bulk_update_mappings(DiagnosticsJob, job_updates)
+                if passed:
+                    db.query(DeviceWorkflowStatus).filter(DeviceWorkflowStatus.device_id.in_(passed)).update(
+                        {"current_step": WorkflowStep.COMPILER}, synchronize_session=False
+                    )
+                db.commit()
+                summaries.update(committed)
+            finally:
+                db.close()
+        return summaries
+
+    async def run_batch(self, device_ids: Optional[List[str]], status: Optional[str], is_mock: Optional[bool],
+                        params: dict, parallelism: int = DIAGNOSTICS_BATCH_PARALLELISM,
+                        max_devices: int = DIAGNOSTICS_BATCH_MAX_DEVICES) -> dict:
+        """Diagnose many devices at once and return an aggregate report.
+
+        Devices are claimed and written back in bulk transactions; up to
+        ``parallelism`` devices are diagnosed concurrently. Devices with a
+        queued or running job are skipped and reported as busy.
+        """
+        start = time.perf_counter()
+        try:
+            claimed, busy, missing = await asyncio.to_thread(
+                self._claim_batch, device_ids, status, is_mock, params, max_devices
+            )
+        except IntegrityError:
+            # Одиночная диагностика заняла устройство между проверкой и вставкой: повторная
+            # попытка увидит её задачу и отнесёт устройство к занятым
+            claimed, busy, missing = await asyncio.to_thread(
+                self._claim_batch, device_ids, status, is_mock, params, max_devices
+            )
+        semaphore = asyncio.Semaphore(parallelism)
+        fault_rate = params.get("fault_rate")
+        outcomes: Dict[str, object] = {}
+        durations: Dict[str, float] = {}
+
+        async def diagnose(item: BatchDevice) -> None:
+            async with semaphore:
+                device_start = time.perf_counter()
+                try:
+                    outcomes[item.device_id] = await run_diagnostics_async(
+                        item.device_id, item.cores, item.fault_models,
+                        fault_rate=DIAGNOSTICS_FAULT_RATE if fault_rate is None else fault_rate,
+                        seed=params.get("seed", 0),
+                        passes=params.get("passes", 2)
+                    )
+                except Exception as e:
+                    outcomes[item.device_id] = e
+                durations[item.device_id] = (time.perf_counter() - device_start) * 1000
+
+        summaries: Dict[str, dict] = {}
+        try:
+            await asyncio.gather(*(diagnose(item) for item in claimed))
+            await asyncio.to_thread(self._finish_batch, claimed, outcomes, durations, summaries)
+        except BaseException as e:
+            # Отмена запроса, остановка сервера или ошибка записи: незаписанные устройства
+            # не должны остаться busy, а их задачи — running (иначе устройство занято навсегда)
+            cancelled = isinstance(e, asyncio.CancelledError)
+            pending = [item for item in claimed if item.device_id not in summaries]
+
+            def abort_pending() -> None:
+                for item in pending:
+                    self._abort(item.job_id, item.device_id, "cancelled" if cancelled else "failed",
+                                None if cancelled else f"Batch aborted: {e}")
+
+            await asyncio.shield(asyncio.to_thread(abort_pending))
+            raise
+
+        devices = []
+        faults = dict.fromkeys(MEMRISTOR_STATUSES[1:], 0)
+        counts = {"passed": 0, "failed": 0, "error": 0}
+        for item in claimed:
+            summary = summaries[item.device_id]
+            if "error" in summary:
+                counts["error"] += 1
+                devices.append({"device_id": item.device_id, "job_id": item.job_id, "overall_status": "error",
+                                "error": summary["error"]})
+                continue
+            counts[summary["overall_status"]] += 1
+            for name, count in summary["faults"].items():
+                faults[name] += count
+            devices.append({
+                "device_id": item.device_id,
+                "job_id": item.job_id,
+                "overall_status": summary["overall_status"],
+                "memristors": summary["memristors"],
+                "faults": summary["faults"],
+                "faulty_cores": [core["id"] for core in summary["cores"] if core["status"] == "faulty"],
+                "duration_ms": summary["duration_ms"]
+            })
+        return {
+            "requested": len(claimed) + len(busy) + len(missing),
+            "diagnosed": len(claimed),
+            **counts,
+            "busy": busy,
+            "missing": missing,
+            "faults": faults,
+            "devices": devices,
+            "duration_ms": round((time.perf_counter() - start) * 1000, 1)
+        }
+
+    # --- Подписка на прогресс ---
+
+    def subscribe(self, job_id: str) -> asyncio.Queue:
+        queue = asyncio.Queue()
+        self._subscribers.setdefault(job_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, job_id: str, queue: asyncio.Queue) -> None:
+        subscribers = self._subscribers.get(job_id)
+        if subscribers is not None:
+            subscribers.discard(queue)
+            if not subscribers:
+                del self._subscribers[job_id]
+
+    def _publish(self, job_id: str, event: dict) -> None:
+        for queue in self._subscribers.get(job_id, ()):
+            queue.put_nowait(event)
+
+
+diagnostics_jobs = DiagnosticsJobManager(DIAGNOSTICS_JOB_CONCURRENCY)
@@ -0,0 +1,77 @@
+import json
+import struct
+from typing import BinaryIO, Dict, Iterable, List, Optional, Tuple
+
+# Образ прошивки: заголовок, таблица секций, затем сами секции (всё little-endian)
+FIRMWARE_MAGIC = b"NSFW"
+FIRMWARE_VERSION = 1
+_HEADER = struct.Struct("<4sHHI")  # magic, version, flags, число секций
+_SECTION = struct.Struct("<4sQQ")  # тег, смещение от начала файла, длина
+
+# Секции: описание раскладки (JSON), упакованные тайлы, смещения, размещение тайлов, граф для исполнения на хосте
+SECTION_META = b"META"
+SECTION_TILES = b"TILE"
+SECTION_BIAS = b"BIAS"
+SECTION_PLACEMENT = b"PLAC"
+SECTION_GRAPH = b"GRPH"
+
+
+def write_firmware(f: BinaryIO, sections: List[Tuple[bytes, Iterable]]) -> int:
+    """Write a firmware image; each section is (tag, list of bytes-like chunks). Returns the image size."""
+    sections = [(tag, list(chunks)) for tag, chunks in sections]
+    offset = _HEADER.size + _SECTION.size * len(sections)
+    table = []
+    for tag, chunks in sections:
+        length = sum(memoryview(chunk).nbytes for chunk in chunks)
+        table.append(_SECTION.pack(tag, offset, length))
+        offset += length
+    f.write(_HEADER.pack(FIRMWARE_MAGIC, FIRMWARE_VERSION, 0, len(sections)))
+    f.write(b"".join(table))
+    for _, chunks in sections:
+        for chunk in chunks:
+            f.write(chunk)
+    return offset
+
+
+def is_firmware(path: str) -> bool:
+    with open(path, "rb") as f:
+        return f.read(len(FIRMWARE_MAGIC)) == FIRMWARE_MAGIC
+
+
+def read_section_table(f: BinaryIO) -> Dict[bytes, Tuple[int, int]]:
+    """Tag -> (offset, length) of a firmware image opened for binary reading."""
+    f.seek(0)
+    header = f.read(_HEADER.size)
+    if len(header) < _HEADER.size:
+        raise ValueError("Truncated firmware image")
+    magic, version, _, count = _HEADER.unpack(header)
+    if magic != FIRMWARE_MAGIC:
+        raise ValueError("Not a firmware image")
+    if version > FIRMWARE_VERSION:
+        raise ValueError(f"Unsupported firmware version {version}")
+    table = {}
+    for _ in range(count):
+        entry = f.read(_SECTION.size)
+        if len(entry) < _SECTION.size:
+            raise ValueError("Truncated firmware section table")
+        tag, offset, length = _SECTION.unpack(entry)
+        table[tag] = (offset, length)
+    return table
+
+
+def read_section(path: str, tag: bytes) -> Optional[bytes]:
+    with open(path, "rb") as f:
+        table = read_section_table(f)
+        if tag not in table:
+            return None
+        offset, length = table[tag]
+        f.seek(offset)
+        data = f.read(length)
+        if len(data) < length:
+            raise ValueError(f"Truncated firmware section {tag.decode()}")
+        return data
+
+
+def read_meta(path: str) -> dict:
+    meta = read_section(path, SECTION_META)
+    return json.loads(meta) if meta else {}
@@ -0,0 +1,293 @@
+import heapq
+import math
+import os
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import onnx
+
+from app.services.crossbar_simulator import DIGITAL_OPS_PER_ELEMENT, LAYOUT_OPS
+from app.services.artifact_store import PROJECT_TMP_DIR
+from app.services.onnx_parser import load_model_structure
+from app.services.parse_cache import ParsedModelCache
+
+# Результаты анализа: JSON по (model_id, batch) в памяти и в tmp проекта
+ANALYTICS_CACHE_DIR = os.path.join(PROJECT_TMP_DIR, 'analytics')
+os.makedirs(ANALYTICS_CACHE_DIR, exist_ok=True)
+ANALYTICS_CACHE_MAX_BYTES = int(os.getenv("ANALYTICS_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+ANALYTICS_CACHE_DISK_MAX_BYTES = int(os.getenv("ANALYTICS_CACHE_DISK_MAX_BYTES", 512 * 1024 * 1024))
+# Меняйте при изменении формата результата analyze
+ANALYTICS_VERSION = "2"
+# Самые тяжёлые узлы в сводке
+HOTSPOT_COUNT = 10
+
+POOL_OPS = {"MaxPool", "AveragePool", "LpPool"}
+GLOBAL_POOL_OPS = {"GlobalAveragePool", "GlobalMaxPool", "GlobalLpPool"}
+REDUCE_OPS = {"ReduceMean", "ReduceSum", "ReduceMax", "ReduceMin", "ReduceProd", "ReduceL2", "ReduceL1",
+              "ReduceLogSumExp", "ReduceSumSquare", "ArgMax", "ArgMin"}
+
+# Операторы с матрицей весов: вход с весом и вход со смещением (квантованные варианты считаются как float)
+WEIGHT_INPUT = {"Conv": 1, "ConvTranspose": 1, "Gemm": 1, "MatMul": 1, "ConvInteger": 1, "MatMulInteger": 1,
+                "QLinearConv": 3, "QLinearMatMul": 3}
+BIAS_INPUT = {"Conv": 2, "ConvTranspose": 2, "Gemm": 2, "QLinearConv": 8}
+CONV_OPS = {"Conv", "ConvInteger", "QLinearConv"}
+
+Tensor = Tuple[Optional[List[int]], int]  # форма (None — неизвестна) и размер элемента в байтах
+
+
+def _prod(shape) -> int:
+    return math.prod(shape) if shape else 1
+
+
+def _itemsize(elem_type: int) -> int:
+    try:
+        return np.dtype(onnx.helper.tensor_dtype_to_np_dtype(elem_type)).itemsize
+    except (KeyError, TypeError, ValueError):
+        return 4
+
+
+def _tensors(model: onnx.ModelProto, batch: int) -> Dict[str, Tensor]:
+    """Shapes and element sizes of all tensors after shape inference; symbolic dims become ``batch`` or 1."""
+    graph = model.graph
+    tensors: Dict[str, Tensor] = {}
+    for value in list(graph.input) + list(graph.value_info) + list(graph.output):
+        tensor_type = value.type.tensor_type
+        shape = None
+        if tensor_type.HasField("shape"):
+            shape = [
+                dim.dim_value if dim.HasField("dim_value") else (batch if position == 0 else 1)
+                for position, dim in enumerate(tensor_type.shape.dim)
+            ]
+        tensors[value.name] = (shape, _itemsize(tensor_type.elem_type))
+    for init in graph.initializer:
+        tensors[init.name] = (list(init.dims), _itemsize(init.data_type))
+    return tensors
+
+
+def _attribute(node: onnx.NodeProto, name: str, default):
+    for attr in node.attribute:
+        if attr.name == name:
+            return onnx.helper.get_attribute_value(attr)
+    return default
+
+
+def node_macs_flops(node: onnx.NodeProto, tensors: Dict[str, Tensor]) -> Tuple[Optional[int], Optional[int]]:
+    """(MACs, FLOPs) of one node, or (None, None) when the shapes it needs are unknown."""
+    op = node.op_type
+    if op in LAYOUT_OPS:
+        return 0, 0
+
+    def shape(position: int, outputs: bool = False) -> Optional[List[int]]:
+        names = node.output if outputs else node.input
+        if position >= len(names) or not names[position]:
+            return None
+        return tensors.get(names[position], (None, 0))[0]
+
+    out, first = shape(0, outputs=True), shape(0)
+    if op in WEIGHT_INPUT:
+        weight = shape(WEIGHT_INPUT[op])
+        if weight is None or (out is None if op != "ConvTranspose" else first is None):
+            return None, None
+        if op in CONV_OPS:
+            # Каждый выход: C/group * kernel умножений
+            macs = _prod(out) * _prod(weight[1:])
+        elif op == "ConvTranspose":
+            macs = _prod(first) * _prod(weight[1:])
+        elif op == "Gemm":
+            if first is None:
+                return None, None
+            macs = _prod(out) * (first[0] if _attribute(node, "transA", 0) else first[-1])
+        else:
+            if first is None:
+                return None, None
+            macs = _prod(out) * first[-1]
+        bias = op in BIAS_INPUT and shape(BIAS_INPUT[op]) is not None and out is not None
+        return macs, 2 * macs + (_prod(out) if bias else 0)
+
+    if op in GLOBAL_POOL_OPS or op in REDUCE_OPS:
+        return (None, None) if first is None else (0, _prod(first))
+    if out is None:
+        return None, None
+    if op in POOL_OPS:
+        return 0, _prod(out) * _prod(_attribute(node, "kernel_shape", []))
+    return 0, _prod(out) * DIGITAL_OPS_PER_ELEMENT.get(op, 1)
+
+
+def _nbytes(tensor: Tensor) -> int:
+    shape, itemsize = tensor
+    return _prod(shape) * itemsize if shape is not None else 0
+
+
+def topological_order(nodes: List[onnx.NodeProto]) -> List[int]:
+    """Kahn's order of node indices; the file order when it is already topological."""
+    producers = {name: i for i, node in enumerate(nodes) for name in node.output if name}
+    consumers: List[List[int]] = [[] for _ in nodes]
+    indegree = [0] * len(nodes)
+    for i, node in enumerate(nodes):
+        for producer in {producers[name] for name in node.input if name in producers}:
+            if producer != i:
+                consumers[producer].append(i)
+                indegree[i] += 1
+    # Из готовых узлов первым идёт более ранний в файле
+    ready = [i for i in range(len(nodes)) if indegree[i] == 0]
+    heapq.heapify(ready)
+    order = []
+    while ready:
+        i = heapq.heappop(ready)
+        order.append(i)
+        for consumer in consumers[i]:
+            indegree[consumer] -= 1
+            if indegree[consumer] == 0:
+                heapq.heappush(ready, consumer)
+    if len(order) < len(nodes):
+        # Цикл в графе (некорректная модель): оставшиеся узлы — в порядке файла
+        seen = set(order)
+        order.extend(i for i in range(len(nodes)) if i not in seen)
+    return order
+
+
+def analyze(model_path: str, batch: int = 1) -> dict:
+    """Static analysis of an ONNX graph: per-node MACs/FLOPs and memory, peak live memory, critical path.
+
+    Peak memory follows the topological schedule: a tensor is allocated when
+    its producer runs and freed after its last consumer; weights stay
+    resident. The critical path is the FLOPs-heaviest dependency chain.
+    """
+    model = load_model_structure(model_path)
+    try:
+        model = onnx.shape_inference.infer_shapes(model)
+    except Exception:
+        # Без вывода форм остаются только объявленные входы, выходы и initializers
+        pass
+    graph = model.graph
+    tensors = _tensors(model, batch)
+    initializers = {init.name for init in graph.initializer}
+    graph_outputs = {output.name for output in graph.output}
+    nodes = list(graph.node)
+    order = topological_order(nodes)
+    position = {node_index: step for step, node_index in enumerate(order)}
+    producers = {name: i for i, node in enumerate(nodes) for name in node.output if name}
+
+    last_use: Dict[str, int] = {}
+    for i, node in enumerate(nodes):
+        for name in node.input:
+            if name and name not in initializers:
+                last_use[name] = max(last_use.get(name, -1), position[i])
+    for name in graph_outputs:
+        last_use[name] = len(order)
+
+    live = sum(_nbytes(tensors.get(value.name, (None, 0))) for value in graph.input if value.name not in initializers)
+    peak, peak_node = live, None
+    counted_weights = set()
+    per_node: List[Optional[dict]] = [None] * len(nodes)
+    cost = [0] * len(nodes)
+    unknown = 0
+    for step, i in enumerate(order):
+        node = nodes[i]
+        macs, flops = node_macs_flops(node, tensors)
+        if flops is None:
+            unknown += 1
+        cost[i] = flops or 0
+        output_bytes = sum(_nbytes(tensors.get(name, (None, 0))) for name in node.output if name)
+        # Общий вес учитывается один раз — у первого по расписанию потребителя
+        weights = [name for name in dict.fromkeys(node.input)
+                   if name in initializers and name not in counted_weights]
+        counted_weights.update(weights)
+
+        live += output_bytes
+        if live > peak:
+            peak, peak_node = live, node.name or f"{node.op_type}_{i}"
+        for name in set(node.input) | set(node.output):
+            if name and name not in initializers and last_use.get(name, step) <= step:
+                live -= _nbytes(tensors.get(name, (None, 0)))
+        per_node[i] = {
+            "name": node.name or f"{node.op_type}_{i}",
+            "op_type": node.op_type,
+            "step": step,
+            "macs": macs,
+            "flops": flops,
+            "activation_bytes": output_bytes,
+            "weight_bytes": sum(_nbytes(tensors[name]) for name in weights),
+            "output_shapes": [tensors.get(name, (None, 0))[0] for name in node.output]
+        }
+
+    # Самая тяжёлая по FLOPs цепочка зависимостей (и самая длинная по числу узлов)
+    path_cost, depth, previous = [0] * len(nodes), [0] * len(nodes), [-1] * len(nodes)
+    for i in order:
+        predecessors = {producers[name] for name in nodes[i].input if name in producers and producers[name] != i}
+        best = max(predecessors, key=lambda p: (path_cost[p], depth[p]), default=-1)
+        path_cost[i] = cost[i] + (path_cost[best] if best >= 0 else 0)
+        depth[i] = 1 + max((depth[p] for p in predecessors), default=0)
+        previous[i] = best
+    path = []
+    if nodes:
+        node_index = max(range(len(nodes)), key=lambda n: (path_cost[n], depth[n]))
+        while node_index >= 0:
+            path.append(per_node[node_index]["name"])
+            node_index = previous[node_index]
+        path.reverse()
+
+    total_flops = sum(cost)
+    weight_bytes = sum(_nbytes(tensors[name]) for name in counted_weights)
+    weight_elements = sum(_prod(tensors[name][0]) for name in counted_weights)
+    hotspots = sorted((entry for entry in per_node if entry["flops"]), key=lambda entry: -entry["flops"])
+    return {
+        "batch": batch,
+        "summary": {
+            "nodes": len(nodes),
+            "unknown_shapes": unknown,
+            "macs": sum(entry["macs"] or 0 for entry in per_node),
+            "flops": total_flops,
+            "weight_bytes": weight_bytes,
+            "weight_elements": weight_elements,
+            "activation_bytes": sum(entry["activation_bytes"] for entry in per_node),
+            "peak_activation_bytes": peak,
+            "peak_node": peak_node,
+            "peak_memory_bytes": weight_bytes + peak
+        },
+        "critical_path": {
+            "flops": max(path_cost, default=0),
+            # Доля FLOPs на критическом пути: близко к 1 — графу нечего распараллеливать
+            "flops_share": max(path_cost, default=0) / total_flops if total_flops else 0.0,
+            "length": len(path),
+            "depth": max(depth, default=0),
+            "nodes": path
+        },
+        "hotspots": [
+            {"name": entry["name"], "op_type": entry["op_type"], "flops": entry["flops"],
+             "share": entry["flops"] / total_flops}
+            for entry in hotspots[:HOTSPOT_COUNT]
+        ],
+        "nodes": per_node
+    }
+
+
+def device_fit(summary: dict, core_count: int, usable_cores: int, memristors_per_core: int) -> dict:
+    """Whether a model's weights (quantized to the device weight dtype) fit in the device's crossbar cells.
+
+    ``summary`` is the summary of analyze; the peak adds the largest set of
+    live activations to the quantized weights.
+    """
+    from app.services.weight_packing import WEIGHT_DTYPE
+
+    itemsize = np.dtype(WEIGHT_DTYPE).itemsize
+    capacity = max(usable_cores, 0) * memristors_per_core * itemsize
+    weight_bytes = summary["weight_elements"] * itemsize
+    peak = weight_bytes + summary["peak_activation_bytes"]
+    return {
+        "core_count": core_count,
+        "usable_cores": usable_cores,
+        "memristors_per_core": memristors_per_core,
+        "weight_dtype": np.dtype(WEIGHT_DTYPE).name,
+        "capacity_bytes": capacity,
+        "weight_bytes": weight_bytes,
+        "weights_headroom_bytes": capacity - weight_bytes,
+        "weights_fit": weight_bytes <= capacity,
+        "peak_memory_bytes": peak,
+        "peak_headroom_bytes": capacity - peak,
+        "utilization": weight_bytes / capacity if capacity else None
+    }
+
+
+analytics_cache = ParsedModelCache(ANALYTICS_CACHE_DIR, ANALYTICS_CACHE_MAX_BYTES, ANALYTICS_CACHE_DISK_MAX_BYTES,
+                                   version=ANALYTICS_VERSION)
@@ -0,0 +1,189 @@
+import asyncio
+import bisect
+import os
+import time
+from typing import Dict, List, NamedTuple, Sequence, Tuple
+
+import numpy as np
+
+from app.services import inference_engine
+from app.services.inference_engine import LoadedModel
+
+# Микробатчинг: батч отправляется, набрав столько сэмплов или прождав столько миллисекунд
+INFERENCE_MAX_BATCH = int(os.getenv("INFERENCE_MAX_BATCH", 32))
+INFERENCE_MAX_WAIT_MS = float(os.getenv("INFERENCE_MAX_WAIT_MS", 5))
+# Очередь модели без запросов столько секунд закрывается
+BATCHER_IDLE_SECONDS = 30
+
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+WAIT_MS_BUCKETS = (0.1, 0.5, 1, 2, 5, 10, 20, 50, 100, 250, 1000)
+
+
+class Histogram:
+    """Bucketed counts: counts[i] holds values in (buckets[i - 1], buckets[i]]; the last one is the overflow."""
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float, times: int = 1) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += times
+        self.total += value * times
+        self.count += times
+
+    def to_dict(self) -> dict:
+        return {
+            "buckets": [*self.buckets, "+Inf"],
+            "counts": list(self.counts),
+            "count": self.count,
+            "mean": self.total / self.count if self.count else None
+        }
+
+
+class BatchResult(NamedTuple):
+    outputs: List[np.ndarray]
+    latency_ms: float  # время вызова сессии на весь батч
+    queue_ms: float
+    batch_size: int
+
+
+class _Request(NamedTuple):
+    feed: Dict[str, np.ndarray]
+    samples: int
+    enqueued: float
+    future: asyncio.Future
+
+
+def _signature(feed: Dict[str, np.ndarray]) -> Tuple:
+    # Склеивать по оси батча можно только входы с одинаковыми остальными размерностями
+    return tuple((name, array.dtype.str, array.shape[1:]) for name, array in sorted(feed.items()))
+
+
+def _batchable(model: LoadedModel) -> bool:
+    return all(spec.shape and spec.shape[0] is None for spec in model.inputs.values())
+
+
+class MicroBatcher:
+    """Server-side micro-batching of inference requests, one queue per (device, firmware hash).
+
+    A queue's worker takes the first waiting request, then keeps collecting
+    until ``max_batch`` samples are gathered or ``max_wait_ms`` passes, runs
+    one session call over the concatenated feed and scatters the outputs back.
+    Models with a fixed batch dimension are run request by request.
+    """
+
+    def __init__(self, max_batch: int, max_wait_ms: float):
+        self.max_batch = max_batch
+        self.max_wait_ms = max_wait_ms
+        self._queues: Dict[Tuple[str, str], asyncio.Queue] = {}
+        self._workers: Dict[Tuple[str, str], asyncio.Task] = {}
+        self.batch_sizes = Histogram(BATCH_SIZE_BUCKETS)
+        self.queue_wait_ms = Histogram(WAIT_MS_BUCKETS)
+        self.run_ms = Histogram(WAIT_MS_BUCKETS)
+        self.batches = 0
+        self.requests = 0
+
+    async def submit(self, device_id: str, model: LoadedModel, feed: Dict[str, np.ndarray]) -> BatchResult:
+        key = (device_id, model.firmware_hash)
+        queue = self._queues.get(key)
+        if queue is None:
+            queue = self._queues[key] = asyncio.Queue()
+            self._workers[key] = asyncio.create_task(self._worker(key, model, queue))
+        samples = next(iter(feed.values())).shape[0] if feed else 1
+        future = asyncio.get_running_loop().create_future()
+        queue.put_nowait(_Request(feed, samples, time.perf_counter(), future))
+        return await future
+
+    async def _collect(self, first: _Request, queue: asyncio.Queue) -> List[_Request]:
+        batch, samples = [first], first.samples
+        deadline = first.enqueued + self.max_wait_ms / 1000
+        while samples < self.max_batch:
+            timeout = deadline - time.perf_counter()
+            try:
+                request = queue.get_nowait() if timeout <= 0 else await asyncio.wait_for(queue.get(), timeout)
+            except (asyncio.QueueEmpty, asyncio.TimeoutError):
+                break
+            batch.append(request)
+            samples += request.samples
+        return batch
+
+    async def _worker(self, key: Tuple[str, str], model: LoadedModel, queue: asyncio.Queue) -> None:
+        try:
+            while True:
+                try:
+                    first = await asyncio.wait_for(queue.get(), BATCHER_IDLE_SECONDS)
+                except asyncio.TimeoutError:
+                    if queue.empty():
+                        return
+                    continue
+                batch = await self._collect(first, queue) if _batchable(model) else [first]
+                # Запросы с разной формой входов в батч не склеиваются
+                groups: Dict[Tuple, List[_Request]] = {}
+                for request in batch:
+                    groups.setdefault(_signature(request.feed), []).append(request)
+                for requests in groups.values():
+                    await self._run(model, requests)
+        finally:
+            # Без await между проверкой и удалением: новый submit создаст новую очередь
+            self._queues.pop(key, None)
+            self._workers.pop(key, None)
+            while not queue.empty():
+                request = queue.get_nowait()
+                if not request.future.done():
+                    request.future.set_exception(RuntimeError("Inference queue closed"))
+
+    async def _run(self, model: LoadedModel, requests: List[_Request]) -> None:
+        started = time.perf_counter()
+        total = sum(request.samples for request in requests)
+        if len(requests) == 1:
+            feed = requests[0].feed
+        else:
+            feed = {name: np.concatenate([request.feed[name] for request in requests]) for name in requests[0].feed}
+        try:
+            outputs, latency_ms = await asyncio.to_thread(inference_engine.run, model, feed)
+        except Exception as e:
+            for request in requests:
+                if not request.future.done():
+                    request.future.set_exception(e)
+            return
+
+        self.batches += 1
+        self.requests += len(requests)
+        self.batch_sizes.observe(total)
+        self.run_ms.observe(latency_ms)
+        offset = 0
+        for request in requests:
+            queue_ms = (started - request.enqueued) * 1000
+            self.queue_wait_ms.observe(queue_ms)
+            # Выходы с осью батча режутся по запросам, остальные отдаются каждому целиком
+            scattered = [
+                output[offset:offset + request.samples] if output.ndim and output.shape[0] == total else output
+                for output in outputs
+            ]
+            offset += request.samples
+            if not request.future.done():
+                request.future.set_result(BatchResult(scattered, latency_ms, queue_ms, total))
+
+    async def stop(self) -> None:
+        workers = list(self._workers.values())
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {
+            "max_batch": self.max_batch,
+            "max_wait_ms": self.max_wait_ms,
+            "queues": len(self._queues),
+            "queued": sum(queue.qsize() for queue in self._queues.values()),
+            "batches": self.batches,
+            "requests": self.requests,
+            "batch_size": self.batch_sizes.to_dict(),
+            "queue_wait_ms": self.queue_wait_ms.to_dict(),
+            "run_ms": self.run_ms.to_dict()
+        }
+
+
+inference_batcher = MicroBatcher(INFERENCE_MAX_BATCH, INFERENCE_MAX_WAIT_MS)
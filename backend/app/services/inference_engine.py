@@ -0,0 +1,305 @@
+import hashlib
+import os
+import threading
+import time
+import zipfile
+from collections import OrderedDict
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from app.services import firmware
+
+# Сколько сессий onnxruntime держится в памяти (ключ — устройство и хэш прошивки)
+INFERENCE_SESSION_CACHE_SIZE = int(os.getenv("INFERENCE_SESSION_CACHE_SIZE", 8))
+# Потоки onnxruntime внутри оператора и между операторами; 0 — значение ORT по умолчанию
+INFERENCE_INTRA_OP_THREADS = int(os.getenv("INFERENCE_INTRA_OP_THREADS", 0))
+INFERENCE_INTER_OP_THREADS = int(os.getenv("INFERENCE_INTER_OP_THREADS", 0))
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+ORT_DTYPES = {
+    "tensor(float)": "float32", "tensor(double)": "float64", "tensor(float16)": "float16",
+    "tensor(int64)": "int64", "tensor(int32)": "int32", "tensor(int16)": "int16", "tensor(int8)": "int8",
+    "tensor(uint8)": "uint8", "tensor(bool)": "bool"
+}
+
+
+class FirmwareNotRunnable(Exception):
+    pass
+
+
+class InputSpec(NamedTuple):
+    dtype: np.dtype
+    shape: Tuple  # размерности модели; None — динамическая
+
+
+class LoadedModel(NamedTuple):
+    session: object
+    firmware_hash: str
+    inputs: Dict[str, InputSpec]
+    output_names: List[str]
+
+
+_hashes: Dict[Tuple[str, int, int], str] = {}
+_hashes_lock = threading.Lock()
+
+
+def firmware_hash(path: str) -> str:
+    """SHA-256 of a firmware file, memoized by (path, mtime, size): re-flashing changes the key."""
+    stat = os.stat(path)
+    key = (os.path.realpath(path), stat.st_mtime_ns, stat.st_size)
+    with _hashes_lock:
+        if key in _hashes:
+            return _hashes[key]
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            hasher.update(chunk)
+    with _hashes_lock:
+        # Хэши прежних версий того же файла больше не понадобятся
+        for stale in [item for item in _hashes if item[0] == key[0]]:
+            del _hashes[stale]
+        _hashes[key] = hasher.hexdigest()
+    return _hashes[key]
+
+
+def _session_options():
+    import onnxruntime as ort
+
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    if INFERENCE_INTRA_OP_THREADS:
+        options.intra_op_num_threads = INFERENCE_INTRA_OP_THREADS
+    if INFERENCE_INTER_OP_THREADS:
+        options.inter_op_num_threads = INFERENCE_INTER_OP_THREADS
+        options.execution_mode = ort.ExecutionMode.ORT_PARALLEL
+    return options
+
+
+def _load(path: str, digest: str) -> LoadedModel:
+    import onnxruntime as ort
+    from onnxruntime.capi import onnxruntime_pybind11_state as ort_errors
+
+    # Ошибки загрузки модели в onnxruntime не имеют общего базового класса
+    load_errors = (
+        ort_errors.Fail, ort_errors.InvalidArgument, ort_errors.InvalidGraph, ort_errors.InvalidProtobuf,
+        ort_errors.NoSuchFile, ort_errors.NotImplemented, ort_errors.RuntimeException, ort_errors.EPFail,
+        RuntimeError
+    )
+
+    source = path
+    try:
+        if firmware.is_firmware(path):
+            # Образ компилятора: на хосте исполняется встроенный в него оптимизированный граф
+            source = firmware.read_section(path, firmware.SECTION_GRAPH)
+            if source is None:
+                raise FirmwareNotRunnable("Firmware image has no host-runnable graph")
+    except (OSError, ValueError) as e:
+        raise FirmwareNotRunnable(f"Firmware image cannot be read: {e}")
+    try:
+        session = ort.InferenceSession(source, sess_options=_session_options(), providers=["CPUExecutionProvider"])
+    except load_errors as e:
+        raise FirmwareNotRunnable(f"Firmware is not a runnable ONNX model: {e}")
+    inputs = {}
+    for item in session.get_inputs():
+        if item.type not in ORT_DTYPES:
+            raise FirmwareNotRunnable(f"Unsupported model input type: {item.type}")
+        dtype = np.dtype(ORT_DTYPES[item.type])
+        inputs[item.name] = InputSpec(dtype, tuple(dim if isinstance(dim, int) else None for dim in item.shape))
+    return LoadedModel(session, digest, inputs, [item.name for item in session.get_outputs()])
+
+
+class SessionCache:
+    """LRU of onnxruntime sessions keyed by (device id, firmware hash).
+
+    Sessions are created at most once per key even under concurrent
+    requests; a re-flashed device gets a new key, and ``invalidate`` drops
+    its old sessions right away.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._sessions: "OrderedDict[Tuple[str, str], LoadedModel]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._loading: Dict[Tuple[str, str], threading.Lock] = {}
+        self.hits = 0
+        self.misses = 0
+        self.load_ms = 0.0
+
+    def get(self, device_id: str, path: str) -> LoadedModel:
+        key = (device_id, firmware_hash(path))
+        with self._lock:
+            model = self._sessions.get(key)
+            if model is not None:
+                self._sessions.move_to_end(key)
+                self.hits += 1
+                return model
+            loading = self._loading.setdefault(key, threading.Lock())
+
+        with loading:
+            with self._lock:
+                model = self._sessions.get(key)
+                if model is not None:
+                    self.hits += 1
+                    return model
+            start = time.perf_counter()
+            try:
+                model = _load(path, key[1])
+            finally:
+                with self._lock:
+                    self._loading.pop(key, None)
+            with self._lock:
+                self.misses += 1
+                self.load_ms += (time.perf_counter() - start) * 1000
+                self._sessions[key] = model
+                while len(self._sessions) > self.capacity:
+                    self._sessions.popitem(last=False)
+            return model
+
+    def invalidate(self, device_id: str) -> None:
+        with self._lock:
+            for key in [key for key in self._sessions if key[0] == device_id]:
+                del self._sessions[key]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "capacity": self.capacity,
+                "hits": self.hits,
+                "misses": self.misses,
+                "load_ms": round(self.load_ms, 1),
+                "intra_op_threads": INFERENCE_INTRA_OP_THREADS,
+                "inter_op_threads": INFERENCE_INTER_OP_THREADS
+            }
+
+
+def decode_input(model: LoadedModel, filename: str, path: str) -> Dict[str, np.ndarray]:
+    """Model feed from a spooled .npy (single-input models) or .npz (one array per input) upload.
+
+    ``filename`` is the upload's original name, ``path`` the spooled file;
+    .npy files are memory-mapped. An array without the batch dimension is
+    treated as one sample.
+    """
+    name = filename or ""
+    if name.endswith(".npy"):
+        if len(model.inputs) != 1:
+            raise ValueError(".npy input is only supported for single-input models")
+        try:
+            arrays = {next(iter(model.inputs)): np.load(path, mmap_mode="r", allow_pickle=False)}
+        except (OSError, EOFError):
+            raise ValueError(f"{name} is not a valid .npy file")
+    elif name.endswith(".npz"):
+        try:
+            with np.load(path, allow_pickle=False) as archive:
+                arrays = {key: archive[key] for key in archive.files}
+        except (zipfile.BadZipFile, OSError, EOFError):
+            raise ValueError(f"{name} is not a valid .npz file")
+    else:
+        raise ValueError(f"Unsupported input file: {name} (expected .npy or .npz)")
+
+    missing = set(model.inputs) - set(arrays)
+    if missing:
+        raise ValueError(f"{name} has no arrays for inputs: {sorted(missing)}")
+    feed = {}
+    for input_name, spec in model.inputs.items():
+        array = arrays[input_name]
+        if spec.shape and array.ndim == len(spec.shape) - 1:
+            array = array[np.newaxis]
+        if spec.shape and array.ndim != len(spec.shape):
+            raise ValueError(f"Input {input_name} expects {len(spec.shape)} dimensions, got {array.ndim}")
+        feed[input_name] = np.ascontiguousarray(array, dtype=spec.dtype)
+    return feed
+
+
+def predictions(output: np.ndarray) -> List[Tuple[int, float]]:
+    """(class index, confidence) per sample of a classifier output [N, classes, ...]."""
+    scores = np.asarray(output, dtype=np.float64).reshape(output.shape[0] if output.ndim > 1 else 1, -1)
+    # Выход-логиты переводим в вероятности; готовые вероятности оставляем как есть
+    is_probability = np.all((scores >= 0) & (scores <= 1)) and np.allclose(scores.sum(axis=1), 1, atol=1e-3)
+    if not is_probability:
+        scores = np.exp(scores - scores.max(axis=1, keepdims=True))
+        scores /= scores.sum(axis=1, keepdims=True)
+    classes = scores.argmax(axis=1)
+    return [(int(index), float(scores[row, index])) for row, index in enumerate(classes)]
+
+
+def run(model: LoadedModel, feed: Dict[str, np.ndarray]) -> Tuple[List[np.ndarray], float]:
+    """Run the session; returns the outputs and the measured latency in milliseconds."""
+    start = time.perf_counter()
+    outputs = model.session.run(model.output_names, feed)
+    return outputs, (time.perf_counter() - start) * 1000
+
+
+def iter_dataset(path: str, model: LoadedModel, batch_size: int,
+                 label_key: str = "labels") -> Iterator[Tuple[Dict[str, np.ndarray], Optional[np.ndarray], int]]:
+    """Stream (feed, labels, sample count) batches from a dataset file without loading it whole.
+
+    .npz/.zip datasets hold one [N, ...] array per model input and optionally
+    ``label_key`` (class indices or one-hot rows); .npy datasets are the
+    input of a single-input model. A fixed model batch dimension overrides
+    ``batch_size``.
+    """
+    from app.services.calibration import iter_npy_batches, iter_npz_batches
+
+    fixed_batch = next((spec.shape[0] for spec in model.inputs.values() if spec.shape and spec.shape[0]), None)
+    if fixed_batch:
+        batch_size = fixed_batch
+    if path.endswith(".npy"):
+        if len(model.inputs) != 1:
+            raise ValueError(".npy datasets are only supported for single-input models")
+        batches = iter_npy_batches(path, next(iter(model.inputs)), batch_size)
+    else:
+        batches = iter_npz_batches(path, batch_size)
+
+    for batch in batches:
+        missing = set(model.inputs) - set(batch)
+        if missing:
+            raise ValueError(f"Dataset has no arrays for inputs: {sorted(missing)}")
+        feed = {name: np.ascontiguousarray(batch[name], dtype=spec.dtype) for name, spec in model.inputs.items()}
+        # Неполный последний батч для модели с фиксированным batch дополняется нулями
+        count = next(iter(feed.values())).shape[0]
+        if fixed_batch and count != fixed_batch:
+            feed = {name: np.concatenate([array, np.zeros((fixed_batch - count,) + array.shape[1:], array.dtype)])
+                    for name, array in feed.items()}
+        labels = batch.get(label_key)
+        if labels is not None and labels.ndim > 1:
+            labels = labels.reshape(labels.shape[0], -1).argmax(axis=1)
+        yield feed, labels, count
+
+
+class RunningStats:
+    """Accuracy and latency percentiles accumulated over a streamed evaluation."""
+
+    def __init__(self):
+        self.samples = 0
+        self.labelled = 0
+        self.correct = 0
+        self.batch_latency_ms: List[float] = []
+        self.started = time.perf_counter()
+
+    def add(self, classes: np.ndarray, labels: Optional[np.ndarray], latency_ms: float) -> None:
+        self.samples += classes.size
+        self.batch_latency_ms.append(latency_ms)
+        if labels is not None:
+            self.labelled += labels.size
+            self.correct += int(np.count_nonzero(classes == labels))
+
+    def to_dict(self) -> dict:
+        latencies = np.asarray(self.batch_latency_ms or [0.0])
+        p50, p90, p99 = np.percentile(latencies, [50, 90, 99])
+        elapsed = time.perf_counter() - self.started
+        return {
+            "samples": self.samples,
+            "accuracy": self.correct / self.labelled if self.labelled else None,
+            "batches": len(self.batch_latency_ms),
+            "batch_latency_ms": {"p50": round(p50, 3), "p90": round(p90, 3), "p99": round(p99, 3),
+                                 "max": round(float(latencies.max()), 3)},
+            "sample_latency_ms": round(float(latencies.sum()) / self.samples, 4) if self.samples else None,
+            "samples_per_second": round(self.samples / elapsed, 1) if elapsed > 0 else None,
+            "elapsed_ms": round(elapsed * 1000, 1)
+        }
+
+
+session_cache = SessionCache(INFERENCE_SESSION_CACHE_SIZE)
@@ -0,0 +1,112 @@
+import hashlib
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from typing import Iterable, Optional, Tuple
+
+import numpy as np
+
+from app.services.artifact_store import PART_SUFFIX, PROJECT_TMP_DIR, evict_lru, scan_entries
+
+# Скомпилированные слои (упакованные тайлы) для инкрементальной перекомпиляции: tmp/compiled_layers/<ключ>.npy
+COMPILED_LAYERS_DIR = os.path.join(PROJECT_TMP_DIR, 'compiled_layers')
+os.makedirs(COMPILED_LAYERS_DIR, exist_ok=True)
+COMPILED_LAYERS_MAX_BYTES = int(os.getenv("COMPILED_LAYERS_MAX_BYTES", 10 * 1024 * 1024 * 1024))
+# Меняйте при изменении упаковки тайлов, чтобы старые блобы не переиспользовались
+LAYER_FORMAT_VERSION = "1"
+HASH_CHUNK_SIZE = 16 * 1024 * 1024
+# Запомненные хэши весов исходных моделей (ключ — файл модели и имя initializer)
+DIGEST_MEMO_SIZE = 4096
+
+_digests: "OrderedDict[Tuple, str]" = OrderedDict()
+_digests_lock = threading.Lock()
+
+
+def weight_digest(weight: np.ndarray, memo_key: Optional[Tuple] = None) -> str:
+    """SHA-256 of a weight's dtype, shape and bytes; memoized under ``memo_key`` when given."""
+    if memo_key is not None:
+        with _digests_lock:
+            digest = _digests.get(memo_key)
+            if digest is not None:
+                _digests.move_to_end(memo_key)
+                return digest
+    hasher = hashlib.sha256(repr((weight.dtype.str, weight.shape)).encode())
+    data = np.ascontiguousarray(weight).reshape(-1).view(np.uint8)
+    # Кусками: веса external data читаются из memmap без копии целиком
+    for start in range(0, data.size, HASH_CHUNK_SIZE):
+        hasher.update(data[start:start + HASH_CHUNK_SIZE])
+    digest = hasher.hexdigest()
+    if memo_key is not None:
+        with _digests_lock:
+            _digests[memo_key] = digest
+            while len(_digests) > DIGEST_MEMO_SIZE:
+                _digests.popitem(last=False)
+    return digest
+
+
+def layer_key(op_type: str, attributes: dict, weight_digest: str, target: Iterable) -> str:
+    """Content hash of everything a layer's packed tiles depend on.
+
+    Covers the op type and attributes, the weight (by its digest) and the
+    target fields that shape the tiles (crossbar rows/cols, weight format).
+    """
+    header = (LAYER_FORMAT_VERSION, op_type, sorted(attributes.items()), weight_digest, tuple(target))
+    return hashlib.sha256(repr(header).encode()).hexdigest()
+
+
+class LayerCache:
+    """Disk store of packed layer tiles keyed by layer_key, evicted least recently used by size."""
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.npy")
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        path = self._path(key)
+        try:
+            # memmap: байты читаются только при записи прошивки
+            packed = np.load(path, mmap_mode="r")
+            os.utime(path)
+        except (FileNotFoundError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return packed
+
+    def put(self, key: str, packed: np.ndarray) -> None:
+        path = self._path(key)
+        part = f"{path}.{uuid.uuid4().hex}{PART_SUFFIX}"
+        try:
+            with open(part, "wb") as f:
+                np.save(f, packed)
+            os.replace(part, path)
+        except BaseException:
+            if os.path.exists(part):
+                os.remove(part)
+            raise
+
+    def evict(self, keep: Iterable[str] = ()) -> None:
+        """Drop least recently used layers until the store fits the size budget."""
+        keep = {f"{key}.npy" for key in keep}
+        with self._lock:
+            entries = scan_entries(self.directory, lambda entry: entry.name.endswith(".npy"))
+            evicted = evict_lru(entries, self.max_bytes, keep=lambda mtime, path: os.path.basename(path) in keep)
+            self.evictions += len(evicted)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"max_bytes": self.max_bytes, "hits": self.hits, "misses": self.misses,
+                    "evictions": self.evictions}
+
+
+layer_cache = LayerCache(COMPILED_LAYERS_DIR, COMPILED_LAYERS_MAX_BYTES)
@@ -0,0 +1,113 @@
+import hashlib
+import os
+import re
+import shutil
+import time
+import uuid
+from typing import List, Optional, Tuple
+
+from app.services.artifact_store import (
+    FRESH_SECONDS, PROJECT_TMP_DIR, evict_lru, expire_entries, scan_entries, tree_size
+)
+
+# Загруженные модели храним в tmp проекта: tmp/models/<id>/model.onnx (+ файлы external data)
+MODELS_DIR = os.path.join(PROJECT_TMP_DIR, 'models')
+os.makedirs(MODELS_DIR, exist_ok=True)
+
+MODEL_FILENAME = "model.onnx"
+# Хранение загруженных моделей: без обращений дольше TTL удаляются, затем LRU до квоты
+MODELS_TTL_SECONDS = int(os.getenv("MODELS_TTL_SECONDS", 7 * 24 * 3600))
+MODELS_MAX_BYTES = int(os.getenv("MODELS_MAX_BYTES", 20 * 1024 * 1024 * 1024))
+
+_MODEL_ID_RE = re.compile(r"^[0-9a-f]{64}$")
+
+
+def bundle_id(model_sha256: str, external_files: List[Tuple[str, str]]) -> str:
+    """Content id of a model with its external data files ((filename, sha256) pairs).
+
+    A model without external data keeps the plain SHA-256 of its bytes.
+    """
+    if not external_files:
+        return model_sha256
+    hasher = hashlib.sha256(model_sha256.encode())
+    for filename, sha256 in sorted(external_files):
+        hasher.update(f"\n{filename}:{sha256}".encode())
+    return hasher.hexdigest()
+
+
+def external_filename(filename: Optional[str]) -> str:
+    """Safe on-disk name for an external data file (must match the tensor's location)."""
+    name = os.path.basename(filename or "")
+    if not name or name in (".", "..", MODEL_FILENAME):
+        raise ValueError(f"Invalid external data file name: {filename!r}")
+    return name
+
+
+def store_model_file(path: str, model_id: str, external_files: List[Tuple[str, str]] = ()) -> str:
+    """Move an already hashed upload and its external data ((filename, path) pairs) into the store.
+
+    Files are assembled in a staging directory and published with a single
+    rename, so a partially stored model is never visible. If the model is
+    already stored, the uploaded files are simply dropped.
+    """
+    target_dir = os.path.join(MODELS_DIR, model_id)
+    sources = [path] + [source for _, source in external_files]
+    if os.path.isdir(target_dir):
+        for source in sources:
+            os.remove(source)
+        # Повторная загрузка продлевает хранение модели
+        try:
+            os.utime(target_dir)
+        except FileNotFoundError:
+            pass
+        return model_id
+
+    staging_dir = f"{target_dir}.{uuid.uuid4().hex}.part"
+    os.makedirs(staging_dir)
+    os.replace(path, os.path.join(staging_dir, MODEL_FILENAME))
+    for filename, source in external_files:
+        os.replace(source, os.path.join(staging_dir, filename))
+    try:
+        os.replace(staging_dir, target_dir)
+    except OSError:
+        # Параллельная загрузка той же модели успела раньше
+        shutil.rmtree(staging_dir, ignore_errors=True)
+    return model_id
+
+
+def get_model_path(model_id: str) -> Optional[str]:
+    if not _MODEL_ID_RE.match(model_id):
+        return None
+    path = os.path.join(MODELS_DIR, model_id, MODEL_FILENAME)
+    if not os.path.exists(path):
+        return None
+    try:
+        # mtime каталога — время последнего обращения для sweep_models
+        os.utime(os.path.dirname(path))
+    except FileNotFoundError:
+        return None
+    return path
+
+
+def _remove_bundle(path: str) -> None:
+    # Сначала переименование: модель пропадает целиком, а не по файлам.
+    # Уже открытые (memmap) файлы остаются читаемыми до закрытия
+    doomed = f"{path}.{uuid.uuid4().hex}.part"
+    os.replace(path, doomed)
+    shutil.rmtree(doomed, ignore_errors=True)
+
+
+def sweep_models(now: Optional[float] = None, ttl: int = MODELS_TTL_SECONDS,
+                 max_bytes: int = MODELS_MAX_BYTES) -> dict:
+    """Remove stored models idle longer than ``ttl``, then the least recently used down to ``max_bytes``.
+
+    A removed model answers 404 until it is uploaded again via /parse-onnx.
+    """
+    now = now or time.time()
+    bundles = scan_entries(MODELS_DIR, lambda entry: entry.is_dir() and _MODEL_ID_RE.match(entry.name),
+                           size=lambda entry: tree_size(entry.path))
+    expired, alive = expire_entries(bundles, ttl, now, remove=_remove_bundle)
+    # Только что сохранённую модель клиент ещё не успел использовать
+    evicted = evict_lru(alive, max_bytes, remove=_remove_bundle, keep=lambda mtime, path: now - mtime < FRESH_SECONDS)
+    return {"expired": len(expired), "evicted": len(evicted),
+            "bytes": sum(size for _, _, size in expired + evicted)}
@@ -1,10 +1,351 @@
 import onnx
 import numpy as np
 import io
+import mmap
+import os
+from functools import lru_cache
+from typing import BinaryIO, Dict, List, NamedTuple, Optional, Tuple, Union
 from onnx import AttributeProto
+from onnx.external_data_helper import ExternalDataInfo
 
-def parse_onnx_model(model_stream: io.BytesIO) -> dict:
-    model = onnx.load(model_stream)
+# Сколько элементов TENSOR-атрибута возвращать как есть
+ATTRIBUTE_VALUES_LIMIT = 16
+HISTOGRAM_BINS = 32
+# Максимальный размер одного запроса к /onnx/{model_id}/weights/{name}
+MAX_SLICE_LIMIT = 100_000
+
+
+def summarize_external(init: onnx.TensorProto) -> dict:
+    """Summary of an external-data initializer from its metadata only (no stats)."""
+    dtype = np.dtype(onnx.helper.tensor_dtype_to_np_dtype(init.data_type))
+    shape = list(init.dims)
+    return {
+        "shape": shape,
+        "dtype": str(dtype),
+        "byte_size": int(np.prod(shape)) * dtype.itemsize,
+        "stats": None
+    }
+
+
+def summarize_tensor(tensor: np.ndarray, bins: int = HISTOGRAM_BINS) -> dict:
+    """Shape, dtype, byte size and value statistics of a tensor (no raw values)."""
+    summary = {
+        "shape": list(tensor.shape),
+        "dtype": str(tensor.dtype),
+        "byte_size": int(tensor.nbytes),
+        "stats": None
+    }
+    if tensor.size == 0 or not (np.issubdtype(tensor.dtype, np.number) or tensor.dtype == np.bool_):
+        return summary
+
+    flat = tensor.reshape(-1)
+    if flat.dtype == np.bool_:
+        flat = flat.astype(np.uint8)
+    finite = flat[np.isfinite(flat)] if np.issubdtype(flat.dtype, np.floating) else flat
+    if finite.size == 0:
+        return summary
+
+    counts, bin_edges = np.histogram(finite, bins=bins)
+    summary["stats"] = {
+        "min": float(finite.min()),
+        "max": float(finite.max()),
+        "mean": float(finite.mean(dtype=np.float64)),
+        "std": float(finite.std(dtype=np.float64)),
+        "sparsity": 1.0 - np.count_nonzero(flat) / flat.size,
+        "histogram": {
+            "counts": counts.tolist(),
+            "bin_edges": bin_edges.tolist()
+        }
+    }
+    return summary
+
+
+def load_model_structure(model_source: Union[str, BinaryIO]) -> onnx.ModelProto:
+    """Load the graph without external tensor data; weights stay on disk."""
+    return onnx.load(model_source, load_external_data=False)
+
+
+def is_external(init: onnx.TensorProto) -> bool:
+    return init.data_location == onnx.TensorProto.EXTERNAL
+
+
+def tensor_array(init: onnx.TensorProto, base_dir: Optional[str] = None) -> np.ndarray:
+    """Numpy array for an initializer.
+
+    Tensors saved with external data are memory-mapped from their weight file
+    (relative to ``base_dir``, the model's directory), so only the pages that
+    are actually touched get read.
+    """
+    if not is_external(init):
+        return onnx.numpy_helper.to_array(init)
+    if base_dir is None:
+        raise ValueError(f"Tensor '{init.name}' uses external data but the model directory is unknown")
+
+    info = ExternalDataInfo(init)
+    root = os.path.realpath(base_dir)
+    data_path = os.path.realpath(os.path.join(root, info.location))
+    # Не даём location выйти за пределы каталога модели
+    if os.path.commonpath([root, data_path]) != root or not os.path.isfile(data_path):
+        raise ValueError(f"External data file '{info.location}' for '{init.name}' not found")
+
+    dtype = np.dtype(onnx.helper.tensor_dtype_to_np_dtype(init.data_type)).newbyteorder("<")
+    shape = tuple(init.dims)
+    count = int(np.prod(shape))
+    if info.length is not None and info.length != count * dtype.itemsize:
+        raise ValueError(f"Unsupported external layout for '{init.name}' ({onnx.TensorProto.DataType.Name(init.data_type)})")
+    if count == 0:
+        return np.empty(shape, dtype=dtype)
+    mapped = np.memmap(data_path, dtype=dtype, mode="r", offset=info.offset or 0, shape=(count,))
+    return mapped.reshape(shape)
+
+
+# Номера полей protobuf, по которым initializers находятся в файле без разбора всей модели
+_GRAPH_FIELD = onnx.ModelProto.DESCRIPTOR.fields_by_name["graph"].number
+_INITIALIZER_FIELD = onnx.GraphProto.DESCRIPTOR.fields_by_name["initializer"].number
+_NAME_FIELD = onnx.TensorProto.DESCRIPTOR.fields_by_name["name"].number
+_RAW_DATA_FIELD = onnx.TensorProto.DESCRIPTOR.fields_by_name["raw_data"].number
+INITIALIZER_INDEX_CACHE_SIZE = 64
+
+
+class IndexedInitializer(NamedTuple):
+    proto: bytes  # сериализованный TensorProto без raw_data
+    raw_offset: int  # смещение raw_data в файле модели, -1 — raw_data нет
+    raw_length: int
+
+
+def _varint(buf, pos: int) -> Tuple[int, int]:
+    result = shift = 0
+    while True:
+        byte = buf[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return result, pos
+        shift += 7
+
+
+def _fields(buf, start: int, end: int):
+    """(field number, key start, value start, value end) of each field of the protobuf message buf[start:end]."""
+    pos = start
+    while pos < end:
+        key_start = pos
+        key, pos = _varint(buf, pos)
+        field, wire_type = key >> 3, key & 7
+        if wire_type == 0:
+            _, value_end = _varint(buf, pos)
+        elif wire_type == 1:
+            value_end = pos + 8
+        elif wire_type == 2:
+            length, pos = _varint(buf, pos)
+            value_end = pos + length
+        elif wire_type == 5:
+            value_end = pos + 4
+        else:
+            raise ValueError(f"Unsupported protobuf wire type {wire_type}")
+        if value_end > end:
+            raise ValueError("Truncated ONNX model")
+        yield field, key_start, pos, value_end
+        pos = value_end
+
+
+@lru_cache(maxsize=INITIALIZER_INDEX_CACHE_SIZE)
+def _initializer_index(path: str, mtime_ns: int, size: int) -> Dict[str, IndexedInitializer]:
+    index = {}
+    if not size:
+        return index
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+        for field, _, graph_start, graph_end in _fields(buf, 0, size):
+            if field != _GRAPH_FIELD:
+                continue
+            for field, _, start, end in _fields(buf, graph_start, graph_end):
+                if field != _INITIALIZER_FIELD:
+                    continue
+                # Всё, кроме raw_data, копируется: имя, формы, тип, external data, typed-поля
+                parts, raw_offset, raw_length, name = [], -1, 0, ""
+                for tensor_field, key_start, value_start, value_end in _fields(buf, start, end):
+                    if tensor_field == _RAW_DATA_FIELD:
+                        raw_offset, raw_length = value_start, value_end - value_start
+                        continue
+                    if tensor_field == _NAME_FIELD:
+                        name = buf[value_start:value_end].decode("utf-8")
+                    parts.append(buf[key_start:value_end])
+                # При повторе имени берётся первый initializer, как при поиске по графу
+                index.setdefault(name, IndexedInitializer(b"".join(parts), raw_offset, raw_length))
+    return index
+
+
+def initializer_index(model_path: str) -> Dict[str, IndexedInitializer]:
+    """Name -> location of every initializer of a stored model, without reading the weights.
+
+    Built once per model file (keyed by path, mtime and size) by scanning the
+    protobuf wire format; raw_data is located, not copied.
+    """
+    stat = os.stat(model_path)
+    return _initializer_index(os.path.realpath(model_path), stat.st_mtime_ns, stat.st_size)
+
+
+def _load_initializer(model_path: str, name: str) -> Optional[Tuple[onnx.TensorProto, Optional[np.ndarray]]]:
+    """An initializer without raw_data and its raw_data bytes memory-mapped from the model file (or None)."""
+    entry = initializer_index(model_path).get(name)
+    if entry is None:
+        return None
+    init = onnx.TensorProto.FromString(entry.proto)
+    if entry.raw_offset < 0:
+        return init, None
+    if not entry.raw_length:
+        return init, np.empty(0, dtype=np.uint8)
+    return init, np.memmap(model_path, dtype=np.uint8, mode="r", offset=entry.raw_offset,
+                           shape=(entry.raw_length,))
+
+
+def _raw_array(init: onnx.TensorProto, raw: np.ndarray) -> np.ndarray:
+    dtype = np.dtype(onnx.helper.tensor_dtype_to_np_dtype(init.data_type)).newbyteorder("<")
+    shape = tuple(init.dims)
+    if len(raw) == dtype.itemsize * int(np.prod(shape)):
+        return raw.view(dtype).reshape(shape)
+    # Нестандартная упаковка (например, 4-битные типы) — через onnx
+    init.raw_data = raw.tobytes()
+    return onnx.numpy_helper.to_array(init)
+
+
+def get_tensor_slice(model_path: str, name: str, offset: int = 0, limit: int = 1000) -> Optional[dict]:
+    """Return a flat [offset, offset + limit) window of one initializer, or None if absent."""
+    found = _load_initializer(model_path, name)
+    if found is None:
+        return None
+
+    init, raw = found
+    tensor = _raw_array(init, raw) if raw is not None else tensor_array(init, os.path.dirname(model_path))
+    flat = tensor.reshape(-1)
+    limit = min(limit, MAX_SLICE_LIMIT)
+    window = flat[offset:offset + limit]
+    return {
+        "name": name,
+        "shape": list(tensor.shape),
+        "dtype": str(tensor.dtype),
+        "total": int(flat.size),
+        "offset": offset,
+        "limit": limit,
+        "values": window.tolist()
+    }
+
+
+def get_tensor_buffer(model_path: str, name: str) -> Optional[Tuple[np.dtype, List[int], memoryview]]:
+    """Little-endian bytes of one initializer as (dtype, shape, buffer), or None if absent.
+
+    When the initializer is stored in ``raw_data`` (the usual case for exported
+    models) the buffer maps that range of the model file, without decoding to
+    numpy first; external data is served straight from the memory-mapped
+    weight file.
+    """
+    found = _load_initializer(model_path, name)
+    if found is None:
+        return None
+    init, raw = found
+    if init.data_type == onnx.TensorProto.STRING:
+        raise ValueError(f"Tensor '{name}' holds strings and has no binary layout")
+
+    shape = list(init.dims)
+    dtype = np.dtype(onnx.helper.tensor_dtype_to_np_dtype(init.data_type)).newbyteorder("<")
+    # raw_data по спецификации ONNX всегда little-endian
+    if raw is not None and len(raw) == dtype.itemsize * int(np.prod(shape)):
+        return dtype, shape, memoryview(raw)
+
+    tensor = _raw_array(init, raw) if raw is not None else tensor_array(init, os.path.dirname(model_path))
+    if not isinstance(tensor, np.memmap):
+        tensor = np.ascontiguousarray(tensor, dtype=tensor.dtype.newbyteorder("<"))
+    return tensor.dtype, shape, memoryview(tensor.reshape(-1)).cast("B")
+
+
+def npy_header(dtype: np.dtype, shape: List[int]) -> bytes:
+    """NPY v1.0 header for a C-ordered array; the raw buffer follows it as-is."""
+    header = io.BytesIO()
+    np.lib.format.write_array_header_1_0(header, {
+        "descr": np.lib.format.dtype_to_descr(dtype),
+        "fortran_order": False,
+        "shape": tuple(shape)
+    })
+    return header.getvalue()
+
+
+# Пространства имён виртуальных узлов: имена тензоров могут совпадать с именами узлов
+INPUT_PREFIX = "input:"
+INITIALIZER_PREFIX = "init:"
+
+
+def _node_label(node) -> str:
+    return node.name or node.op_type
+
+
+def build_edges(graph, nodes: list) -> list:
+    """Build graph edges in O(N) using a tensor name -> producer index.
+
+    Graph inputs and initializers have no producing node, so they are added
+    to ``nodes`` as virtual source nodes (op_type ``Input``/``Initializer``)
+    and connected to their consumers like any other tensor. Their ids are
+    prefixed (``input:``/``init:``) so they never collide with node names.
+    """
+    initializer_names = {init.name for init in graph.initializer}
+
+    # Индекс: имя тензора -> имя узла, который его производит
+    producers = {}
+    for graph_input in graph.input:
+        # Старые opset'ы дублируют initializers в graph.input
+        if graph_input.name in initializer_names:
+            continue
+        producers[graph_input.name] = INPUT_PREFIX + graph_input.name
+        nodes.append(_virtual_node(graph_input.name, "Input"))
+    for name in initializer_names:
+        producers[name] = INITIALIZER_PREFIX + name
+    for node in graph.node:
+        label = _node_label(node)
+        for output_name in node.output:
+            if output_name:
+                producers[output_name] = label
+
+    edges = []
+    used_initializers = set()
+    for node in graph.node:
+        target = _node_label(node)
+        for input_name in node.input:
+            source = producers.get(input_name)
+            if source is None:
+                continue
+            if input_name in initializer_names:
+                used_initializers.add(input_name)
+            edges.append({
+                "from": source,
+                "to": target,
+                "label": input_name
+            })
+
+    # Виртуальные узлы только для реально используемых initializers
+    for init in graph.initializer:
+        if init.name in used_initializers:
+            nodes.append(_virtual_node(init.name, "Initializer"))
+            used_initializers.discard(init.name)
+
+    return edges
+
+
+def _virtual_node(tensor_name: str, op_type: str) -> dict:
+    prefix = INPUT_PREFIX if op_type == "Input" else INITIALIZER_PREFIX
+    return {
+        "name": prefix + tensor_name,
+        "op_type": op_type,
+        "inputs": [],
+        "outputs": [tensor_name],
+        "attributes": {}
+    }
+
+
+def parse_onnx_model(model_source: Union[str, BinaryIO]) -> dict:
+    """Parse an ONNX model given as a file path or a binary stream.
+
+    External tensor data is never loaded: such weights are summarized from
+    their shape/dtype only and can be fetched later through get_tensor_slice.
+    """
+    model = load_model_structure(model_source)
     graph = model.graph
 
     # Извлекаем узлы (nodes) для графа
@@ -26,17 +367,15 @@ def parse_onnx_model(model_stream: io.BytesIO) -> dict:
                 attributes[attr.name] = [s.decode('utf-8') for s in attr.strings]
             elif attr.type == AttributeProto.TENSOR:  # 4
                 tensor = onnx.numpy_helper.to_array(attr.t)
-                attributes[attr.name] = {
-                    "type": "tensor",
-                    "shape": list(tensor.shape),
-                    #"values": tensor.flatten().tolist()[:100]  # Preview
-                    "values": tensor.flatten().tolist()
-                }
+                attributes[attr.name] = {"type": "tensor", **summarize_tensor(tensor)}
+                # Маленькие константы (shape, axes, скаляры) отдаём целиком
+                if tensor.size <= ATTRIBUTE_VALUES_LIMIT:
+                    attributes[attr.name]["values"] = tensor.flatten().tolist()
             else:
                 attributes[attr.name] = f"unsupported type {attr.type}"  # Строка для других
 
         node_data = {
-            "name": node.name or node.op_type,
+            "name": _node_label(node),
             "op_type": node.op_type,
             "inputs": list(node.input),
             "outputs": list(node.output),
@@ -44,28 +383,16 @@ def parse_onnx_model(model_stream: io.BytesIO) -> dict:
         }
         nodes.append(node_data)
 
-    # Извлекаем связи (edges)
-    edges = []
-    for node in graph.node:
-        for input_name in node.input:
-            for source_node in graph.node:
-                if input_name in source_node.output:
-                    edges.append({
-                        "from": source_node.name or source_node.op_type,
-                        "to": node.name or node.op_type,
-                        "label": input_name
-                    })
+    # Извлекаем связи (edges) за один проход по индексу производителей
+    edges = build_edges(graph, nodes)
 
     # Извлекаем веса (initializers)
     weights = {}
     for init in graph.initializer:
-        tensor = onnx.numpy_helper.to_array(init)
-        weights[init.name] = {
-            "shape": list(tensor.shape),
-            "dtype": str(tensor.dtype),
-            #"values": tensor.flatten().tolist()[:100]  # Ограничиваем для preview
-            "values": tensor.flatten().tolist()
-        }
+        if is_external(init):
+            weights[init.name] = summarize_external(init)
+        else:
+            weights[init.name] = summarize_tensor(onnx.numpy_helper.to_array(init))
 
     # Возвращаем данные
     return {
@@ -0,0 +1,126 @@
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from typing import Optional
+
+from app.services.artifact_store import PART_SUFFIX, PROJECT_TMP_DIR, evict_lru, scan_entries
+
+# Разобранные графы: LRU в памяти + JSON на диске в tmp проекта
+PARSED_CACHE_DIR = os.path.join(PROJECT_TMP_DIR, 'parsed')
+os.makedirs(PARSED_CACHE_DIR, exist_ok=True)
+
+PARSE_CACHE_MAX_BYTES = int(os.getenv("PARSE_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+PARSE_CACHE_DISK_MAX_BYTES = int(os.getenv("PARSE_CACHE_DISK_MAX_BYTES", 2 * 1024 * 1024 * 1024))
+# Меняйте при изменении формата ответа parse_onnx_model, чтобы старые записи на диске не отдавались
+PARSER_VERSION = "2"
+
+
+class ParsedModelCache:
+    """Content-addressed cache of serialized /parse-onnx (and graph analytics) responses.
+
+    Keys are SHA-256 hashes of the uploaded ONNX bytes (plus request options
+    where the response depends on them), values are the ready-to-send JSON
+    bodies. The in-memory tier is an LRU bounded by total
+    byte size; every entry is also written to disk so it survives restarts
+    and memory evictions. The disk tier is an LRU (by file mtime) bounded
+    by ``disk_max_bytes``.
+    """
+
+    def __init__(self, directory: str, max_bytes: int, disk_max_bytes: int, version: str = PARSER_VERSION):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.disk_max_bytes = disk_max_bytes
+        self.version = version
+        self._entries: "OrderedDict[str, bytes]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.disk_evictions = 0
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}-v{self.version}.json")
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            body = self._entries.get(key)
+            if body is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return body
+
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                body = f.read()
+            os.utime(path)
+        except FileNotFoundError:
+            # Нет файла или его только что вытеснили
+            body = None
+        if body is not None:
+            with self._lock:
+                self.disk_hits += 1
+            self._remember(key, body)
+            return body
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key: str, body: bytes) -> None:
+        path = self._path(key)
+        # Уникальное имя: одновременные put одного ключа не пишут в один файл
+        tmp_path = f"{path}.{uuid.uuid4().hex}{PART_SUFFIX}"
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(body)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self._remember(key, body)
+        self.evict_disk(keep=(path,))
+
+    def evict_disk(self, keep=()) -> None:
+        """Drop least recently used files until the disk tier fits ``disk_max_bytes``."""
+        keep = {os.path.basename(path) for path in keep}
+        entries = scan_entries(self.directory, lambda entry: entry.name.endswith(".json"))
+        evicted = evict_lru(entries, self.disk_max_bytes, keep=lambda mtime, path: os.path.basename(path) in keep)
+        with self._lock:
+            self.disk_evictions += len(evicted)
+
+    def _remember(self, key: str, body: bytes) -> None:
+        # Записи больше всего бюджета держим только на диске
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size -= len(previous)
+            self._entries[key] = body
+            self._size += len(body)
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._size,
+                "max_bytes": self.max_bytes,
+                "disk_max_bytes": self.disk_max_bytes,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "disk_evictions": self.disk_evictions
+            }
+
+
+parse_cache = ParsedModelCache(PARSED_CACHE_DIR, PARSE_CACHE_MAX_BYTES, PARSE_CACHE_DISK_MAX_BYTES)
@@ -0,0 +1,413 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass, field
+from functools import lru_cache
+from importlib import metadata
+from typing import Dict, Optional, Tuple
+
+from app.services.artifact_store import PART_SUFFIX, PROJECT_TMP_DIR, evict_lru, scan_entries, tree_size
+
+# Лимиты на один процесс uvicorn
+QUANTIZE_MAX_WORKERS = int(os.getenv("QUANTIZE_MAX_WORKERS", 2))
+QUANTIZE_MAX_PENDING = int(os.getenv("QUANTIZE_MAX_PENDING", 16))
+# Записи о завершённых jobs (completed/failed/cancelled) забываются через это время
+QUANTIZE_JOB_TTL_SECONDS = int(os.getenv("QUANTIZE_JOB_TTL_SECONDS", 3600))
+
+# Результаты квантизации: tmp/quantized/<ключ>/model.onnx (+ model.onnx.data)
+QUANTIZED_DIR = os.path.join(PROJECT_TMP_DIR, 'quantized')
+os.makedirs(QUANTIZED_DIR, exist_ok=True)
+QUANTIZED_CACHE_MAX_BYTES = int(os.getenv("QUANTIZED_CACHE_MAX_BYTES", 20 * 1024 * 1024 * 1024))
+QUANTIZED_FILENAME = "model.onnx"
+
+PROGRESS_FILENAME = "progress.json"
+CANCEL_FILENAME = "cancel"
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class QueueFull(Exception):
+    pass
+
+
+def _report(work_dir: str, stage: str, progress: float) -> None:
+    path = os.path.join(work_dir, PROGRESS_FILENAME)
+    with open(f"{path}.part", "w") as f:
+        json.dump({"stage": stage, "progress": progress}, f)
+    os.replace(f"{path}.part", path)
+
+
+def _check_cancelled(work_dir: str) -> None:
+    if os.path.exists(os.path.join(work_dir, CANCEL_FILENAME)):
+        raise JobCancelled()
+
+
+def run_quantization(work_dir: str, original_path: str, quantized_path: str, quant_type: str,
+                     use_external_data_format: bool, calibration: Optional[dict] = None) -> dict:
+    """Validate and quantize a model. Runs inside a worker process.
+
+    Without ``calibration`` this is dynamic quantization. With it (keys:
+    dataset_paths, dataset_id, model_id, method, batch_size) activations are
+    calibrated on the streamed dataset and the model is quantized statically
+    in QDQ format.
+
+    Progress is published to ``work_dir/progress.json``; cancellation is
+    cooperative (a ``cancel`` marker file checked between stages), since
+    quantize_dynamic itself cannot be interrupted.
+    """
+    # Тяжёлые импорты только в дочернем процессе
+    import onnx
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+    from app.services.calibration import (
+        calibration_cache_path, compute_tensor_ranges, quantize_static_with_ranges, default_op_types
+    )
+
+    _report(work_dir, "checking", 0.1)
+    try:
+        onnx.checker.check_model(original_path)
+    except Exception as e:
+        raise ValueError(f"Invalid ONNX model: {str(e)}")
+    _check_cancelled(work_dir)
+
+    weight_type = QuantType.QInt8 if quant_type == "int8" else QuantType.QUInt8
+    result = {}
+    if calibration is None:
+        _report(work_dir, "quantizing", 0.3)
+        quantize_dynamic(
+            original_path,
+            quantized_path,
+            weight_type=weight_type,
+            # Большие модели и на выходе сохраняем с external data (<имя>.onnx.data)
+            use_external_data_format=use_external_data_format
+        )
+    else:
+        op_types = default_op_types()
+        batches = 0
+
+        def on_batch():
+            nonlocal batches
+            batches += 1
+            _report(work_dir, f"calibrating (batch {batches})", 0.3)
+            _check_cancelled(work_dir)
+
+        _report(work_dir, "calibrating", 0.2)
+        tensors_range, cache_hit = compute_tensor_ranges(
+            original_path,
+            calibration["dataset_paths"],
+            calibration["method"],
+            op_types,
+            calibration["batch_size"],
+            use_external_data_format,
+            cache_path=calibration_cache_path(
+                calibration["model_id"], calibration["dataset_id"], calibration["method"], op_types
+            ),
+            on_batch=on_batch
+        )
+        _check_cancelled(work_dir)
+
+        _report(work_dir, "quantizing", 0.7)
+        quantize_static_with_ranges(
+            original_path, quantized_path, weight_type, tensors_range, op_types, use_external_data_format
+        )
+        result = {"calibration_method": calibration["method"], "calibration_cache_hit": cache_hit,
+                  "calibration_batches": batches}
+    _check_cancelled(work_dir)
+
+    quantized_size = os.path.getsize(quantized_path)
+    if os.path.exists(f"{quantized_path}.data"):
+        quantized_size += os.path.getsize(f"{quantized_path}.data")
+    _report(work_dir, "finished", 1.0)
+    return {"quantized_path": quantized_path, "quantized_size": quantized_size, **result}
+
+
+@dataclass
+class QuantizationJob:
+    id: str
+    key: str
+    work_dir: str
+    original_path: str
+    original_size: int
+    quantized_path: str
+    quant_type: str
+    mode: str = "dynamic"  # dynamic, static
+    status: str = "queued"  # queued, running, completed, failed, cancelled
+    error: Optional[str] = None
+    result: Optional[dict] = None
+    cancel_requested: bool = False
+    # Сколько запросов ждут этот job (одинаковые запросы разделяют одно вычисление)
+    subscribers: int = 1
+    created_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+    future: Optional[Future] = None
+
+
+@lru_cache(maxsize=1)
+def onnxruntime_version() -> str:
+    """Installed onnxruntime version, read from package metadata without importing onnxruntime."""
+    for distribution in ("onnxruntime", "onnxruntime-gpu"):
+        try:
+            return metadata.version(distribution)
+        except metadata.PackageNotFoundError:
+            continue
+    return "unknown"
+
+
+def artifact_key(model_id: str, options: dict) -> str:
+    """Content address of a quantized model: input hash + quantization options + onnxruntime version."""
+    return hashlib.sha256(json.dumps({
+        "model": model_id,
+        "options": options,
+        "onnxruntime": onnxruntime_version()
+    }, sort_keys=True).encode()).hexdigest()
+
+
+class QuantizationJobManager:
+    """Runs quantization jobs in a bounded process pool, outside the event loop.
+
+    Results are stored content-addressed under ``artifacts_dir/<key>/`` (see
+    artifact_key): a request whose result already exists completes at once,
+    and identical requests submitted while one is in flight share that job
+    (single-flight). The artifact directory is kept under ``max_artifact_bytes``
+    by evicting the least recently used results. Finished jobs are forgotten
+    ``job_ttl`` seconds after they finish.
+    """
+
+    def __init__(self, max_workers: int, max_pending: int, artifacts_dir: str, max_artifact_bytes: int,
+                 job_ttl: int = QUANTIZE_JOB_TTL_SECONDS):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.job_ttl = job_ttl
+        self.artifacts_dir = artifacts_dir
+        self.max_artifact_bytes = max_artifact_bytes
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._jobs: Dict[str, QuantizationJob] = {}
+        self._inflight: Dict[str, QuantizationJob] = {}
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.shared = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        # Пул создаётся лениво; spawn — чтобы не форкать процесс сервера с его потоками и соединениями,
+        # один job на процесс — чтобы память после больших моделей возвращалась системе
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                max_tasks_per_child=1
+            )
+        return self._executor
+
+    def _artifact_path(self, key: str) -> str:
+        return os.path.join(self.artifacts_dir, key, QUANTIZED_FILENAME)
+
+    def submit(self, work_dir: str, original_path: str, original_size: int, model_id: str, quant_type: str,
+               use_external_data_format: bool, calibration: Optional[dict] = None) -> Tuple[QuantizationJob, str]:
+        """Submit a job; returns (job, source) with source 'submitted', 'shared' or 'cached'.
+
+        For 'shared' and 'cached' the caller's work_dir is removed right away.
+        """
+        mode = "static" if calibration else "dynamic"
+        # Формат external data меняет раскладку результата, поэтому тоже входит в ключ
+        options = {"mode": mode, "quant_type": quant_type, "external_data": use_external_data_format}
+        if calibration:
+            options.update(
+                calibration_method=calibration["method"],
+                calibration_dataset=calibration["dataset_id"],
+                calibration_batch_size=calibration["batch_size"]
+            )
+        key = artifact_key(model_id, options)
+
+        with self._lock:
+            self.expire_jobs()
+            inflight = self._inflight.get(key)
+            if inflight is not None:
+                inflight.subscribers += 1
+                self.shared += 1
+                shutil.rmtree(work_dir, ignore_errors=True)
+                return inflight, "shared"
+
+            job = QuantizationJob(
+                id=uuid.uuid4().hex,
+                key=key,
+                work_dir=work_dir,
+                original_path=original_path,
+                original_size=original_size,
+                quantized_path=self._artifact_path(key),
+                quant_type=quant_type,
+                mode=mode
+            )
+            artifact_dir = os.path.dirname(job.quantized_path)
+            if os.path.isdir(artifact_dir):
+                # Готовый результат: помечаем как недавно использованный
+                os.utime(artifact_dir)
+                job.status = "completed"
+                job.finished_at = time.time()
+                job.result = {"quantized_path": job.quantized_path, "quantized_size": tree_size(artifact_dir),
+                              "cached": True}
+                self._jobs[job.id] = job
+                self.hits += 1
+                shutil.rmtree(work_dir, ignore_errors=True)
+                return job, "cached"
+
+            pending = len(self._inflight)
+            if pending >= self.max_pending:
+                raise QueueFull(f"Too many quantization jobs in progress ({pending})")
+
+            # Результат пишется в staging-каталог и публикуется переименованием после успеха
+            staging_dir = f"{artifact_dir}.{job.id}.part"
+            os.makedirs(staging_dir)
+            staging_path = os.path.join(staging_dir, QUANTIZED_FILENAME)
+            self._jobs[job.id] = job
+            self._inflight[key] = job
+            self.misses += 1
+            job.future = self._get_executor().submit(
+                run_quantization, work_dir, original_path, staging_path, quant_type, use_external_data_format,
+                calibration
+            )
+        job.future.add_done_callback(lambda future: self._on_done(job, future, staging_dir))
+        return job, "submitted"
+
+    def _on_done(self, job: QuantizationJob, future: Future, staging_dir: str) -> None:
+        with self._lock:
+            job.finished_at = time.time()
+            if future.cancelled():
+                job.status = "cancelled"
+            else:
+                error = future.exception()
+                if isinstance(error, JobCancelled) or (error is None and job.cancel_requested):
+                    job.status = "cancelled"
+                elif error is not None:
+                    job.status = "failed"
+                    job.error = str(error)
+                else:
+                    job.status = "completed"
+                    job.result = {**future.result(), "quantized_path": job.quantized_path, "cached": False}
+
+            if job.status == "completed":
+                try:
+                    os.replace(staging_dir, os.path.dirname(job.quantized_path))
+                except OSError:
+                    # Такой же результат уже опубликован
+                    shutil.rmtree(staging_dir, ignore_errors=True)
+            else:
+                shutil.rmtree(staging_dir, ignore_errors=True)
+            self._inflight.pop(job.key, None)
+        # Оригинал (и его external data) больше не нужен
+        shutil.rmtree(job.work_dir, ignore_errors=True)
+        if job.status == "completed":
+            self.evict(keep=job.key)
+
+    def _scan_artifacts(self):
+        return scan_entries(self.artifacts_dir, lambda entry: entry.is_dir() and not entry.name.endswith(PART_SUFFIX),
+                            size=lambda entry: tree_size(entry.path))
+
+    def evict(self, keep: Optional[str] = None) -> None:
+        """Drop least recently used results until the artifact directory fits the size budget."""
+        with self._lock:
+            protected = {keep, *self._inflight}
+            evicted = evict_lru(self._scan_artifacts(), self.max_artifact_bytes,
+                                remove=lambda path: shutil.rmtree(path, ignore_errors=True),
+                                keep=lambda mtime, path: os.path.basename(path) in protected)
+            self.evictions += len(evicted)
+
+    def expire_jobs(self, now: Optional[float] = None) -> int:
+        """Forget jobs that finished more than ``job_ttl`` seconds ago; returns how many."""
+        now = now or time.time()
+        with self._lock:
+            expired = [job_id for job_id, job in self._jobs.items()
+                       if job.finished_at is not None and now - job.finished_at > self.job_ttl]
+            for job_id in expired:
+                del self._jobs[job_id]
+        return len(expired)
+
+    def get(self, job_id: str) -> Optional[QuantizationJob]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            # Истёкший job отдаётся как отсутствующий, даже если очистка ещё не прошла
+            if job is not None and job.finished_at is not None and time.time() - job.finished_at > self.job_ttl:
+                del self._jobs[job_id]
+                return None
+            return job
+
+    def describe(self, job: QuantizationJob) -> dict:
+        status = job.status
+        stage, progress = status, 1.0 if status == "completed" else 0.0
+        if status == "queued" and job.future is not None and job.future.running():
+            status = "running"
+        if status in ("queued", "running"):
+            try:
+                with open(os.path.join(job.work_dir, PROGRESS_FILENAME)) as f:
+                    reported = json.load(f)
+                status, stage, progress = "running", reported["stage"], reported["progress"]
+            except (OSError, ValueError):
+                stage = status
+
+        info = {
+            "job_id": job.id,
+            "status": status,
+            "stage": stage,
+            "progress": progress,
+            "quant_type": job.quant_type,
+            "mode": job.mode,
+            "cancel_requested": job.cancel_requested,
+            "created_at": job.created_at,
+            "finished_at": job.finished_at,
+            "error": job.error
+        }
+        if job.result:
+            info["quantized_path"] = job.result["quantized_path"]
+            info["size_reduction"] = f"{job.result['quantized_size'] / job.original_size * 100:.1f}%"
+            for key in ("cached", "calibration_method", "calibration_cache_hit", "calibration_batches"):
+                if key in job.result:
+                    info[key] = job.result[key]
+        return info
+
+    def cancel(self, job: QuantizationJob) -> None:
+        with self._lock:
+            if job.status not in ("queued", "running"):
+                return
+            # Job нужен другим запросам — просто отписываемся
+            if job.subscribers > 1:
+                job.subscribers -= 1
+                return
+            job.cancel_requested = True
+            if job.future is not None and job.future.cancel():
+                return
+        # Уже выполняется — воркер увидит маркер между этапами
+        if os.path.isdir(job.work_dir):
+            open(os.path.join(job.work_dir, CANCEL_FILENAME), "w").close()
+
+    def stats(self) -> dict:
+        with self._lock:
+            artifacts = self._scan_artifacts()
+            return {
+                "artifacts": len(artifacts),
+                "bytes": sum(size for _, _, size in artifacts),
+                "max_bytes": self.max_artifact_bytes,
+                "in_flight": len(self._inflight),
+                "jobs": len(self._jobs),
+                "hits": self.hits,
+                "shared": self.shared,
+                "misses": self.misses,
+                "evictions": self.evictions
+            }
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+quantization_jobs = QuantizationJobManager(
+    QUANTIZE_MAX_WORKERS, QUANTIZE_MAX_PENDING, QUANTIZED_DIR, QUANTIZED_CACHE_MAX_BYTES
+)
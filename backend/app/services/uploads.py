@@ -0,0 +1,86 @@
+import hashlib
+import os
+import uuid
+from typing import List, NamedTuple, Tuple
+from fastapi import HTTPException, UploadFile
+from starlette.concurrency import run_in_threadpool
+from app.services.artifact_store import PROJECT_TMP_DIR
+from app.services.model_store import external_filename
+
+# Загрузки пишем кусками во временные файлы, а не держим целиком в памяти
+UPLOADS_DIR = os.path.join(PROJECT_TMP_DIR, 'uploads')
+os.makedirs(UPLOADS_DIR, exist_ok=True)
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+# Лимит на все файлы одного запроса (модель вместе с external data и т.п.)
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", 4 * 1024 * 1024 * 1024))
+
+
+class SpooledUpload(NamedTuple):
+    path: str
+    sha256: str
+    size: int
+
+
+def _write_chunk(f, hasher, chunk: bytes) -> None:
+    f.write(chunk)
+    hasher.update(chunk)
+
+
+async def spool_upload(
+    upload: UploadFile,
+    suffix: str = "",
+    directory: str = UPLOADS_DIR,
+    max_bytes: int = UPLOAD_MAX_BYTES,
+    spent: int = 0
+) -> SpooledUpload:
+    """Copy an upload to a temp file chunk by chunk, hashing it on the way.
+
+    The caller owns the returned file: move it into place with os.replace
+    or delete it. Raises 413 if the upload plus ``spent`` bytes already
+    received in the same request exceeds ``max_bytes``.
+    """
+    path = os.path.join(directory, f"upload_{uuid.uuid4().hex}{suffix}")
+    hasher = hashlib.sha256()
+    size = 0
+    try:
+        with open(path, "wb") as f:
+            while True:
+                chunk = await upload.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if spent + size > max_bytes:
+                    raise HTTPException(413, f"Upload exceeds the {max_bytes} byte limit")
+                await run_in_threadpool(_write_chunk, f, hasher, chunk)
+    except BaseException:
+        os.remove(path)
+        raise
+    return SpooledUpload(path=path, sha256=hasher.hexdigest(), size=size)
+
+
+async def spool_external_data(
+    uploads: List[UploadFile],
+    directory: str = UPLOADS_DIR,
+    spent: int = 0
+) -> List[Tuple[str, SpooledUpload]]:
+    """Spool external data files of an ONNX model, keeping their original file names.
+
+    ``spent`` bytes of the request are already spooled; all files together
+    must fit in UPLOAD_MAX_BYTES.
+    """
+    spooled = []
+    try:
+        for upload in uploads:
+            try:
+                filename = external_filename(upload.filename)
+            except ValueError as e:
+                raise HTTPException(400, str(e))
+            item = await spool_upload(upload, directory=directory, spent=spent)
+            spent += item.size
+            spooled.append((filename, item))
+    except BaseException:
+        for _, item in spooled:
+            os.remove(item.path)
+        raise
+    return spooled
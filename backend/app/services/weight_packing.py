@@ -0,0 +1,221 @@
+import logging
+import math
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+from typing import List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+WEIGHT_DTYPE = np.int8
+WEIGHT_QMAX = 127
+
+COMPILER_MAX_WORKERS = int(os.getenv("COMPILER_MAX_WORKERS", os.cpu_count() or 1))
+# Слои меньше этого числа весов пакуются в текущем процессе: пул дороже самой упаковки
+COMPILER_PARALLEL_MIN = int(os.getenv("COMPILER_PARALLEL_MIN", 4_000_000))
+# Блочная разреженность: сторона блока и порог (доля от максимума слоя), ниже которого блок считается нулевым
+SPARSE_BLOCK = 8
+COMPILER_SPARSITY_THRESHOLD = float(os.getenv("COMPILER_SPARSITY_THRESHOLD", 0.0))
+
+
+def tile_bytes(rows: int, cols: int) -> int:
+    """Size of one packed tile: per-column float32 scales, then rows x cols int8 cells."""
+    return cols * 4 + rows * cols
+
+
+def tile_grid(shape: Tuple[int, int, int], rows: int, cols: int) -> Tuple[int, int]:
+    """(row blocks, column blocks) covering one [K, N] matrix of a [G, K, N] layer."""
+    _, k, n = shape
+    return -(-k // rows), -(-n // cols)
+
+
+def pack_tiles(matrices: np.ndarray, rows: int, cols: int) -> np.ndarray:
+    """Quantize [G, K, N] weights into int8 crossbar tiles.
+
+    Returns a [tiles, tile_bytes] uint8 array, tiles ordered by (group, row
+    block, column block); edges are zero-padded. Each tile is quantized on
+    its own (symmetric, per column), so any split of the row blocks packs
+    to the same bytes.
+    """
+    groups, k, n = matrices.shape
+    row_blocks, col_blocks = tile_grid(matrices.shape, rows, cols)
+    padded = matrices
+    if (k, n) != (row_blocks * rows, col_blocks * cols):
+        padded = np.zeros((groups, row_blocks * rows, col_blocks * cols), dtype=np.float32)
+        padded[:, :k, :n] = matrices
+    # [G, Rb, rows, Cb, cols] -> [G, Rb, Cb, rows, cols]; копия в раскладке тайлов, дальше всё на месте
+    tiles = np.array(padded.reshape(groups, row_blocks, rows, col_blocks, cols).transpose(0, 1, 3, 2, 4),
+                     dtype=np.float32, order="C").reshape(-1, rows, cols)
+    scales = np.maximum(tiles.max(axis=1), -tiles.min(axis=1)) / WEIGHT_QMAX
+    scales[scales == 0] = 1.0
+    tiles *= (1 / scales)[:, np.newaxis, :]
+    np.rint(tiles, out=tiles)
+    np.clip(tiles, -WEIGHT_QMAX, WEIGHT_QMAX, out=tiles)
+    packed = np.empty((len(tiles), tile_bytes(rows, cols)), dtype=np.uint8)
+    packed[:, :cols * 4] = scales.astype("<f4").view(np.uint8)
+    packed[:, cols * 4:].view(WEIGHT_DTYPE)[:] = tiles.reshape(len(tiles), -1)
+    return packed
+
+
+def _pack_row_blocks(weights_name: str, shape: Tuple[int, int, int], output_name: str,
+                     rows: int, cols: int, start: int, stop: int) -> None:
+    """Pack row blocks [start, stop) (numbered across groups) from shared memory into shared memory."""
+    weights_shm = shared_memory.SharedMemory(name=weights_name)
+    output_shm = shared_memory.SharedMemory(name=output_name)
+    try:
+        matrices = np.ndarray(shape, dtype=np.float32, buffer=weights_shm.buf)
+        row_blocks, col_blocks = tile_grid(shape, rows, cols)
+        output = np.ndarray((shape[0] * row_blocks * col_blocks, tile_bytes(rows, cols)), dtype=np.uint8,
+                            buffer=output_shm.buf)
+        block = start
+        while block < stop:
+            # Диапазон может пересекать границу групп: пакуется по частям внутри группы
+            group, first = divmod(block, row_blocks)
+            last = min(row_blocks, first + stop - block)
+            part = matrices[group:group + 1, first * rows:last * rows]
+            output[block * col_blocks:(block + last - first) * col_blocks] = pack_tiles(part, rows, cols)
+            block += last - first
+        del matrices, output
+    finally:
+        weights_shm.close()
+        output_shm.close()
+
+
+class SparseTiles(NamedTuple):
+    chunks: List[np.ndarray]  # закодированный слой, по порядку
+    stored: np.ndarray  # bool [tiles]: тайл содержит ненулевые блоки
+    block_shape: Tuple[int, int]
+    blocks: int
+    zero_blocks: int
+    nbytes: int
+
+
+def sparse_block_shape(rows: int, cols: int) -> Tuple[int, int]:
+    return math.gcd(rows, SPARSE_BLOCK), math.gcd(cols, SPARSE_BLOCK)
+
+
+def block_sparse(packed: np.ndarray, rows: int, cols: int, threshold: float = 0.0) -> SparseTiles:
+    """Block-sparse encoding of packed tiles (see pack_tiles).
+
+    A block is zero when all its int8 cells are zero, or, with ``threshold``,
+    when its dequantized magnitude is at most ``threshold`` times the layer's
+    largest weight. Tiles without nonzero blocks are dropped. Layout (all
+    bitmaps little-endian bit order):
+
+        tile mask     ceil(tiles / 8) bytes, bit set for every stored tile
+        scales        stored x cols float32
+        block bitmaps stored x ceil(blocks per tile / 8) bytes, row-major blocks
+        blocks        nonzero blocks x block rows x block cols int8, in bitmap order
+    """
+    count = len(packed)
+    block_rows, block_cols = sparse_block_shape(rows, cols)
+    scales = packed[:, :cols * 4].view("<f4")
+    # Строка блока (block_cols ячеек int8, 1-8 байт) читается одним словом: проверки и сбор в 8 раз короче
+    words = packed[:, cols * 4:].view(f"<u{block_cols}").reshape(count, rows // block_rows, block_rows,
+                                                                  cols // block_cols)
+    if threshold > 0 and count:
+        cells = words.view(WEIGHT_DTYPE).reshape(count, rows // block_rows, block_rows, cols // block_cols,
+                                                 block_cols)
+        # Максимум |w| блока по столбцам: |q| * масштаб столбца
+        magnitude = np.abs(cells).max(axis=2) * scales.reshape(count, 1, cols // block_cols, block_cols)
+        magnitude = magnitude.max(axis=3)
+        nonzero = magnitude > threshold * float(magnitude.max())
+    else:
+        nonzero = (words != 0).any(axis=2)
+    stored = nonzero.any(axis=(1, 2))
+    stored_nonzero = nonzero[stored]
+    # [S, Rb, br, Cb] -> [S, Rb, Cb, br]: блоки в порядке битовой карты
+    blocks = words[stored].transpose(0, 1, 3, 2)[stored_nonzero].view(WEIGHT_DTYPE)
+    chunks = [
+        np.packbits(stored, bitorder="little"),
+        np.ascontiguousarray(scales[stored]),
+        np.packbits(stored_nonzero.reshape(len(stored_nonzero), -1 if len(stored_nonzero) else 0), axis=1,
+                    bitorder="little"),
+        blocks
+    ]
+    return SparseTiles(chunks, stored, (block_rows, block_cols), int(nonzero.size),
+                       int(nonzero.size - stored_nonzero.sum()), sum(chunk.nbytes for chunk in chunks))
+
+
+_executor: Optional[ProcessPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=COMPILER_MAX_WORKERS,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return _executor
+
+
+def _discard_executor(executor: ProcessPoolExecutor) -> None:
+    """Drop a broken pool so the next call builds a new one (unless another call already replaced it)."""
+    global _executor
+    with _executor_lock:
+        if _executor is executor:
+            _executor = None
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _block_ranges(block_count: int, range_count: int) -> List[Tuple[int, int]]:
+    range_count = max(1, min(block_count, range_count))
+    bounds = np.linspace(0, block_count, range_count + 1).astype(int)
+    return [(int(start), int(stop)) for start, stop in zip(bounds[:-1], bounds[1:]) if stop > start]
+
+
+def pack_layer(matrices: np.ndarray, rows: int, cols: int, workers: Optional[int] = None) -> np.ndarray:
+    """Pack a layer's [G, K, N] weights into tiles (see pack_tiles), in worker processes when large.
+
+    Weights and packed tiles are exchanged through shared memory; the output
+    is identical whatever the number of workers. If a worker dies (e.g. killed
+    by the OOM killer), the pool is replaced and the layer is packed serially.
+    """
+    if workers is None:
+        workers = COMPILER_MAX_WORKERS if matrices.size >= COMPILER_PARALLEL_MIN else 1
+    row_blocks, col_blocks = tile_grid(matrices.shape, rows, cols)
+    blocks = matrices.shape[0] * row_blocks
+    if workers < 2 or blocks < 2:
+        return pack_tiles(matrices, rows, cols)
+
+    shape = tuple(int(dim) for dim in matrices.shape)
+    output_shape = (blocks * col_blocks, tile_bytes(rows, cols))
+    weights_shm = shared_memory.SharedMemory(create=True, size=max(1, matrices.size * 4))
+    output_shm = shared_memory.SharedMemory(create=True, size=max(1, output_shape[0] * output_shape[1]))
+    try:
+        np.ndarray(shape, dtype=np.float32, buffer=weights_shm.buf)[:] = matrices
+        executor = _get_executor()
+        # Несколько диапазонов на процесс: выравнивает нагрузку при неравных блоках
+        try:
+            futures = [
+                executor.submit(_pack_row_blocks, weights_shm.name, shape, output_shm.name, rows, cols, start, stop)
+                for start, stop in _block_ranges(blocks, workers * 4)
+            ]
+            for future in futures:
+                future.result()
+        except BrokenProcessPool:
+            logger.warning("Packing worker pool is broken, packing the layer in-process")
+            _discard_executor(executor)
+            return pack_tiles(matrices, rows, cols)
+        return np.ndarray(output_shape, dtype=np.uint8, buffer=output_shm.buf).copy()
+    finally:
+        weights_shm.close()
+        weights_shm.unlink()
+        output_shm.close()
+        output_shm.unlink()
+
+
+def shutdown() -> None:
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
@@ -0,0 +1,66 @@
+"""Benchmark for the diagnostics engine over core count x memristors per core.
+
+Usage (from backend/):
+    python -m benchmarks.bench_diagnostics
+    python -m benchmarks.bench_diagnostics --cores 1 16 64 --sizes 4092 65536 --max-seconds 2
+
+Each configuration runs in-process and on the worker pool (the pool is
+warmed up first, so process start-up is not counted). Exits with a non-zero
+code if the best of the two takes longer than --max-seconds.
+"""
+import argparse
+import sys
+import time
+
+from app.services import diagnostics_engine
+from app.services.diagnostics_engine import FAULT_MODELS, CoreSpec, run_diagnostics
+
+
+def _time(cores, parallel: bool, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run_diagnostics("bench", cores, FAULT_MODELS, fault_rate=0.001, parallel=parallel)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def run(core_counts, sizes, repeat: int):
+    # Прогрев пула: запуск процессов не входит в замер
+    run_diagnostics("warmup", [CoreSpec(i, 16) for i in range(diagnostics_engine.DIAGNOSTICS_MAX_WORKERS * 2)],
+                    FAULT_MODELS, parallel=True)
+    results = []
+    for core_count in core_counts:
+        for size in sizes:
+            cores = [CoreSpec(i, size) for i in range(core_count)]
+            serial = _time(cores, False, repeat)
+            parallel = _time(cores, True, repeat)
+            best = min(serial, parallel)
+            results.append((core_count, size, best))
+            total = core_count * size
+            print(f"cores={core_count:>4}  per_core={size:>7}  total={total:>10}  serial={serial * 1000:9.1f} ms  "
+                  f"parallel={parallel * 1000:9.1f} ms  ({best / total * 1e9:.1f} ns/memristor)")
+    diagnostics_engine.shutdown()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cores", type=int, nargs="+", default=[1, 8, 64])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[4_092, 16_384, 65_536])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--max-seconds", type=float, default=None,
+                        help="Fail if any configuration takes longer than this")
+    args = parser.parse_args()
+
+    results = run(args.cores, args.sizes, args.repeat)
+    if args.max_seconds is not None:
+        slow = [(cores, size, best) for cores, size, best in results if best > args.max_seconds]
+        if slow:
+            for cores, size, best in slow:
+                print(f"REGRESSION: {cores} cores x {size} took {best:.2f}s > {args.max_seconds}s", file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
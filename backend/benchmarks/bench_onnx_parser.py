@@ -0,0 +1,77 @@
+"""Benchmark for parse_onnx_model on synthetic graphs.
+
+Usage (from backend/):
+    python -m benchmarks.bench_onnx_parser
+    python -m benchmarks.bench_onnx_parser --sizes 1000 10000 --max-seconds 5
+
+Exits with a non-zero code if any size takes longer than --max-seconds,
+so it can be used as a regression check.
+"""
+import argparse
+import io
+import sys
+import time
+
+import numpy as np
+import onnx
+from onnx import helper, numpy_helper, TensorProto
+
+from app.services.onnx_parser import parse_onnx_model
+
+
+def build_synthetic_model(node_count: int, width: int = 8) -> bytes:
+    """Chain of Add nodes, each with a small initializer and a skip connection."""
+    graph_input = helper.make_tensor_value_info("input", TensorProto.FLOAT, [1, width])
+    nodes = []
+    initializers = []
+    previous = "input"
+    for i in range(node_count):
+        bias_name = f"bias_{i}"
+        initializers.append(numpy_helper.from_array(np.full(width, i, dtype=np.float32), bias_name))
+        # Каждый 4-й узел дополнительно берёт вход на 2 шага назад (ветвление)
+        inputs = [previous, bias_name] if i % 4 or i < 2 else [previous, f"t_{i - 2}"]
+        output = f"t_{i}"
+        nodes.append(helper.make_node("Add", inputs, [output], name=f"add_{i}"))
+        previous = output
+
+    graph_output = helper.make_tensor_value_info(previous, TensorProto.FLOAT, [1, width])
+    graph = helper.make_graph(nodes, "synthetic", [graph_input], [graph_output], initializers)
+    model = helper.make_model(graph, producer_name="bench_onnx_parser")
+    return model.SerializeToString()
+
+
+def run(sizes, repeat: int):
+    results = []
+    for size in sizes:
+        content = build_synthetic_model(size)
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            parsed = parse_onnx_model(io.BytesIO(content))
+            timings.append(time.perf_counter() - start)
+        best = min(timings)
+        results.append((size, best, len(parsed["edges"])))
+        print(f"nodes={size:>6}  edges={len(parsed['edges']):>6}  best={best * 1000:9.1f} ms  "
+              f"({best / size * 1e6:.2f} us/node)")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 50_000])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--max-seconds", type=float, default=None,
+                        help="Fail if parsing any size takes longer than this")
+    args = parser.parse_args()
+
+    results = run(args.sizes, args.repeat)
+    if args.max_seconds is not None:
+        slow = [(size, best) for size, best, _ in results if best > args.max_seconds]
+        if slow:
+            for size, best in slow:
+                print(f"REGRESSION: {size} nodes took {best:.2f}s > {args.max_seconds}s", file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""Benchmark for the crossbar performance simulator on synthetic parsed graphs.
+
+Usage (from backend/):
+    python -m benchmarks.bench_simulator
+    python -m benchmarks.bench_simulator --sizes 1000 10000 --max-seconds 1
+
+The graph is built directly in parse_onnx_model's output format (so only the
+simulator is timed): repeated Conv -> BatchNormalization -> Relu -> Gemm blocks
+with known tensor shapes. Exits with a non-zero code if any size takes longer
+than --max-seconds.
+"""
+import argparse
+import sys
+import time
+
+from app.services.crossbar_simulator import DeviceConfig, simulate
+
+
+def build_parsed_graph(node_count: int, channels: int = 64, spatial: int = 28):
+    nodes, weights, shapes = [], {}, {"input": [1, channels, spatial, spatial]}
+    previous = "input"
+    for i in range(node_count):
+        op_type = ("Conv", "BatchNormalization", "Relu", "Gemm")[i % 4]
+        name, output = f"{op_type.lower()}_{i}", f"t_{i}"
+        inputs = [previous]
+        if op_type == "Conv":
+            weights[f"w_{i}"] = {"shape": [channels, channels, 3, 3], "stats": {"sparsity": 0.1}}
+            inputs.append(f"w_{i}")
+            shapes[output] = [1, channels, spatial, spatial]
+        elif op_type == "Gemm":
+            # Gemm по каналам каждой позиции: форма сохраняется для следующего блока
+            weights[f"w_{i}"] = {"shape": [channels, channels], "stats": {"sparsity": 0.0}}
+            inputs.append(f"w_{i}")
+            shapes[output] = [1, channels, spatial, spatial]
+        else:
+            shapes[output] = shapes[previous]
+        nodes.append({"name": name, "op_type": op_type, "inputs": inputs, "outputs": [output], "attributes": {}})
+        previous = output
+    return {"nodes": nodes, "weights": weights}, shapes
+
+
+DEVICE = DeviceConfig(
+    core_count=64, usable_cores=62, crossbar_rows=128, crossbar_cols=128, clock_mhz=1000,
+    memory_bandwidth_gbs=128, sparsity_support=True, topology="mesh", idle_watts=5, peak_watts=45,
+    activation_bytes=1
+)
+
+
+def run(sizes, repeat: int):
+    results = []
+    for size in sizes:
+        parsed, shapes = build_parsed_graph(size)
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = simulate(parsed, DEVICE, shapes)
+            timings.append(time.perf_counter() - start)
+        best = min(timings)
+        results.append((size, best))
+        print(f"nodes={size:>6}  best={best * 1000:9.1f} ms  ({best / size * 1e6:.2f} us/node)  "
+              f"latency={result['summary']['latency_ms']:.3f} ms")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 50_000])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--max-seconds", type=float, default=None,
+                        help="Fail if simulating any size takes longer than this")
+    args = parser.parse_args()
+
+    results = run(args.sizes, args.repeat)
+    if args.max_seconds is not None:
+        slow = [(size, best) for size, best in results if best > args.max_seconds]
+        if slow:
+            for size, best in slow:
+                print(f"REGRESSION: {size} nodes took {best:.2f}s > {args.max_seconds}s", file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
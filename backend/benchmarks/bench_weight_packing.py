@@ -0,0 +1,95 @@
+"""Benchmark for crossbar weight packing (quantize + tile) over layer sizes.
+
+Usage (from backend/):
+    python -m benchmarks.bench_weight_packing
+    python -m benchmarks.bench_weight_packing --sizes 1024 4096 --crossbar 128 --max-seconds 2
+    python -m benchmarks.bench_weight_packing --sizes 10240 --block-sparsity 0.7 --repeat 1
+
+Each size is a square FC layer packed in the current process and through the
+worker pool (shared-memory buffers); the packed bytes must be identical. The
+packed tiles are then block-sparse encoded, with --block-sparsity of the 8x8
+weight blocks zeroed beforehand.
+Exits with a non-zero code on a mismatch or if any parallel run takes longer
+than --max-seconds.
+"""
+import argparse
+import sys
+import time
+
+import numpy as np
+
+from app.services import weight_packing
+
+
+def best_of(repeat: int, fn):
+    timings, result = [], None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+def layer(size: int, block_sparsity: float) -> np.ndarray:
+    rng = np.random.default_rng(size)
+    matrices = rng.normal(size=(1, size, size)).astype(np.float32)
+    if block_sparsity > 0:
+        blocks = -(-size // weight_packing.SPARSE_BLOCK)
+        keep = rng.random((blocks, blocks)) >= block_sparsity
+        mask = keep.repeat(weight_packing.SPARSE_BLOCK, 0).repeat(weight_packing.SPARSE_BLOCK, 1)[:size, :size]
+        matrices *= mask
+    return matrices
+
+
+def run(sizes, crossbar: int, workers: int, repeat: int, block_sparsity: float = 0.0):
+    results = []
+    # Прогрев пула: запуск процессов spawn не входит в замер
+    warmup = np.ones((1, crossbar * 4, crossbar), dtype=np.float32)
+    weight_packing.pack_layer(warmup, crossbar, crossbar, workers=workers)
+    for size in sizes:
+        matrices = layer(size, block_sparsity)
+        serial, expected = best_of(repeat, lambda: weight_packing.pack_layer(matrices, crossbar, crossbar, workers=1))
+        parallel, packed = best_of(
+            repeat, lambda: weight_packing.pack_layer(matrices, crossbar, crossbar, workers=workers)
+        )
+        identical = np.array_equal(expected, packed)
+        encode, sparse = best_of(repeat, lambda: weight_packing.block_sparse(packed, crossbar, crossbar))
+        results.append((size, parallel, identical))
+        print(f"layer={f'{size}x{size}':>11}  tiles={len(packed):>6}  serial={serial * 1000:9.1f} ms  "
+              f"workers={workers}: {parallel * 1000:9.1f} ms  ({serial / parallel:4.1f}x)  "
+              f"{matrices.nbytes / parallel / 1e9:5.2f} GB/s  identical={identical}  "
+              f"sparse={encode * 1000:7.1f} ms  stored={int(sparse.stored.sum())}/{len(packed)}  "
+              f"compression={packed.nbytes / sparse.nbytes:4.2f}x")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[512, 2048, 4096, 8192])
+    parser.add_argument("--crossbar", type=int, default=128, help="Crossbar rows and columns")
+    parser.add_argument("--workers", type=int, default=weight_packing.COMPILER_MAX_WORKERS)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--block-sparsity", type=float, default=0.0,
+                        help="Fraction of 8x8 weight blocks set to zero")
+    parser.add_argument("--max-seconds", type=float, default=None,
+                        help="Fail if packing any size in parallel takes longer than this")
+    args = parser.parse_args()
+
+    try:
+        results = run(args.sizes, args.crossbar, args.workers, args.repeat, args.block_sparsity)
+    finally:
+        weight_packing.shutdown()
+    failed = False
+    for size, best, identical in results:
+        if not identical:
+            print(f"MISMATCH: {size}x{size} packs differently with {args.workers} workers", file=sys.stderr)
+            failed = True
+        if args.max_seconds is not None and best > args.max_seconds:
+            print(f"REGRESSION: {size}x{size} took {best:.2f}s > {args.max_seconds}s", file=sys.stderr)
+            failed = True
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
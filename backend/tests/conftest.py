@@ -0,0 +1,41 @@
+import os
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.models import Base, Device, DeviceWorkflowStatus, WorkflowStep
+from app.services import diagnostics_jobs
+from app.services.device_state import reset_core_states
+
+# app.auth требует ключ при импорте (роутеры в тестах подключаются с подменённой авторизацией)
+os.environ.setdefault("JWT_SECRET_KEY", "test-secret")
+
+
+@pytest.fixture
+def session_factory(tmp_path, monkeypatch):
+    """Empty SQLite database with all tables; diagnostics jobs use it instead of app.db."""
+    engine = create_engine(f"sqlite:///{tmp_path / 'test.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(engine)
+    factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    monkeypatch.setattr(diagnostics_jobs, "SessionLocal", factory)
+    yield factory
+    engine.dispose()
+
+
+@pytest.fixture
+def add_device(session_factory):
+    """Create an idle mock device waiting for diagnostics; returns its id."""
+    def add(device_id: str, core_count: int = 2, memristors_per_core: int = 64) -> str:
+        db = session_factory()
+        try:
+            device = Device(id=device_id, status="idle", is_mock=True, leakage_types=["stuck_at_0", "stuck_at_1"])
+            db.add(device)
+            reset_core_states(db, device, core_count, memristors_per_core)
+            db.add(DeviceWorkflowStatus(device_id=device_id, current_step=WorkflowStep.DIAGNOSTICS))
+            db.commit()
+        finally:
+            db.close()
+        return device_id
+
+    return add
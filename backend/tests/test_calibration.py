@@ -0,0 +1,75 @@
+import numpy as np
+import onnx
+import pytest
+from onnx import TensorProto, helper, numpy_helper
+
+from app.services import calibration
+from app.services.calibration import compute_tensor_ranges
+
+WEIGHT = np.array([[1.0, -2.0], [0.5, 1.0], [-1.0, 0.0]], dtype=np.float32)
+
+
+@pytest.fixture
+def model_path(tmp_path):
+    graph = helper.make_graph(
+        [helper.make_node("MatMul", ["x", "w"], ["y"], name="fc")], "fc",
+        [helper.make_tensor_value_info("x", TensorProto.FLOAT, ["N", 3])],
+        [helper.make_tensor_value_info("y", TensorProto.FLOAT, ["N", 2])],
+        [numpy_helper.from_array(WEIGHT, "w")]
+    )
+    path = tmp_path / "model.onnx"
+    onnx.save(helper.make_model(graph, opset_imports=[helper.make_opsetid("", 13)]), str(path))
+    return str(path)
+
+
+@pytest.fixture
+def dataset(tmp_path):
+    rng = np.random.default_rng(0)
+    x = rng.uniform(-1, 1, size=(12, 3)).astype(np.float32)
+    # Минимум — в первом окне, максимум — в последнем
+    x[1] = [-5.0, 0.0, 0.0]
+    x[11] = [0.0, 7.0, 0.0]
+    first, second = tmp_path / "part1.npy", tmp_path / "part2.npy"
+    np.save(first, x[:5])
+    np.save(second, x[5:])
+    return x, [str(first), str(second)]
+
+
+def _ranges(tensors_range):
+    return {name: (float(data.lowest), float(data.highest)) for name, data in tensors_range.data.items()}
+
+
+@pytest.mark.parametrize("window", [1, 2, 100])
+def test_minmax_ranges_are_merged_across_windows(model_path, dataset, monkeypatch, window):
+    x, paths = dataset
+    monkeypatch.setattr(calibration, "CALIBRATION_WINDOW_BATCHES", window)
+    batches = []
+
+    tensors_range, cached = compute_tensor_ranges(model_path, paths, "minmax", ["MatMul"], batch_size=2,
+                                                  use_external_data_format=False,
+                                                  on_batch=lambda: batches.append(1))
+    assert not cached
+    # 5 строк первого файла дают батчи 2+2+1, затем 2+2+2+1 из второго
+    assert len(batches) == 7
+    y = x @ WEIGHT
+    ranges = _ranges(tensors_range)
+    assert ranges["x"] == pytest.approx((x.min(), x.max()))
+    assert ranges["y"] == pytest.approx((y.min(), y.max()))
+
+
+def test_ranges_are_cached(model_path, dataset, tmp_path):
+    _, paths = dataset
+    cache_path = str(tmp_path / "ranges.json")
+    computed, cached = compute_tensor_ranges(model_path, paths, "minmax", ["MatMul"], 4, False, cache_path)
+    assert not cached
+
+    loaded, cached = compute_tensor_ranges(model_path, ["missing.npy"], "minmax", ["MatMul"], 4, False, cache_path)
+    assert cached
+    assert _ranges(loaded) == pytest.approx(_ranges(computed))
+
+
+def test_empty_dataset_is_rejected(model_path, tmp_path):
+    empty = tmp_path / "empty.npy"
+    np.save(empty, np.zeros((0, 3), dtype=np.float32))
+    with pytest.raises(ValueError, match="empty"):
+        compute_tensor_ranges(model_path, [str(empty)], "minmax", ["MatMul"], 4, False)
@@ -0,0 +1,123 @@
+import io
+
+import numpy as np
+import onnx
+import onnxruntime as ort
+import pytest
+from onnx import TensorProto, helper, numpy_helper
+
+from app.services import firmware, weight_packing
+from app.services.compiler_pipeline import CompileError, CompileTarget, compile_model
+
+TARGET = CompileTarget(
+    device_id="dev-1",
+    core_count=4,
+    usable_cores=[0, 1, 3],
+    crossbar_rows=64,
+    crossbar_cols=64,
+    supported_layers={"conv2d", "fc", "avgpool"},
+    supported_activations={"relu"},
+    sparsity_support=False
+)
+
+
+def _conv_bn_relu_gemm() -> onnx.ModelProto:
+    rng = np.random.default_rng(0)
+
+    def init(name, value):
+        return numpy_helper.from_array(np.asarray(value, dtype=np.float32), name)
+
+    nodes = [
+        helper.make_node("Conv", ["x", "W", "B"], ["c"], name="conv", pads=[1, 1, 1, 1]),
+        helper.make_node("BatchNormalization", ["c", "gamma", "beta", "mean", "var"], ["bn"], name="bn"),
+        helper.make_node("Relu", ["bn"], ["r"], name="relu"),
+        helper.make_node("GlobalAveragePool", ["r"], ["p"], name="pool"),
+        helper.make_node("Flatten", ["p"], ["f"], name="flatten"),
+        helper.make_node("Mul", ["G0", "two"], ["G"], name="scale"),
+        helper.make_node("Gemm", ["f", "G", "GB"], ["y"], name="fc", transB=1),
+    ]
+    graph = helper.make_graph(
+        nodes, "conv_bn_relu_gemm",
+        [helper.make_tensor_value_info("x", TensorProto.FLOAT, ["N", 3, 16, 16])],
+        [helper.make_tensor_value_info("y", TensorProto.FLOAT, ["N", 10])],
+        [init("W", rng.normal(size=(8, 3, 3, 3))), init("B", rng.normal(size=8)),
+         init("gamma", rng.uniform(0.5, 2, size=8)), init("beta", rng.normal(size=8)),
+         init("mean", rng.normal(size=8)), init("var", rng.uniform(0.5, 2, size=8)),
+         init("G0", rng.normal(size=(10, 8))), init("two", 2.0), init("GB", rng.normal(size=10))]
+    )
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 13)])
+    model.ir_version = 8
+    onnx.checker.check_model(model)
+    return model
+
+
+def _run(model_bytes: bytes, x: np.ndarray) -> np.ndarray:
+    session = ort.InferenceSession(model_bytes, providers=["CPUExecutionProvider"])
+    return session.run(None, {"x": x})[0]
+
+
+def test_compile_conv_bn_relu_gemm(tmp_path):
+    model = _conv_bn_relu_gemm()
+    model_path = tmp_path / "model.onnx"
+    onnx.save(model, str(model_path))
+    image_path = tmp_path / "firmware.bin"
+
+    with open(image_path, "wb") as f:
+        report = compile_model(str(model_path), TARGET, f, incremental=False)
+
+    assert [step["name"] for step in report["passes"]] == ["load_graph", "constant_folding", "fuse_conv_bn_relu",
+                                                           "check_support", "tile_weights", "emit_firmware"]
+    assert report["errors"] == [] and report["warnings"] == []
+    assert report["summary"]["placement"] == {"crossbar": 2, "fused": 1, "digital": 1, "layout": 1}
+    conv, fc = report["layers"]
+    assert (conv["name"], conv["k"], conv["n"], conv["activation"]) == ("conv", 27, 8, "relu")
+    assert (fc["name"], fc["k"], fc["n"], fc["activation"]) == ("fc", 8, 10, None)
+
+    image = str(image_path)
+    assert report["firmware"]["size"] == image_path.stat().st_size
+    meta = firmware.read_meta(image)
+    assert [layer["name"] for layer in meta["layers"]] == ["conv", "fc"]
+    tiles = firmware.read_section(image, firmware.SECTION_TILES)
+    assert len(tiles) == 2 * weight_packing.tile_bytes(64, 64)
+    placement = np.frombuffer(firmware.read_section(image, firmware.SECTION_PLACEMENT), "<i4").reshape(2, -1)
+    # Тайлы раздаются только исправным ядрам
+    assert placement[:, 4].tolist() == [0, 1]
+
+    host = onnx.load_from_string(firmware.read_section(image, firmware.SECTION_GRAPH))
+    assert [node.op_type for node in host.graph.node] == ["Conv", "Relu", "GlobalAveragePool", "Flatten", "Gemm"]
+    x = np.random.default_rng(1).normal(size=(2, 3, 16, 16)).astype(np.float32)
+    np.testing.assert_allclose(_run(host.SerializeToString(), x), _run(model.SerializeToString(), x),
+                               rtol=1e-4, atol=1e-4)
+
+
+def test_strict_compile_rejects_unsupported_ops(tmp_path):
+    model_path = tmp_path / "model.onnx"
+    onnx.save(_conv_bn_relu_gemm(), str(model_path))
+    target = TARGET._replace(supported_layers={"conv2d", "fc"})
+
+    with pytest.raises(CompileError) as error:
+        compile_model(str(model_path), target, io.BytesIO(), strict=True, incremental=False)
+    assert error.value.report["errors"] == ["'avgpool' is not supported by the device (1 node(s))"]
+    assert error.value.report["summary"]["placement"]["host"] == 1
+
+
+def test_unreadable_model_is_a_compile_error(tmp_path):
+    model_path = tmp_path / "model.onnx"
+    model_path.write_bytes(b"not a protobuf")
+    with pytest.raises(CompileError, match="load_graph"):
+        compile_model(str(model_path), TARGET, io.BytesIO(), incremental=False)
+
+
+def test_matmul_with_vector_weight_stays_off_the_crossbar(tmp_path):
+    graph = helper.make_graph(
+        [helper.make_node("MatMul", ["x", "w"], ["y"], name="dot")], "dot",
+        [helper.make_tensor_value_info("x", TensorProto.FLOAT, [2, 8])],
+        [helper.make_tensor_value_info("y", TensorProto.FLOAT, [2])],
+        [numpy_helper.from_array(np.ones(8, dtype=np.float32), "w")]
+    )
+    model_path = tmp_path / "model.onnx"
+    onnx.save(helper.make_model(graph), str(model_path))
+
+    report = compile_model(str(model_path), TARGET, io.BytesIO(), incremental=False)
+    assert report["layers"] == []
+    assert report["summary"]["placement"] == {"host": 1}
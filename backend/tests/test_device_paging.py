@@ -0,0 +1,77 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.api.device_router import router
+from app.auth.dependencies import get_current_user
+from app.database import get_db
+from app.models import Device
+
+# id -> status; NULL и повторяющиеся значения сортировки
+STATUSES = {"d1": "idle", "d2": None, "d3": "busy", "d4": "idle", "d5": None, "d6": "busy", "d7": "idle",
+            "d8": "error"}
+
+
+@pytest.fixture
+def client(session_factory):
+    db = session_factory()
+    db.add_all([Device(id=device_id, status=status) for device_id, status in STATUSES.items()])
+    db.flush()
+    # None в конструкторе заменяется default колонки, NULL записываем отдельно
+    db.query(Device).filter(Device.id.in_([device_id for device_id, status in STATUSES.items() if status is None])) \
+        .update({Device.status: None}, synchronize_session=False)
+    db.commit()
+    db.close()
+
+    def session():
+        db = session_factory()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app = FastAPI()
+    app.include_router(router, prefix="/api")
+    app.dependency_overrides[get_db] = session
+    app.dependency_overrides[get_current_user] = lambda: None
+    return TestClient(app)
+
+
+def _pages(client, **params):
+    ids, cursor = [], None
+    while True:
+        response = client.get("/api/devices", params={**params, **({"cursor": cursor} if cursor else {})})
+        assert response.status_code == 200
+        page = response.json()
+        assert len(page["devices"]) <= params["limit"]
+        ids.extend(device["id"] for device in page["devices"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return ids
+
+
+@pytest.mark.parametrize("limit", [1, 2, 3, 100])
+def test_paging_by_status_visits_every_device_once(client, limit):
+    present = sorted((status, device_id) for device_id, status in STATUSES.items() if status is not None)
+    missing = sorted(device_id for device_id, status in STATUSES.items() if status is None)
+
+    ascending = _pages(client, limit=limit, sort="status", order="asc")
+    assert ascending == [device_id for _, device_id in present] + missing
+    # NULL остаются в конце и при обратном порядке
+    descending = _pages(client, limit=limit, sort="status", order="desc")
+    assert descending == [device_id for _, device_id in reversed(present)] + missing[::-1]
+
+
+def test_paging_with_tied_created_at(client):
+    # Все устройства созданы в одну секунду: порядок задаёт id
+    assert _pages(client, limit=3, sort="created_at", order="asc") == sorted(STATUSES)
+    assert _pages(client, limit=3, sort="created_at", order="desc") == sorted(STATUSES, reverse=True)
+
+
+def test_paging_with_filter(client):
+    assert _pages(client, limit=1, status="idle", sort="id", order="desc") == ["d7", "d4", "d1"]
+
+
+def test_invalid_cursor(client):
+    response = client.get("/api/devices", params={"cursor": "not-a-cursor"})
+    assert response.status_code == 400
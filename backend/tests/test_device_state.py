@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+
+from app.models import CoreState
+from app.services.device_state import (
+    STATUS_CODES, conductance, core_summary, load_core_states, run_lengths, set_conductance, set_status_codes,
+    status_codes, status_counts
+)
+
+
+def _state(session_factory, state: CoreState) -> CoreState:
+    """Store the core and read it back with its packed arrays."""
+    device_id = state.device_id
+    db = session_factory()
+    try:
+        db.add(state)
+        db.commit()
+        db.expunge_all()
+        stored, = load_core_states(db, device_id, with_arrays=True)
+        db.expunge(stored)
+        return stored
+    finally:
+        db.close()
+
+
+def test_run_lengths():
+    assert run_lengths(np.array([], dtype=np.uint8)) == []
+    assert run_lengths(np.array([0, 0, 1, 1, 1, 0, 4], dtype=np.uint8)) == [[0, 2], [1, 3], [0, 1], [4, 1]]
+
+
+def test_healthy_core_is_stored_as_a_single_run(session_factory, add_device):
+    add_device("dev-1", core_count=0)
+    state = CoreState(device_id="dev-1", core_id=0, status="healthy")
+    set_status_codes(state, np.zeros(4096, dtype=np.uint8))
+    assert state.status_codes is None
+
+    stored = _state(session_factory, state)
+    assert stored.status_runs == [[STATUS_CODES["active"], 4096]]
+    assert np.array_equal(status_codes(stored), np.zeros(4096, dtype=np.uint8))
+
+
+def test_status_codes_and_conductance_round_trip(session_factory, add_device):
+    add_device("dev-1", core_count=0)
+    rng = np.random.default_rng(0)
+    codes = np.zeros(64 * 64, dtype=np.uint8)
+    codes[rng.choice(codes.size, 200, replace=False)] = rng.integers(1, 5, 200)
+    values = rng.uniform(0, 1, codes.size)
+
+    state = CoreState(device_id="dev-1", core_id=0, status="degraded")
+    set_status_codes(state, codes)
+    set_conductance(state, values)
+    stored = _state(session_factory, state)
+
+    assert np.array_equal(status_codes(stored), codes)
+    assert np.array_equal(conductance(stored), values.astype(np.float16))
+    counts = status_counts(stored)
+    assert counts["active"] == 64 * 64 - 200 and sum(counts.values()) == 64 * 64
+    summary = core_summary(stored)
+    assert summary["crossbar"] == {"rows": 64, "cols": 64}
+    assert sum(summary["conductance_histogram"]["counts"]) == codes.size
+
+    set_conductance(stored, None)
+    assert conductance(stored) is None and stored.conductance_histogram is None
+    with pytest.raises(ValueError, match="Expected 4096 conductance values"):
+        set_conductance(stored, values[:10])
@@ -0,0 +1,120 @@
+import asyncio
+
+import pytest
+
+from app.models import Device, DiagnosticsJob
+from app.services import diagnostics_jobs
+from app.services.diagnostics_jobs import DiagnosticsJobManager
+
+
+def _jobs(session_factory):
+    """device_id -> (status, error) of batch jobs."""
+    db = session_factory()
+    try:
+        return {device_id: (status, error) for device_id, status, error in
+                db.query(DiagnosticsJob.device_id, DiagnosticsJob.status, DiagnosticsJob.error)}
+    finally:
+        db.close()
+
+
+def _device_statuses(session_factory):
+    db = session_factory()
+    try:
+        return dict(db.query(Device.id, Device.status))
+    finally:
+        db.close()
+
+
+def test_batch_diagnoses_devices_and_skips_busy(session_factory, add_device):
+    for device_id in ("dev-1", "dev-2", "dev-3"):
+        add_device(device_id)
+    queued = DiagnosticsJobManager._create("dev-3", {})
+
+    report = asyncio.run(DiagnosticsJobManager(1).run_batch(None, None, None, {"fault_rate": 0.0}))
+    assert (report["requested"], report["diagnosed"], report["passed"]) == (3, 2, 2)
+    assert report["busy"] == ["dev-3"]
+    assert [device["device_id"] for device in report["devices"]] == ["dev-1", "dev-2"]
+
+    jobs = _jobs(session_factory)
+    assert jobs["dev-1"] == jobs["dev-2"] == ("completed", None)
+    assert DiagnosticsJobManager.get(queued.id)["status"] == "queued"
+    assert _device_statuses(session_factory) == {"dev-1": "idle", "dev-2": "idle", "dev-3": "idle"}
+
+
+def test_batch_reports_missing_and_failed_devices(session_factory, add_device, monkeypatch):
+    add_device("dev-1")
+    add_device("dev-2")
+    real = diagnostics_jobs.run_diagnostics_async
+
+    async def flaky(device_id, *args, **kwargs):
+        if device_id == "dev-2":
+            raise RuntimeError("crossbar not responding")
+        return await real(device_id, *args, **kwargs)
+
+    monkeypatch.setattr(diagnostics_jobs, "run_diagnostics_async", flaky)
+    report = asyncio.run(DiagnosticsJobManager(1).run_batch(["dev-1", "dev-2", "ghost"], None, None, {}))
+    assert (report["diagnosed"], report["error"]) == (2, 1)
+    assert report["missing"] == ["ghost"]
+    assert _jobs(session_factory)["dev-2"] == ("failed", "crossbar not responding")
+    assert _device_statuses(session_factory)["dev-2"] == "error"
+
+
+def test_cancelled_batch_releases_claimed_devices(session_factory, add_device, monkeypatch):
+    add_device("dev-1")
+    add_device("dev-2")
+
+    async def scenario():
+        started = asyncio.Event()
+
+        async def hang(*args, **kwargs):
+            started.set()
+            await asyncio.sleep(3600)
+
+        monkeypatch.setattr(diagnostics_jobs, "run_diagnostics_async", hang)
+        task = asyncio.create_task(DiagnosticsJobManager(1).run_batch(None, None, None, {}))
+        await started.wait()
+        assert _device_statuses(session_factory) == {"dev-1": "busy", "dev-2": "busy"}
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(scenario())
+    assert _jobs(session_factory) == {"dev-1": ("cancelled", None), "dev-2": ("cancelled", None)}
+    assert _device_statuses(session_factory) == {"dev-1": "idle", "dev-2": "idle"}
+    # Устройства снова можно диагностировать
+    DiagnosticsJobManager._create("dev-1", {})
+
+
+def test_failed_batch_write_releases_claimed_devices(session_factory, add_device, monkeypatch):
+    add_device("dev-1")
+    add_device("dev-2")
+
+    def broken(*args):
+        raise RuntimeError("disk full")
+
+    monkeypatch.setattr(DiagnosticsJobManager, "_finish_batch", staticmethod(broken))
+    with pytest.raises(RuntimeError):
+        asyncio.run(DiagnosticsJobManager(1).run_batch(None, None, None, {"fault_rate": 0.0}))
+    jobs = _jobs(session_factory)
+    assert jobs["dev-1"] == jobs["dev-2"] == ("failed", "Batch aborted: disk full")
+    assert _device_statuses(session_factory) == {"dev-1": "error", "dev-2": "error"}
+    assert DiagnosticsJobManager._pending_ids() == []
+
+
+def test_batch_keeps_committed_chunks_when_a_later_chunk_fails(session_factory, add_device, monkeypatch):
+    for device_id in ("dev-1", "dev-2", "dev-3"):
+        add_device(device_id)
+    monkeypatch.setattr(diagnostics_jobs, "BATCH_COMMIT_SIZE", 2)
+    real = DiagnosticsJobManager._finish_batch
+
+    def fail_second_chunk(items, outcomes, durations, summaries):
+        real(items[:2], outcomes, durations, summaries)
+        raise RuntimeError("disk full")
+
+    monkeypatch.setattr(DiagnosticsJobManager, "_finish_batch", staticmethod(fail_second_chunk))
+    with pytest.raises(RuntimeError):
+        asyncio.run(DiagnosticsJobManager(1).run_batch(None, None, None, {"fault_rate": 0.0}))
+    jobs = _jobs(session_factory)
+    assert jobs["dev-1"] == jobs["dev-2"] == ("completed", None)
+    assert jobs["dev-3"] == ("failed", "Batch aborted: disk full")
+    assert _device_statuses(session_factory) == {"dev-1": "idle", "dev-2": "idle", "dev-3": "error"}
@@ -0,0 +1,98 @@
+import pytest
+
+from app.models import Device, DeviceWorkflowStatus, DiagnosticsJob, WorkflowStep
+from app.services.diagnostics_engine import run_diagnostics
+from app.services.diagnostics_jobs import DeviceBusy, DiagnosticsJobManager
+
+
+def _row(session_factory, model, key):
+    db = session_factory()
+    try:
+        row = db.get(model, key)
+        db.expunge(row)
+        return row
+    finally:
+        db.close()
+
+
+def test_create_allows_one_active_job_per_device(session_factory, add_device):
+    add_device("dev-1")
+    job = DiagnosticsJobManager._create("dev-1", {"seed": 1})
+    assert job.status == "queued"
+
+    with pytest.raises(DeviceBusy) as busy:
+        DiagnosticsJobManager._create("dev-1", {})
+    assert busy.value.job_id == job.id
+    with pytest.raises(LookupError):
+        DiagnosticsJobManager._create("missing", {})
+
+
+def test_start_then_finish_completes_job(session_factory, add_device):
+    add_device("dev-1", core_count=3)
+    job = DiagnosticsJobManager._create("dev-1", {"fault_rate": 0.0})
+
+    device_id, params, cores, fault_models = DiagnosticsJobManager._start(job.id)
+    assert (device_id, params) == ("dev-1", {"fault_rate": 0.0})
+    assert [core.core_id for core in cores] == [0, 1, 2]
+    assert fault_models == ["stuck_at_0", "stuck_at_1"]
+    assert _row(session_factory, Device, "dev-1").status == "busy"
+    assert _row(session_factory, DiagnosticsJob, job.id).status == "running"
+
+    results = run_diagnostics(device_id, cores, fault_models, fault_rate=0.0, parallel=False)
+    summary = DiagnosticsJobManager._finish(job.id, device_id, results, 12.5)
+    assert summary["overall_status"] == "passed"
+    assert summary["memristors"] == {"available": 3 * 64, "total": 3 * 64}
+
+    finished = DiagnosticsJobManager.get(job.id, with_result=True)
+    assert finished["status"] == "completed"
+    assert finished["progress"] == 1.0
+    assert finished["result"] == summary
+    assert _row(session_factory, Device, "dev-1").status == "idle"
+    assert _row(session_factory, DeviceWorkflowStatus, "dev-1").current_step == WorkflowStep.COMPILER
+    # Завершённая задача больше не занимает устройство
+    DiagnosticsJobManager._create("dev-1", {})
+
+
+def test_start_skips_finished_job(session_factory, add_device):
+    add_device("dev-1")
+    job = DiagnosticsJobManager._create("dev-1", {})
+    DiagnosticsJobManager._abort(job.id, None, "cancelled", None)
+    assert DiagnosticsJobManager._start(job.id) is None
+
+
+def test_abort_failed_marks_device_error(session_factory, add_device):
+    add_device("dev-1")
+    job = DiagnosticsJobManager._create("dev-1", {})
+    DiagnosticsJobManager._start(job.id)
+
+    DiagnosticsJobManager._abort(job.id, "dev-1", "failed", "boom")
+    info = DiagnosticsJobManager.get(job.id)
+    assert (info["status"], info["error"]) == ("failed", "boom")
+    assert info["finished_at"] is not None
+    assert _row(session_factory, Device, "dev-1").status == "error"
+
+
+def test_abort_queued_job_keeps_device_status(session_factory, add_device):
+    add_device("dev-1")
+    job = DiagnosticsJobManager._create("dev-1", {})
+
+    DiagnosticsJobManager._abort(job.id, None, "cancelled", None)
+    assert DiagnosticsJobManager.get(job.id)["status"] == "cancelled"
+    assert _row(session_factory, Device, "dev-1").status == "idle"
+    assert DiagnosticsJobManager._pending_ids() == []
+
+
+def test_late_progress_write_does_not_reopen_finished_job(session_factory, add_device):
+    add_device("dev-1")
+    job = DiagnosticsJobManager._create("dev-1", {"fault_rate": 0.0})
+    device_id, _, cores, fault_models = DiagnosticsJobManager._start(job.id)
+
+    DiagnosticsJobManager._update_progress(job.id, 1, 0.5)
+    assert DiagnosticsJobManager.get(job.id)["progress"] == 0.5
+
+    results = run_diagnostics(device_id, cores, fault_models, fault_rate=0.0, parallel=False)
+    DiagnosticsJobManager._finish(job.id, device_id, results, 1.0)
+    # Сброс прогресса, запущенный до _finish, завершается после него
+    DiagnosticsJobManager._update_progress(job.id, 1, 0.5)
+    info = DiagnosticsJobManager.get(job.id)
+    assert (info["status"], info["progress"], info["cores_done"]) == ("completed", 1.0, 2)
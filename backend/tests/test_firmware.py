@@ -0,0 +1,65 @@
+import io
+
+import numpy as np
+import pytest
+
+from app.services import firmware
+
+
+def _image(tmp_path, sections):
+    path = tmp_path / "firmware.bin"
+    with open(path, "wb") as f:
+        size = firmware.write_firmware(f, sections)
+    assert path.stat().st_size == size
+    return str(path)
+
+
+def test_sections_round_trip(tmp_path):
+    tiles = [np.arange(6, dtype=np.uint8), np.full(3, 7, dtype=np.uint8)]
+    bias = np.array([0.5, -1.0], dtype="<f4")
+    path = _image(tmp_path, [
+        (firmware.SECTION_META, [b'{"layers": []}']),
+        (firmware.SECTION_TILES, tiles),
+        (firmware.SECTION_BIAS, [bias]),
+        (firmware.SECTION_PLACEMENT, []),
+    ])
+
+    assert firmware.is_firmware(path)
+    assert firmware.read_meta(path) == {"layers": []}
+    assert firmware.read_section(path, firmware.SECTION_TILES) == b"".join(tile.tobytes() for tile in tiles)
+    assert np.frombuffer(firmware.read_section(path, firmware.SECTION_BIAS), "<f4").tolist() == [0.5, -1.0]
+    assert firmware.read_section(path, firmware.SECTION_PLACEMENT) == b""
+    assert firmware.read_section(path, firmware.SECTION_GRAPH) is None
+
+    with open(path, "rb") as f:
+        table = firmware.read_section_table(f)
+    assert list(table) == [firmware.SECTION_META, firmware.SECTION_TILES, firmware.SECTION_BIAS,
+                           firmware.SECTION_PLACEMENT]
+    # Секции идут подряд, без промежутков
+    offsets = sorted(table.values())
+    assert all(offset + length == following for (offset, length), (following, _) in zip(offsets, offsets[1:]))
+
+
+def test_image_without_meta_has_empty_meta(tmp_path):
+    path = _image(tmp_path, [(firmware.SECTION_TILES, [b"\x01"])])
+    assert firmware.read_meta(path) == {}
+
+
+def test_rejects_foreign_and_newer_images():
+    with pytest.raises(ValueError, match="Not a firmware image"):
+        firmware.read_section_table(io.BytesIO(b"ONNX" + bytes(12)))
+    newer = firmware._HEADER.pack(firmware.FIRMWARE_MAGIC, firmware.FIRMWARE_VERSION + 1, 0, 0)
+    with pytest.raises(ValueError, match="Unsupported firmware version"):
+        firmware.read_section_table(io.BytesIO(newer))
+
+
+def test_truncated_images_raise_value_error(tmp_path):
+    path = _image(tmp_path, [(firmware.SECTION_META, [b"{}"]), (firmware.SECTION_TILES, [bytes(100)])])
+    data = open(path, "rb").read()
+
+    for size, message in ((4, "Truncated firmware image"), (firmware._HEADER.size + 5, "section table"),
+                          (len(data) - 1, "section TILE")):
+        truncated = tmp_path / f"truncated_{size}.bin"
+        truncated.write_bytes(data[:size])
+        with pytest.raises(ValueError, match=message):
+            firmware.read_section(str(truncated), firmware.SECTION_TILES)
@@ -0,0 +1,69 @@
+import os
+
+import numpy as np
+
+from app.services.artifact_store import evict_lru, expire_entries, scan_entries
+from app.services.layer_cache import LayerCache, layer_key, weight_digest
+
+
+def test_layer_key_changes_with_anything_the_tiles_depend_on():
+    weight = np.arange(12, dtype=np.float32).reshape(3, 4)
+    digest = weight_digest(weight)
+    key = layer_key("Gemm", {"transB": 1}, digest, (64, 64, "int8"))
+
+    assert key == layer_key("Gemm", {"transB": 1}, weight_digest(weight.copy()), (64, 64, "int8"))
+    assert weight_digest(weight.reshape(4, 3)) != digest
+    assert weight_digest(weight.astype(np.float64)) != digest
+    for other in (layer_key("MatMul", {"transB": 1}, digest, (64, 64, "int8")),
+                  layer_key("Gemm", {"transB": 0}, digest, (64, 64, "int8")),
+                  layer_key("Gemm", {"transB": 1}, digest, (32, 64, "int8"))):
+        assert other != key
+
+
+def test_weight_digest_is_memoized_by_key():
+    weight = np.ones(8, dtype=np.float32)
+    digest = weight_digest(weight, memo_key=("model", "w"))
+    # По ключу отдаётся запомненный хэш, массив не читается
+    assert weight_digest(np.zeros(8, dtype=np.float32), memo_key=("model", "w")) == digest
+
+
+def test_hits_misses_and_lru_eviction(tmp_path):
+    packed = np.zeros((2, 100), dtype=np.uint8)
+    cache = LayerCache(str(tmp_path), max_bytes=0)
+    assert cache.get("a") is None
+
+    for i, key in enumerate("abc"):
+        cache.put(key, packed)
+        os.utime(cache._path(key), (1000 + i, 1000 + i))
+    assert np.array_equal(cache.get("a"), packed)
+    file_size = os.path.getsize(cache._path("a"))
+
+    # Бюджет на два слоя: "a" только что прочитан, вытесняется "b"
+    cache.max_bytes = 2 * file_size
+    cache.evict()
+    assert sorted(os.listdir(tmp_path)) == ["a.npy", "c.npy"]
+    # Слои текущей сборки не вытесняются даже сверх бюджета
+    cache.max_bytes = 0
+    cache.evict(keep=["c"])
+    assert os.listdir(tmp_path) == ["c.npy"]
+    assert cache.stats() == {"max_bytes": 0, "hits": 1, "misses": 1, "evictions": 2}
+
+
+def test_evict_lru_and_expire_entries(tmp_path):
+    for i in range(4):
+        path = tmp_path / f"{i}.bin"
+        path.write_bytes(bytes(100))
+        os.utime(path, (1000 + i, 1000 + i))
+    (tmp_path / "skip.txt").write_bytes(bytes(1000))
+
+    entries = scan_entries(str(tmp_path), lambda entry: entry.name.endswith(".bin"))
+    assert sorted(os.path.basename(path) for _, path, _ in entries) == ["0.bin", "1.bin", "2.bin", "3.bin"]
+
+    expired, alive = expire_entries(entries, ttl=2.5, now=1003)
+    assert [os.path.basename(path) for _, path, _ in expired] == ["0.bin"]
+    # Уже удалённый файл не считается вытесненным, но его место освободилось
+    os.remove(tmp_path / "2.bin")
+    evicted = evict_lru(alive, 200, keep=lambda mtime, path: path.endswith("1.bin"))
+    assert evicted == []
+    assert sorted(os.listdir(tmp_path)) == ["1.bin", "3.bin", "skip.txt"]
+    assert [os.path.basename(path) for _, path, _ in evict_lru(alive, 0)] == ["1.bin", "3.bin"]
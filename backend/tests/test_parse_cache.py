@@ -0,0 +1,53 @@
+import os
+
+from app.services.parse_cache import ParsedModelCache
+
+
+def _age(cache: ParsedModelCache, key: str, mtime: float) -> None:
+    os.utime(cache._path(key), (mtime, mtime))
+
+
+def test_memory_tier_hits_and_evicts_by_size(tmp_path):
+    cache = ParsedModelCache(str(tmp_path), max_bytes=250, disk_max_bytes=10_000, version="t")
+    assert cache.get("a") is None
+
+    cache.put("a", b"a" * 100)
+    cache.put("b", b"b" * 100)
+    assert cache.get("a") == b"a" * 100
+    # "b" — давно не читанный, его и вытесняет "c"
+    cache.put("c", b"c" * 100)
+    assert list(cache._entries) == ["a", "c"]
+
+    # С диска запись возвращается в память
+    assert cache.get("b") == b"b" * 100
+    stats = cache.stats()
+    assert (stats["hits"], stats["disk_hits"], stats["misses"]) == (1, 1, 1)
+    assert stats["evictions"] == 2 and stats["bytes"] <= 250
+
+
+def test_entry_larger_than_memory_budget_stays_on_disk(tmp_path):
+    cache = ParsedModelCache(str(tmp_path), max_bytes=50, disk_max_bytes=10_000, version="t")
+    cache.put("big", b"x" * 100)
+    assert cache.stats()["entries"] == 0
+    assert cache.get("big") == b"x" * 100
+    assert cache.stats()["disk_hits"] == 1
+
+
+def test_disk_tier_evicts_least_recently_used(tmp_path):
+    cache = ParsedModelCache(str(tmp_path), max_bytes=0, disk_max_bytes=250, version="t")
+    for i, key in enumerate("abc"):
+        cache.put(key, key.encode() * 100)
+        _age(cache, key, 1000 + i)
+    assert sorted(os.listdir(tmp_path)) == ["b-vt.json", "c-vt.json"]
+
+    # Чтение обновляет mtime: следующим вытесняется "c", а не "b"
+    assert cache.get("b") == b"b" * 100
+    cache.put("d", b"d" * 100)
+    assert sorted(os.listdir(tmp_path)) == ["b-vt.json", "d-vt.json"]
+    assert cache.stats()["disk_evictions"] == 2
+    assert cache.get("a") is None and cache.get("c") is None
+
+
+def test_version_change_invalidates_disk_entries(tmp_path):
+    ParsedModelCache(str(tmp_path), 1000, 1000, version="1").put("a", b"old")
+    assert ParsedModelCache(str(tmp_path), 1000, 1000, version="2").get("a") is None
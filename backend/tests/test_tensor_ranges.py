@@ -0,0 +1,55 @@
+import pytest
+from fastapi import HTTPException
+
+from app.api import onnx_router
+from app.api.onnx_router import _iter_chunks, _parse_range
+
+
+@pytest.mark.parametrize("header, expected", [
+    (None, None),
+    ("", None),
+    ("bytes=0-99", (0, 99)),
+    ("bytes=10-19", (10, 19)),
+    ("bytes=90-", (90, 99)),
+    # Конец за пределами файла обрезается
+    ("bytes=50-1000", (50, 99)),
+    ("bytes=99-99", (99, 99)),
+    # Суффикс: последние N байт, больше файла — весь файл
+    ("bytes=-10", (90, 99)),
+    ("bytes=-1000", (0, 99)),
+    (" bytes = 5-6", (5, 6)),
+])
+def test_parse_range(header, expected):
+    assert _parse_range(header, 100) == expected
+
+
+@pytest.mark.parametrize("header", ["bytes=100-", "bytes=150-200", "bytes=20-10", "bytes=-0"])
+def test_unsatisfiable_range_reports_the_size(header):
+    with pytest.raises(HTTPException) as error:
+        _parse_range(header, 100)
+    assert error.value.status_code == 416
+    assert error.value.headers == {"Content-Range": "bytes */100"}
+
+
+@pytest.mark.parametrize("header", ["items=0-1", "bytes=0-1,5-6", "bytes=a-b", "bytes=-", "bytes=1-x"])
+def test_malformed_range(header):
+    with pytest.raises(HTTPException) as error:
+        _parse_range(header, 100)
+    assert error.value.status_code == 416
+
+
+def test_empty_tensor_has_no_satisfiable_range():
+    with pytest.raises(HTTPException) as error:
+        _parse_range("bytes=0-", 0)
+    assert error.value.status_code == 416
+
+
+def test_iter_chunks_spans_header_and_body(monkeypatch):
+    monkeypatch.setattr(onnx_router, "STREAM_CHUNK_SIZE", 4)
+    header, body = b"HEADER", bytes(range(20))
+    parts = [memoryview(header), memoryview(body)]
+    data = header + body
+    for start, stop in ((0, len(data)), (2, 6), (6, 26), (3, 11), (10, 12), (5, 5)):
+        chunks = list(_iter_chunks(parts, start, stop))
+        assert b"".join(chunks) == data[start:stop]
+        assert all(0 < len(chunk) <= 4 for chunk in chunks)
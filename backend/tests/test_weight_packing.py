@@ -0,0 +1,128 @@
+import os
+import signal
+import time
+
+import numpy as np
+import pytest
+
+from app.services import weight_packing
+from app.services.weight_packing import pack_layer, pack_tiles, tile_bytes
+
+
+@pytest.fixture
+def worker_pool():
+    yield
+    weight_packing.shutdown()
+
+
+def _layer(groups: int = 2, k: int = 300, n: int = 130) -> np.ndarray:
+    # Размеры не кратны тайлу: проверяется и дополнение нулями на краях
+    return np.random.default_rng(0).normal(size=(groups, k, n)).astype(np.float32)
+
+
+def test_pack_tiles_layout_and_quantization():
+    matrices = _layer(groups=1, k=70, n=40)
+    packed = pack_tiles(matrices, 64, 32)
+    assert packed.shape == (2 * 2, tile_bytes(64, 32))
+
+    # Первый тайл: строки 0-63, столбцы 0-31, по столбцу свой масштаб
+    scales = packed[0, :32 * 4].view("<f4")
+    cells = packed[0, 32 * 4:].view(np.int8).reshape(64, 32)
+    np.testing.assert_allclose(scales, np.abs(matrices[0, :64, :32]).max(axis=0) / weight_packing.WEIGHT_QMAX,
+                               rtol=1e-6)
+    assert np.abs(cells).max() == weight_packing.WEIGHT_QMAX
+    np.testing.assert_allclose(cells * scales, matrices[0, :64, :32], atol=float(scales.max()) / 2 + 1e-6)
+    # Последний тайл почти целиком — дополнение нулями
+    last = packed[3, 32 * 4:].view(np.int8).reshape(64, 32)
+    assert not last[6:].any() and not last[:, 8:].any()
+
+
+def test_pack_layer_is_identical_for_any_worker_count(worker_pool):
+    matrices = _layer()
+    serial = pack_layer(matrices, 64, 64, workers=1)
+    assert np.array_equal(serial, pack_tiles(matrices, 64, 64))
+    for workers in (2, 3):
+        assert np.array_equal(pack_layer(matrices, 64, 64, workers=workers), serial)
+
+
+def test_pack_layer_recovers_from_a_broken_pool(worker_pool):
+    matrices = _layer()
+    expected = pack_layer(matrices, 64, 64, workers=2)
+    broken = weight_packing._executor
+    for pid in list(broken._processes):
+        os.kill(pid, signal.SIGKILL)
+    time.sleep(0.5)
+
+    # Текущий слой пакуется в процессе, следующий — уже новым пулом
+    assert np.array_equal(pack_layer(matrices, 64, 64, workers=2), expected)
+    assert weight_packing._executor is None
+    assert np.array_equal(pack_layer(matrices, 64, 64, workers=2), expected)
+    assert weight_packing._executor is not broken
+
+
+def _decode_block_sparse(sparse, tiles: int, rows: int, cols: int) -> np.ndarray:
+    """Rebuild packed tiles from the block-sparse layout documented in block_sparse."""
+    tile_mask, scales, bitmaps, blocks = sparse.chunks
+    block_rows, block_cols = sparse.block_shape
+    grid = (rows // block_rows, cols // block_cols)
+    stored = np.unpackbits(tile_mask, bitorder="little")[:tiles].astype(bool)
+    nonzero = np.unpackbits(bitmaps, axis=1, bitorder="little")[:, :grid[0] * grid[1]].astype(bool)
+
+    cells = np.zeros((int(stored.sum()),) + grid + (block_rows, block_cols), dtype=np.int8)
+    cells[nonzero.reshape((-1,) + grid)] = blocks.reshape(-1, block_rows, block_cols)
+    packed = np.zeros((tiles, tile_bytes(rows, cols)), dtype=np.uint8)
+    packed[stored, :cols * 4] = scales.view(np.uint8).reshape(-1, cols * 4)
+    packed[stored, cols * 4:] = cells.transpose(0, 1, 3, 2, 4).reshape(len(cells), rows * cols).view(np.uint8)
+    # Пропущенные тайлы пустые: нулевые ячейки и единичный масштаб
+    packed[~stored, :cols * 4] = np.ones(cols, dtype="<f4").view(np.uint8)
+    return packed
+
+
+def _sparse_layer() -> np.ndarray:
+    matrices = _layer(groups=2, k=128, n=128)
+    matrices[0, :64, :64] = 0  # пустой тайл
+    matrices[1, 64:, :] = 0  # два пустых тайла
+    matrices[0, 64:, 64:][np.arange(64) % 16 != 0] = 0  # в тайле ненулевые только отдельные строки
+    return matrices
+
+
+def test_block_sparse_round_trip():
+    packed = pack_tiles(_sparse_layer(), 64, 64)
+    sparse = weight_packing.block_sparse(packed, 64, 64)
+
+    assert sparse.block_shape == (8, 8)
+    assert sparse.stored.tolist() == [False, True, True, True, True, True, False, False]
+    assert sparse.blocks == 8 * 64
+    # Пустые тайлы целиком плюс блоки без ненулевых строк в разреженном тайле
+    assert sparse.zero_blocks == 3 * 64 + 4 * 8
+    assert sparse.nbytes == sum(chunk.nbytes for chunk in sparse.chunks) < packed.nbytes
+    assert np.array_equal(_decode_block_sparse(sparse, len(packed), 64, 64), packed)
+
+
+def test_block_sparse_with_odd_crossbar_shape():
+    # Сторона кроссбара не кратна 8: блоки по НОД
+    packed = pack_tiles(_layer(groups=1, k=100, n=90), 36, 30)
+    sparse = weight_packing.block_sparse(packed, 36, 30)
+    assert sparse.block_shape == (4, 2)
+    assert np.array_equal(_decode_block_sparse(sparse, len(packed), 36, 30), packed)
+
+
+def test_block_sparse_threshold_drops_small_blocks():
+    matrices = _layer(groups=1, k=64, n=64)
+    matrices[0, :8, :8] *= 0.05
+    packed = pack_tiles(matrices, 64, 64)
+
+    assert weight_packing.block_sparse(packed, 64, 64).zero_blocks == 0
+    sparse = weight_packing.block_sparse(packed, 64, 64, threshold=0.1)
+    assert sparse.zero_blocks == 1
+    expected = packed.copy()
+    expected[0, 64 * 4:].view(np.int8).reshape(64, 64)[:8, :8] = 0
+    assert np.array_equal(_decode_block_sparse(sparse, 1, 64, 64), expected)
+
+
+def test_block_sparse_of_an_empty_layer():
+    packed = pack_tiles(np.zeros((1, 130, 64), dtype=np.float32), 64, 64)
+    sparse = weight_packing.block_sparse(packed, 64, 64)
+    assert not sparse.stored.any()
+    assert sparse.zero_blocks == sparse.blocks
+    assert np.array_equal(_decode_block_sparse(sparse, len(packed), 64, 64), packed)
@@ -1,14 +1,44 @@
 // frontend/src/components/SidebarContent.tsx
 
 import React, { useState, useEffect } from 'react';
+import api from '../services/api';
+import type { OnnxWeightSlice } from '../types';
 
 interface WeightItem {
   name: string;
   shape: number[];
   dtype: string;
-  values: number[];
+  byte_size: number;
 }
 
+// Значения весов не приходят в /parse-onnx — дочитываем нужный диапазон по запросу
+const useWeightValues = (modelId: string | undefined, name: string | undefined, offset: number, limit: number) => {
+  const [values, setValues] = useState<number[]>([]);
+
+  useEffect(() => {
+    if (!modelId || !name || limit <= 0) {
+      setValues([]);
+      return;
+    }
+    let cancelled = false;
+    api
+      .get<OnnxWeightSlice>(`/onnx/${modelId}/weights/${encodeURIComponent(name)}`, { params: { offset, limit } })
+      .then(res => {
+        if (!cancelled) setValues(res.data.values);
+      })
+      .catch(() => {
+        if (!cancelled) setValues([]);
+      });
+    return () => {
+      cancelled = true;
+    };
+  }, [modelId, name, offset, limit]);
+
+  return values;
+};
+
+const elementCount = (shape: number[]) => shape.reduce((acc, dim) => acc * dim, 1);
+
 interface SidebarContentProps {
   type: 'metadata' | 'node' | 'weights';
   data: any;
@@ -22,6 +52,20 @@ const SidebarContent: React.FC<SidebarContentProps> = ({ type, data, selectedNod
     setChannelIndex(0);
   }, [selectedNode?.name]);
 
+  const nodeWeights: WeightItem[] = (selectedNode?.inputs || [])
+    .map((input: string) => {
+      const w = data?.weights?.[input];
+      if (!w) return null;
+      return { name: input, shape: w.shape, dtype: w.dtype, byte_size: w.byte_size };
+    })
+    .filter(Boolean) as WeightItem[];
+  const bias = nodeWeights.find(w => w.name.toLowerCase().includes('bias'));
+  const firstMain = nodeWeights.find(w => w !== bias);
+  // Одна строка (выходной канал/нейрон) основного веса и весь bias
+  const rowSize = firstMain ? elementCount(firstMain.shape.slice(1)) : 0;
+  const channelValues = useWeightValues(data?.model_id, firstMain?.name, channelIndex * rowSize, rowSize);
+  const biasValues = useWeightValues(data?.model_id, bias?.name, 0, bias ? elementCount(bias.shape) : 0);
+
   if (!data) return <p>Upload an ONNX model to view details.</p>;
 
   if (type === 'metadata') {
@@ -36,21 +80,15 @@ const SidebarContent: React.FC<SidebarContentProps> = ({ type, data, selectedNod
   }
 
   if (type === 'node' && selectedNode) {
-    const allNodeWeights: WeightItem[] = selectedNode.inputs
-      .map((input: string) => {
-        const w = data.weights?.[input];
-        if (!w) return null;
-        return { name: input, shape: w.shape, dtype: w.dtype, values: w.values };
-      })
-      .filter(Boolean) as WeightItem[];
-
-    const biasWeight = allNodeWeights.find(w => w.name.toLowerCase().includes('bias'));
-    const mainWeights = biasWeight ? allNodeWeights.filter(w => w !== biasWeight) : allNodeWeights;
+    const allNodeWeights = nodeWeights;
+    const biasWeight = bias;
+    const mainWeights = firstMain ? [firstMain] : [];
 
-    const getMatrix = (weight: WeightItem, index: number): number[][] => {
+    // values — уже вырезанная строка для выбранного канала
+    const getMatrix = (weight: WeightItem, values: number[]): number[][] => {
       const shape = weight.shape;
-      const values = weight.values;
       const matrix: number[][] = [];
+      if (values.length < elementCount(shape.slice(1))) return matrix;
 
       if (shape.length === 4) {
         const [outC, inC, H, W] = shape;
@@ -59,7 +97,7 @@ const SidebarContent: React.FC<SidebarContentProps> = ({ type, data, selectedNod
           const row: number[] = [];
           for (let h = 0; h < H; h++) {
             for (let w = 0; w < W; w++) {
-              const idx = index * inC * kernelSize + i * kernelSize + h * W + w;
+              const idx = i * kernelSize + h * W + w;
               row.push(values[idx]);
             }
           }
@@ -69,7 +107,7 @@ const SidebarContent: React.FC<SidebarContentProps> = ({ type, data, selectedNod
         const [outF, inF] = shape;
         const row: number[] = [];
         for (let i = 0; i < inF; i++) {
-          row.push(values[index * inF + i]);
+          row.push(values[i]);
         }
         matrix.push(row);
       }
@@ -77,8 +115,8 @@ const SidebarContent: React.FC<SidebarContentProps> = ({ type, data, selectedNod
       return matrix;
     };
 
-    const getBiasColumn = (weight: WeightItem): number[] => {
-      return weight.values;
+    const getBiasColumn = (): number[] => {
+      return biasValues;
     };
 
     return (
@@ -102,7 +140,7 @@ const SidebarContent: React.FC<SidebarContentProps> = ({ type, data, selectedNod
           if (!isConv && !isFC) return null;
 
           const outDim = isConv ? shape[0] : shape[0];
-          const matrix = getMatrix(weight, channelIndex);
+          const matrix = getMatrix(weight, channelValues);
 
           return (
             <div
@@ -122,7 +160,7 @@ const SidebarContent: React.FC<SidebarContentProps> = ({ type, data, selectedNod
               <div style={{ color: '#555', fontSize: 11, marginBottom: 12 }}>
                 <strong>Shape:</strong> {shape.join(' × ')} | <strong>DType:</strong> {weight.dtype}
                 <span style={{ marginLeft: 12, color: '#777' }}>
-                  ({weight.values.length.toLocaleString()} values)
+                  ({elementCount(shape).toLocaleString()} values, {weight.byte_size.toLocaleString()} bytes)
                 </span>
               </div>
 
@@ -217,7 +255,7 @@ const SidebarContent: React.FC<SidebarContentProps> = ({ type, data, selectedNod
                   paddingBottom: '10px', // Дополнительный отступ внутри скролла
                 }}
               >
-                {getBiasColumn(biasWeight).map((val, i) => (
+                {getBiasColumn().map((val, i) => (
                   <div
                     key={i}
                     style={{
@@ -94,15 +94,26 @@ const Compiler: React.FC = () => {
     formData.append('quant_type', quantType);
 
     try {
-      const res = await api.post('/compiler/quantize', formData, {
+      const submitted = await api.post('/compiler/quantize', formData, {
         headers: { 'Content-Type': 'multipart/form-data' },
       });
 
-      setQuantizedPath(res.data.quantized_path);
-      message.success(`Quantization complete! Size reduction: ${res.data.size_reduction}`);
+      // Квантизация идёт в фоне на сервере — опрашиваем статус задачи
+      const jobId = submitted.data.job_id;
+      let job = submitted.data;
+      while (job.status === 'queued' || job.status === 'running') {
+        await new Promise(resolve => setTimeout(resolve, 1000));
+        job = (await api.get(`/compiler/quantize/jobs/${jobId}`)).data;
+      }
+
+      if (job.status !== 'completed') {
+        throw new Error(job.error || `Quantization ${job.status}`);
+      }
+      setQuantizedPath(job.quantized_path);
+      message.success(`Quantization complete! Size reduction: ${job.size_reduction}`);
     } catch (error: any) {
       console.error('Quantize error details:', error.response?.data);
-      message.error(error.response?.data?.detail || 'Quantization failed');
+      message.error(error.response?.data?.detail || error.message || 'Quantization failed');
     } finally {
       setQuantizing(false);
     }
@@ -116,12 +127,14 @@ const Compiler: React.FC = () => {
 
     setCompiling(true);
     try {
-      const res = await api.post('/compiler/compile', { device_id: selectedDevice });
+      const res = await api.post('/compiler/compile', null, {
+        params: { device_id: selectedDevice, model_id: onnxData?.model_id },
+      });
       message.success(`Firmware compiled: ${res.data.firmware_path}`);
       unlockStep('inference');
     } catch (err: any) {
       console.error('Compile error:', err);
-      message.error('Compilation failed');
+      message.error(err.response?.data?.detail?.message || err.response?.data?.detail || 'Compilation failed');
     } finally {
       setCompiling(false);
     }
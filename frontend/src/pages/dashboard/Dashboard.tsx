@@ -252,7 +252,7 @@ const Dashboard: React.FC = () => {
               </Card>
 
               {/* Hardware Configuration (только ключевые параметры) */}
-              {(selectedDeviceInfo.cores || selectedDeviceInfo.memristors) && (
+              {selectedDeviceInfo.cores && (
                 <Card title="Hardware Configuration" className="property-card">
                   <Descriptions column={1} className="property-descriptions">
                     <Descriptions.Item label="Cores">
@@ -262,9 +262,7 @@ const Dashboard: React.FC = () => {
                     </Descriptions.Item>
                     <Descriptions.Item label="Memristors per Core">
                       <Tag color="purple">
-                        {selectedDeviceInfo.memristors && selectedDeviceInfo.cores
-                          ? Math.floor(selectedDeviceInfo.memristors.length / selectedDeviceInfo.cores.length)
-                          : 'N/A'}
+                        {selectedDeviceInfo.memristors_per_core ?? 'N/A'}
                       </Tag>
                     </Descriptions.Item>
                   </Descriptions>
@@ -4,6 +4,7 @@ import { Card, Button, Progress, Alert, Spin, message } from 'antd';
 import { CheckCircleOutlined } from '@ant-design/icons';
 import { useWorkflow } from '../../context/WorkflowContext';
 import api from '../../services/api';
+import { streamEvents } from '../../services/sse';
 import './Diagnostics.css';
 
 const Diagnostics: React.FC = () => {
@@ -15,17 +16,43 @@ const Diagnostics: React.FC = () => {
     setRunning(true);
     setProgress(0);
 
-    const interval = setInterval(() => {
-      setProgress(prev => Math.min(prev + 10, 90));
-    }, 300);
-
     try {
-      await api.post('/diagnostics', { device_id: selectedDevice });
+      let jobId: string;
+      try {
+        const res = await api.post<{ job_id: string }>('/diagnostics', { device_id: selectedDevice });
+        jobId = res.data.job_id;
+      } catch (err: any) {
+        // Диагностика этого устройства уже идёт — подключаемся к ней
+        const busyJob = err?.response?.status === 409 ? err.response.data?.detail?.job_id : undefined;
+        if (!busyJob) throw err;
+        jobId = busyJob;
+      }
+
+      let finalStatus = '';
+      let overall = '';
+      let error = '';
+      await streamEvents(`/diagnostics/jobs/${jobId}/events`, ({ event, data }) => {
+        if (event === 'core' || event === 'snapshot') {
+          setProgress(Math.round((data.progress || 0) * 100));
+        }
+        if ((event === 'status' || event === 'snapshot') && !['queued', 'running'].includes(data.status)) {
+          finalStatus = data.status;
+          overall = data.result?.overall_status || '';
+          error = data.error || '';
+        }
+      });
 
-      clearInterval(interval);
-      setProgress(100);
-      unlockStep('compiler');
-      message.success('Diagnostics completed successfully!');
+      if (finalStatus === 'completed' && overall === 'passed') {
+        setProgress(100);
+        unlockStep('compiler');
+        message.success('Diagnostics completed successfully!');
+      } else if (finalStatus === 'completed') {
+        setProgress(0);
+        message.error('Diagnostics found faulty cores');
+      } else {
+        setProgress(0);
+        message.error(`Diagnostics ${finalStatus || 'interrupted'}${error ? `: ${error}` : ''}`);
+      }
     } catch (err) {
       message.error('Diagnostics failed');
     } finally {
@@ -0,0 +1,46 @@
+import api from './api';
+
+export interface ServerEvent {
+  event: string;
+  data: any;
+}
+
+// EventSource не умеет передавать заголовок Authorization, поэтому SSE читаем через fetch
+export async function streamEvents(
+  path: string,
+  onEvent: (event: ServerEvent) => void,
+  signal?: AbortSignal
+): Promise<void> {
+  const token = localStorage.getItem('access_token');
+  const response = await fetch(`${api.defaults.baseURL}${path}`, {
+    headers: token ? { Authorization: `Bearer ${token}` } : {},
+    signal,
+  });
+  if (!response.ok || !response.body) {
+    throw new Error(`Event stream failed: ${response.status}`);
+  }
+
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+  for (;;) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+
+    let boundary = buffer.indexOf('\n\n');
+    while (boundary !== -1) {
+      const block = buffer.slice(0, boundary);
+      buffer = buffer.slice(boundary + 2);
+      boundary = buffer.indexOf('\n\n');
+
+      let event = 'message';
+      const data: string[] = [];
+      for (const line of block.split('\n')) {
+        if (line.startsWith('event:')) event = line.slice(6).trim();
+        else if (line.startsWith('data:')) data.push(line.slice(5).trim());
+      }
+      if (data.length) onEvent({ event, data: JSON.parse(data.join('\n')) });
+    }
+  }
+}
@@ -16,6 +16,12 @@ export interface TokenResponse {
 export interface DeviceCore {
   id: number;
   status: string;
+  // Агрегаты ядра (details без memristors=full)
+  memristor_count?: number;
+  crossbar?: { rows: number; cols: number };
+  counts?: Record<string, number>;
+  healthy_ratio?: number;
+  conductance_histogram?: { counts: number[]; bin_edges: number[] } | null;
 }
 
 export interface DeviceMemristor {
@@ -29,8 +35,10 @@ export interface Device {
   version: string;
   is_mock: boolean;
   diagnostics?: DeviceDiagnostics;
-  memristors?: Memristor[];
+  memristors?: Memristor[] | null;
   cores?: Core[];
+  memristors_per_core?: number;
+  memristor_statuses?: string[];
 
   // Hardware specs (optional for backward compatibility)
   clock_frequency?: number;
@@ -79,13 +87,37 @@ export interface OnnxEdge {
   label: string;
 }
 
+export interface OnnxWeightStats {
+  min: number;
+  max: number;
+  mean: number;
+  std: number;
+  sparsity: number;
+  histogram: {
+    counts: number[];
+    bin_edges: number[];
+  };
+}
+
 export interface OnnxWeight {
   shape: number[];
   dtype: string;
+  byte_size: number;
+  stats: OnnxWeightStats | null;
+}
+
+export interface OnnxWeightSlice {
+  name: string;
+  shape: number[];
+  dtype: string;
+  total: number;
+  offset: number;
+  limit: number;
   values: number[];
 }
 
 export interface OnnxData {
+  model_id?: string;
   nodes: OnnxNode[];
   edges: OnnxEdge[];
   weights: Record<string, OnnxWeight>;
@@ -101,7 +133,7 @@ export interface WeightItem {
   name: string;
   shape: number[];
   dtype: string;
-  values: number[];
+  byte_size: number;
 }
 
 // ===== API ОТВЕТЫ =====